@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+"""
+The modules of vfood import each other by name (python vfood ...), so vfood/ is
+put in the path. The caches, the metrics and the archive are written to a
+temporary directory instead of the working directory.
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "vfood"))
+
+os.environ.setdefault("VFOOD_CACHE_DIR", tempfile.mkdtemp(prefix="vfood-tests-"))
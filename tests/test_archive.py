@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import os
+from datetime import date
+
+import pandas as pd
+import pyarrow.dataset as ds
+import pytest
+
+from archive import read_archive
+from data import page_frame
+from pipeline import ArchiveSink
+
+DAYS = [date(2023, 1, 16), date(2023, 1, 17)]
+
+
+def scraped(day: date, store_name: str, products: list, search_term: str = "huevo") -> pd.DataFrame:
+    """A scraped page, products is a list of name and price"""
+    data = page_frame([[name, price, True] for name, price in products], store_name, search_term)
+    data["date"] = pd.Timestamp(day)
+    data["product_price_dollar"] = [float(price.split()[-1]) for _, price in products]
+    return data
+
+
+def archive_day(path: str, *pages):
+    with ArchiveSink(str(path)) as sink:
+        for page in pages:
+            sink.write(page)
+
+
+@pytest.fixture
+def archive(tmp_path):
+    path = tmp_path / "archive"
+    for day in DAYS:
+        archive_day(
+            path,
+            scraped(day, "Gama", [("Huevos 30", "$ 5.10"), ("Huevos 12", "$ 2.30")]),
+            scraped(day, "Central Madeirense", [("Huevos Rojos", "$ 4.90")]),
+            scraped(day, "Gama", [("Arroz Mary", "$ 1.20")], search_term="arroz"),
+        )
+    return str(path)
+
+
+def test_the_archive_is_partitioned_by_date_and_store(archive):
+    partitions = sorted(
+        os.path.relpath(directory, archive)
+        for directory, _, files in os.walk(archive)
+        if files
+    )
+
+    assert partitions == [
+        os.path.join(f"date={day.isoformat()}", f"store={store}")
+        for day in DAYS
+        for store in ("Central%20Madeirense", "Gama")
+    ]
+
+
+def test_the_archive_is_read_with_its_schema(archive):
+    prices = read_archive(archive)
+
+    assert prices.shape[0] == 8
+    assert set(prices["store"]) == {"Gama", "Central Madeirense"}
+    assert prices["search_term"].dtype == "category"
+    assert set(prices["currency"]) == {"$"}
+
+
+def test_running_a_day_again_replaces_its_partitions(archive):
+    archive_day(archive, scraped(DAYS[1], "Gama", [("Huevos 30", "$ 5.50")]))
+    archive_day(archive, scraped(DAYS[1], "Central Madeirense", [("Huevos Rojos", "$ 5.00")]))
+
+    second_day = read_archive(archive, start=DAYS[1]).sort_values("store")
+
+    assert second_day["product_price_dollar"].tolist() == [5.0, 5.5]
+    assert read_archive(archive, end=DAYS[0]).shape[0] == 4  # The other day is kept
+
+
+def test_the_filters_are_pushed_down_to_the_partitions(archive):
+    # A broken file in the partitions that the filters exclude is never opened
+    broken = os.path.join(archive, f"date={DAYS[0].isoformat()}", "store=Central%20Madeirense", "broken.parquet")
+    with open(broken, "wb") as broken_file:
+        broken_file.write(b"not parquet")
+    with pytest.raises(Exception):
+        read_archive(archive)
+
+    prices = read_archive(archive, start="2023-01-17", stores=["Gama"], search_terms=["huevo"])
+    assert sorted(prices["product_name"]) == ["Huevos 12", "Huevos 30"]
+    assert set(prices["date"]) == {DAYS[1]}
+
+    cheap = read_archive(
+        archive, columns=["product_name"], stores=["Gama"], filter=ds.field("product_price_dollar") < 2
+    )
+    assert cheap["product_name"].tolist() == ["Arroz Mary", "Arroz Mary"]
+
+
+def test_a_missing_archive_is_empty(tmp_path):
+    assert read_archive(str(tmp_path / "archive")).empty
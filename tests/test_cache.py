@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+import math
+import os
+import time
+from datetime import datetime
+
+import pytest
+
+import data
+from cache import ExchangeRateProvider, HTTPCache, ParsedCache
+from test_central_m import STORE, page_url, result_page
+
+RATE = {"date": datetime(2023, 2, 1, 9), "exchange_rate": 24.5, "exchange": "Bs./$", "source": "BCV"}
+
+
+class Source:
+    """A source that returns the rate, or raises once broken"""
+
+    def __init__(self):
+        self.error = None
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return dict(RATE)
+
+
+@pytest.fixture
+def source():
+    return Source()
+
+
+@pytest.fixture
+def provider(source, tmp_path):
+    provider = ExchangeRateProvider(source, "test_rate", ttl=0)
+    provider.path = str(tmp_path / "test_rate.json")
+    return provider
+
+
+def test_rate_is_cached_for_ttl(source, provider):
+    provider.ttl = 3600
+    assert provider.get() == RATE
+    assert provider.get() == RATE
+    assert source.calls == 1
+
+
+def test_source_that_raises_gives_a_nan_rate(source, provider):
+    source.error = IndexError("list index out of range")
+
+    rate = provider.get()
+
+    assert math.isnan(rate["exchange_rate"])
+    assert rate["source"] == "test_rate"
+
+
+def test_source_that_raises_falls_back_to_the_last_good_rate(source, provider):
+    assert provider.get() == RATE
+    source.error = IndexError("list index out of range")
+
+    assert provider.get(fallback=True) == RATE
+    assert math.isnan(provider.get(fallback=False)["exchange_rate"])
+    assert source.calls == 3
+
+
+def test_http_cache_prunes_the_old_pages(tmp_path):
+    http_cache = HTTPCache()
+    http_cache.directory = str(tmp_path / "http")
+    http_cache.put("https://old.com/a", b"old")
+    http_cache.put("https://new.com/b", b"new")
+    old_time = time.time() - 40 * 86400
+    for extension in ("json", "body"):
+        os.utime(http_cache._path("https://old.com/a", extension), (old_time, old_time))
+
+    assert http_cache.prune(max_days=0) == 0
+    assert http_cache.prune(max_days=30) == 1
+    assert http_cache.get("https://old.com/a") is None
+    assert not os.path.exists(http_cache._path("https://old.com/a", "body"))
+    assert http_cache.get("https://new.com/b")["body"] == b"new"
+
+
+def test_parsed_cache_prunes_the_pages_not_reused(tmp_path):
+    parsed_cache = ParsedCache()
+    parsed_cache.directory = str(tmp_path / "parsed")
+    old_time = time.time() - 40 * 86400
+    for key in ("aa01", "bb02"):
+        parsed_cache.put(key, {"products": [], "links": []})
+        os.utime(parsed_cache._path(key), (old_time, old_time))
+
+    assert parsed_cache.get("bb02") is not None  # Reused, so it is kept
+    assert parsed_cache.prune(max_days=30) == 1
+    assert parsed_cache.get("aa01") is None
+    assert parsed_cache.get("bb02") is not None
+
+
+@pytest.fixture
+def parses(monkeypatch, tmp_path):
+    """An empty parsed cache, and the count of the pages parsed"""
+    parsed_cache = ParsedCache()
+    parsed_cache.directory = str(tmp_path / "parsed")
+    monkeypatch.setattr(data, "PARSED_CACHE", parsed_cache)
+    monkeypatch.setattr(data, "PARSED_CACHE_ENABLED", True)
+    calls = []
+    parse_html = data.parse_html
+    monkeypatch.setattr(data, "parse_html", lambda *args, **kwargs: calls.append(1) or parse_html(*args, **kwargs))
+    return calls
+
+
+def test_an_unchanged_page_is_not_parsed_again(parses):
+    first = data.parse_store_page(result_page(1), page_url(1), STORE)
+    again = data.parse_store_page(result_page(1), page_url(1), STORE)
+
+    assert len(parses) == 1
+    assert again == first
+    assert len(first[0]) == 4 and len(first[1]) == 2
+
+
+def test_a_changed_page_is_parsed_again(parses):
+    data.parse_store_page(result_page(1), page_url(1), STORE)
+    changed = data.parse_store_page(result_page(1).replace(b"#10,50", b"#11,50"), page_url(1), STORE)
+    data.parse_store_page(result_page(1), page_url(1), dict(STORE, product_name="div.description a"))  # Other rules
+
+    assert len(parses) == 3
+    assert changed[0][0][1] == "#11,50"
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+The search of Central Madeirense (numbered pagination) downloads and parses every
+result page once, served from pages recorded like the ones of the store.
+"""
+
+from collections import Counter
+
+import pytest
+
+import data
+from stores import load_stores
+
+STORE = load_stores(names=["Central Madeirense"])["Central Madeirense"]
+SEARCH_URL = STORE["search_url"].replace("{product}", "huevo")
+BASE_URL = SEARCH_URL.split("?")[0]
+QUERY = SEARCH_URL.split("?")[1]
+NUM_PAGES = 3
+
+
+def page_url(page: int) -> str:
+    """The url the store uses for a result page"""
+    if page == 1:
+        return SEARCH_URL
+    return f"{BASE_URL}page/{page}/?{QUERY}"
+
+
+def result_page(page: int) -> bytes:
+    """A result page of the search, with 4 products and the pagination of the store"""
+    products = "".join(
+        f"""
+        <div class="product-inner">
+          <div class="description"><a href="#">Huevo {page}-{item} x30</a></div>
+          <span class="price"><span class="amount">#{page}{item},50</span></span>
+        </div>"""
+        for item in range(4)
+    )
+    links = "".join(
+        f'<a class="page-numbers" href="{page_url(number)}">{number}</a>'
+        if number != page
+        else f'<span aria-current="page" class="page-numbers current">{number}</span>'
+        for number in range(1, NUM_PAGES + 1)
+    )
+    next_link = (
+        f'<a class="next page-numbers" href="{page_url(page + 1)}">&rarr;</a>'
+        if page < NUM_PAGES
+        else ""
+    )
+    return f"""<html><body>
+      <div class="products">{products}</div>
+      <nav class="woocommerce-pagination"><ul>{links}{next_link}</ul></nav>
+    </body></html>""".encode()
+
+
+PAGES = {page_url(page): result_page(page) for page in range(1, NUM_PAGES + 1)}
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    """Serve the recorded pages instead of the store, and count the fetches of every url"""
+    counter = Counter()
+
+    def fetch_html(url, *args, **kwargs):
+        counter[url] += 1
+        return PAGES[url]
+
+    monkeypatch.setattr(data, "fetch_html", fetch_html)
+    monkeypatch.setattr(data, "PARSED_CACHE_ENABLED", False)
+    return counter
+
+
+def test_every_result_page_is_fetched_once(fetches):
+    data.central_m_product_search("huevo")
+
+    assert fetches == Counter({url: 1 for url in PAGES})
+
+
+def test_no_product_is_duplicated(fetches):
+    products = data.central_m_product_search("huevo")
+
+    assert products.shape[0] == 4 * NUM_PAGES
+    assert not products["product_name"].duplicated().any()
+    assert products["product_price"].iat[0] == "$ 10.50"
+    assert set(products["store"]) == {"Central Madeirense"}
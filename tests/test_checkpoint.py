@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+A run that dies partway is resumed from its journal: the pages already scraped
+are not fetched again. The pages are the recorded Central Madeirense ones.
+"""
+
+from collections import Counter
+
+import pandas as pd
+import pytest
+
+import data
+from checkpoint import RunJournal
+from test_central_m import NUM_PAGES, PAGES, STORE, page_url
+
+
+@pytest.fixture
+def store_pages(monkeypatch):
+    """Serve the recorded pages, dying (as a killed run) on the urls of interrupt_at"""
+    fetches = Counter()
+    interrupt_at = set()
+
+    def fetch_html(url, *args, **kwargs):
+        if url in interrupt_at:
+            raise KeyboardInterrupt
+        fetches[url] += 1
+        return PAGES[url]
+
+    monkeypatch.setattr(data, "fetch_html", fetch_html)
+    monkeypatch.setattr(data, "PARSED_CACHE_ENABLED", False)
+    return fetches, interrupt_at
+
+
+def scrape(journal) -> pd.DataFrame:
+    return pd.concat(data.iter_store_pages(STORE, "huevo", journal))
+
+
+def test_a_resumed_run_skips_the_pages_journaled(store_pages, tmp_path):
+    fetches, interrupt_at = store_pages
+    path = str(tmp_path / "run.jsonl")
+    interrupt_at.add(page_url(NUM_PAGES))
+    with pytest.raises(KeyboardInterrupt):
+        scrape(RunJournal(path))
+    assert len(RunJournal(path, resume=True)) == NUM_PAGES - 1
+
+    interrupt_at.clear()
+    fetches.clear()
+    products = scrape(RunJournal(path, resume=True))
+
+    assert fetches == Counter({page_url(NUM_PAGES): 1})
+    assert products.shape[0] == 4 * NUM_PAGES
+    assert not products["product_name"].duplicated().any()
+
+
+def test_a_new_run_starts_the_journal_again(store_pages, tmp_path):
+    fetches, _ = store_pages
+    path = str(tmp_path / "run.jsonl")
+    scrape(RunJournal(path))
+
+    fetches.clear()
+    scrape(RunJournal(path))
+
+    assert fetches == Counter({url: 1 for url in PAGES})
+
+
+def test_a_torn_last_line_is_ignored(store_pages, tmp_path):
+    fetches, _ = store_pages
+    path = str(tmp_path / "run.jsonl")
+    scrape(RunJournal(path))
+    with open(path, "r", encoding="utf-8") as journal_file:
+        lines = journal_file.readlines()
+    with open(path, "w", encoding="utf-8") as journal_file:  # The run died writing the last page
+        journal_file.writelines(lines[:-1])
+        journal_file.write(lines[-1][: len(lines[-1]) // 2])
+
+    journal = RunJournal(path, resume=True)
+    fetches.clear()
+    scrape(journal)
+
+    assert len(journal) == NUM_PAGES
+    assert fetches == Counter({page_url(NUM_PAGES): 1})
+    assert len(RunJournal(path, resume=True)) == NUM_PAGES  # The page recorded again is kept
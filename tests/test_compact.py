@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import warnings
+
+import pandas as pd
+import pytest
+
+from data import SCRAPED_DTYPES, compact_frame, convert_prices_dollar, page_frame
+from pipeline import CSVSink, ParquetSink
+
+PRODUCTS = [
+    ["PASTA EDUARDO AL HUEVO LAZO N2 250G", "Bs. 29.88", True],
+    ["HUEVOS BLANCOS 30 UND", "$ 5.10", False],
+    ["HUEVOS ROJOS 12 UND", None, None],
+]
+
+
+def scraped() -> pd.DataFrame:
+    data = page_frame(PRODUCTS, "Plazas", "huevo")
+    data["product_price_dollar"] = convert_prices_dollar(data["product_price"], 19.4)
+    return compact_frame(data)
+
+
+def assert_compact(data: pd.DataFrame):
+    for column, dtype in SCRAPED_DTYPES.items():
+        assert data[column].dtype == dtype, column
+    assert pd.api.types.is_datetime64_any_dtype(data["date"])
+
+
+def test_the_scraped_frame_has_the_compact_schema():
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")  # No deprecation of the astype arguments
+        data = scraped()
+
+    assert_compact(data)
+    assert data["store"].cat.categories.tolist() == ["Plazas"]
+    assert data["product_availability"].tolist() == [True, False, pd.NA]
+    assert data["product_price_dollar"].tolist()[:2] == pytest.approx([1.54, 5.1], abs=1e-6)
+
+
+def test_the_schema_survives_a_csv_round_trip(tmp_path):
+    data = scraped()
+    with CSVSink(str(tmp_path / "test_data.csv")) as sink:
+        sink.write(data)
+
+    read = compact_frame(pd.read_csv(tmp_path / "test_data.csv", index_col=0))
+
+    assert_compact(read)
+    pd.testing.assert_frame_equal(read, data, check_categorical=False, check_dtype=False, atol=1e-2)
+    assert read["date"].tolist() == data["date"].tolist()
+
+
+def test_the_schema_survives_a_parquet_round_trip(tmp_path):
+    data = scraped()
+    with ParquetSink(str(tmp_path / "test_data.parquet")) as sink:
+        sink.write(data)
+
+    read = pd.read_parquet(tmp_path / "test_data.parquet")
+
+    assert_compact(read)
+    # The resolution of the dates may change, the compact dtypes are checked above
+    pd.testing.assert_frame_equal(read, data.reset_index(drop=True), check_dtype=False)
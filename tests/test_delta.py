@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from delta import DELTA_TABLE, RUNS_TABLE, latest_prices, read_snapshot
+from loader import get_engine
+from migrations import food_product_id
+from pipeline import DeltaSink
+
+DAYS = [datetime(2023, 2, day) for day in (1, 2, 3)]
+
+
+def food_rows(day, products: dict) -> pd.DataFrame:
+    """Rows of the food table of Gama, products is name: price"""
+    return pd.DataFrame(
+        {
+            "name": list(products),
+            "price_label": [f"{price:.2f}" for price in products.values()],
+            "availability": True,
+            "date_scrapt": pd.Timestamp(day),
+            "store_name": "Gama",
+            "search_term": "arroz",
+            "price_dollar": list(products.values()),
+            "product_id": [f"p-{name}" for name in products],
+        }
+    )
+
+
+def run_day(engine, *batches) -> dict:
+    """Write every batch as its own chunk"""
+    with DeltaSink(engine, chunk_rows=1) as sink:
+        for batch in batches:
+            sink.write(batch)
+    return sink.changes
+
+
+def read_delta(engine) -> pd.DataFrame:
+    delta = pd.read_sql(f"SELECT * FROM {DELTA_TABLE} ORDER BY date_scrapt, name", engine)
+    delta["date_scrapt"] = pd.to_datetime(delta["date_scrapt"])
+    return delta
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return get_engine(f"sqlite:///{tmp_path / 'vfood.db'}")
+
+
+@pytest.fixture
+def three_days(engine):
+    run_day(engine, food_rows(DAYS[0], {"A": 1.0, "B": 2.0}))
+    run_day(engine, food_rows(DAYS[1], {"A": 1.5, "B": 2.0}), food_rows(DAYS[1], {"C": 3.0, "A": 1.5}))
+    run_day(engine, food_rows(DAYS[2], {"A": 1.5, "C": 3.0}))
+    return engine
+
+
+def test_only_the_changes_are_loaded(three_days):
+    delta = read_delta(three_days)
+
+    assert list(zip(delta["date_scrapt"].dt.day, delta["name"], delta["change"])) == [
+        (1, "A", "new"),
+        (1, "B", "new"),
+        (2, "A", "changed"),
+        (2, "C", "new"),
+        (3, "B", "vanished"),
+    ]
+    runs = pd.read_sql(f"SELECT * FROM {RUNS_TABLE} ORDER BY date_scrapt", three_days)
+    assert runs["products"].tolist() == [2, 3, 2]
+    assert runs["changes"].tolist() == [2, 2, 1]
+
+
+def test_a_product_found_twice_is_written_once(engine):
+    changes = run_day(engine, food_rows(DAYS[0], {"A": 1.0, "B": 2.0}), food_rows(DAYS[0], {"A": 1.0}))
+
+    assert changes == {"Gama": 2}
+    assert read_delta(engine)["name"].tolist() == ["A", "B"]
+
+
+def test_running_a_day_again_replaces_its_rows(three_days):
+    before = read_delta(three_days)
+
+    run_day(three_days, food_rows(DAYS[1], {"A": 1.5, "B": 2.0, "C": 3.0}))
+
+    pd.testing.assert_frame_equal(read_delta(three_days), before)
+
+
+def test_latest_prices_is_the_last_row_before_the_day(three_days):
+    latest = latest_prices(three_days, ["Gama"], DAYS[2]).sort_values("name")
+
+    assert latest["name"].tolist() == ["A", "B", "C"]
+    assert latest["price_dollar"].tolist() == [1.5, 2.0, 3.0]
+
+
+def test_snapshot_rebuilds_every_day(three_days):
+    snapshots = {
+        day.day: read_snapshot(three_days, day).sort_values("name").reset_index(drop=True)
+        for day in DAYS
+    }
+
+    assert snapshots[1]["name"].tolist() == ["A", "B"]
+    assert snapshots[2]["price_dollar"].tolist() == [1.5, 2.0, 3.0]
+    assert snapshots[3]["name"].tolist() == ["A", "C"]
+    assert snapshots[3]["product_id"].tolist() == ["p-A", "p-C"]
+    assert (snapshots[3]["date_scrapt"] == pd.Timestamp(DAYS[2])).all()
+
+
+def test_migration_recreates_the_snapshot_with_product_id(engine):
+    run_day(engine, food_rows(DAYS[0], {"A": 1.0}).drop(columns="product_id"))
+    assert "product_id" not in read_snapshot(engine, DAYS[0]).columns
+
+    assert food_product_id(engine) == 1
+    run_day(engine, food_rows(DAYS[1], {"A": 2.0}))
+
+    assert read_snapshot(engine, DAYS[1])["product_id"].tolist() == ["p-A"]
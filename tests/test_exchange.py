@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import json
+import math
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from exchange import ExchangeSource, FileSource, StaticSource, aggregate_rates, fetch_rates
+
+VFOOD = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "vfood")
+
+
+class FailingSource(ExchangeSource):
+    def fetch(self):
+        raise ConnectionError("the page is down")
+
+
+class HangingSource(ExchangeSource):
+    """A source that never answers until released"""
+
+    def __init__(self, name="hanging", timeout=None):
+        super().__init__(name, timeout)
+        self.release = threading.Event()
+
+    def fetch(self):
+        self.release.wait()
+        return StaticSource(1.0, self.name).fetch()
+
+
+def test_rates_are_returned_in_the_order_of_the_sources_and_handed_over_as_they_arrive():
+    sources = [StaticSource(24.0, "slow", delay=0.3), StaticSource(25.0, "fast")]
+    arrived = []
+
+    rates = fetch_rates(sources, on_result=lambda rate: arrived.append(rate["source"]))
+
+    assert [rate["source"] for rate in rates] == ["slow", "fast"]
+    assert [rate["exchange_rate"] for rate in rates] == [24.0, 25.0]
+    assert arrived == ["fast", "slow"]
+
+
+def test_a_failing_source_gets_a_nan_rate():
+    rates = fetch_rates([FailingSource("BCV"), StaticSource(25.0)])
+
+    assert rates[0]["source"] == "BCV" and math.isnan(rates[0]["exchange_rate"])
+    assert rates[1]["exchange_rate"] == 25.0
+
+
+def test_every_source_has_its_own_deadline():
+    hanging = HangingSource(timeout=0.3)
+    sources = [hanging, StaticSource(24.0, "slow", delay=0.5, timeout=2), StaticSource(25.0)]
+    arrived = []
+
+    start = time.monotonic()
+    rates = fetch_rates(sources, on_result=lambda rate: arrived.append(rate["source"]))
+    seconds = time.monotonic() - start
+    hanging.release.set()
+
+    assert math.isnan(rates[0]["exchange_rate"])
+    assert [rate["exchange_rate"] for rate in rates[1:]] == [24.0, 25.0]
+    assert arrived == ["static", "slow"]  # The hanging one is never handed over
+    assert 0.5 <= seconds < 1.5
+
+
+def test_a_hanging_source_does_not_keep_the_process_alive():
+    script = (
+        f"import sys, threading; sys.path.insert(0, {VFOOD!r})\n"
+        "from exchange import ExchangeSource, fetch_rates\n"
+        "class Hanging(ExchangeSource):\n"
+        "    def fetch(self):\n"
+        "        threading.Event().wait()\n"
+        "print(fetch_rates([Hanging('hanging', timeout=0.2)])[0]['source'])\n"
+    )
+
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, timeout=10)
+
+    assert result.stdout.splitlines()[-1] == "hanging"
+
+
+def test_a_file_source(tmp_path):
+    path = tmp_path / "monitor.json"
+    path.write_text(json.dumps({"exchange_rate": "24.5", "date": "2023-02-01T09:00:00"}))
+
+    rate = fetch_rates([FileSource(str(path))])[0]
+
+    assert (rate["source"], rate["exchange_rate"], rate["date"].hour) == ("monitor", 24.5, 9)
+
+
+def test_aggregation_skips_the_failed_sources():
+    rates = fetch_rates(
+        [StaticSource(24.0, "BCV"), FailingSource("down"), StaticSource(26.0, "monitor"), StaticSource(25.0, "file")]
+    )
+
+    summary = aggregate_rates(rates)
+
+    assert summary["sources"] == 3
+    assert summary["rates"] == {"BCV": 24.0, "monitor": 26.0, "file": 25.0}
+    assert (summary["min"], summary["median"], summary["max"], summary["spread"]) == (24.0, 25.0, 26.0, 2.0)
+    assert summary["spread_pct"] == pytest.approx(8.0)
+
+
+def test_aggregation_without_rates_is_nan():
+    summary = aggregate_rates(fetch_rates([FailingSource("BCV")]))
+
+    assert summary["sources"] == 0
+    assert math.isnan(summary["median"]) and math.isnan(summary["spread_pct"])
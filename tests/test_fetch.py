@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+import sys
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import fetch
+from cache import HTTPCache
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    """Answer every page with its path, and record when it was requested"""
+
+    requests = []
+
+    def do_GET(self):
+        PageHandler.requests.append((self.path, time.monotonic()))
+        body = self.path.encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    PageHandler.requests = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+    fetch._limiters.clear()
+
+
+def test_rate_limit_spaces_every_request_to_the_host(server):
+    fetch.set_rate_limit(server + "/search", 0.2)
+
+    for page in range(3):
+        assert fetch.fetch_html(f"{server}/page/{page}", use_cache=False) == f"/page/{page}".encode()
+
+    times = [requested for _, requested in PageHandler.requests]
+    assert len(times) == 3
+    assert all(later - earlier >= 0.19 for earlier, later in zip(times, times[1:]))
+
+
+def test_rate_limit_is_shared_by_threads(server, monkeypatch):
+    fetch.set_rate_limit(server, 0.1)
+    # The moments the limiter lets the requests go, the server ones also have the jitter of the threads
+    released = []
+    wait_rate_limit = fetch._wait_rate_limit
+    monkeypatch.setattr(fetch, "_wait_rate_limit", lambda url: wait_rate_limit(url) or released.append(time.monotonic()))
+
+    threads = [
+        threading.Thread(target=fetch.fetch_html, args=(f"{server}/{i}",), kwargs={"use_cache": False})
+        for i in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(PageHandler.requests) == 4
+    times = sorted(released)
+    assert len(times) == 4
+    assert all(later - earlier >= 0.099 for earlier, later in zip(times, times[1:]))
+
+
+def test_hosts_without_rate_limit_do_not_wait(server):
+    start = time.monotonic()
+    for page in range(3):
+        fetch.fetch_html(f"{server}/{page}", use_cache=False)
+    assert time.monotonic() - start < 0.5
+
+
+class VersionedHandler(BaseHTTPRequestHandler):
+    """Answer the current version of a page, 304 when the validators match it"""
+
+    body = b"v1"
+    etag = '"v1"'
+    last_modified = None
+    requests = []  # The conditional headers of every request
+
+    def do_GET(self):
+        handler = VersionedHandler
+        headers = {name: self.headers[name] for name in ("If-None-Match", "If-Modified-Since") if self.headers[name]}
+        handler.requests.append(headers)
+        not_modified = (handler.etag and headers.get("If-None-Match") == handler.etag) or (
+            handler.last_modified and headers.get("If-Modified-Since") == handler.last_modified
+        )
+        self.send_response(304 if not_modified else 200)
+        if handler.etag:
+            self.send_header("ETag", handler.etag)
+        if handler.last_modified:
+            self.send_header("Last-Modified", handler.last_modified)
+        self.send_header("Content-Length", "0" if not_modified else str(len(handler.body)))
+        self.end_headers()
+        if not not_modified:
+            self.wfile.write(handler.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def versioned(monkeypatch, tmp_path):
+    """A server of one versioned page, and an empty HTTP cache"""
+    VersionedHandler.body, VersionedHandler.etag, VersionedHandler.last_modified = b"v1", '"v1"', None
+    VersionedHandler.requests = []
+    http_cache = HTTPCache()
+    http_cache.directory = str(tmp_path / "http")
+    monkeypatch.setattr(fetch, "HTTP_CACHE", http_cache)
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), VersionedHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}/page"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_a_page_not_modified_is_read_from_the_cache(versioned):
+    assert fetch.fetch_html(versioned) == b"v1"
+    assert fetch.fetch_html(versioned) == b"v1"
+
+    assert VersionedHandler.requests == [{}, {"If-None-Match": '"v1"'}]
+    assert fetch.cache_stats() == {"hits": 0, "revalidated": 1, "misses": 1}
+
+
+def test_a_modified_page_replaces_the_cached_one(versioned):
+    fetch.fetch_html(versioned)
+    VersionedHandler.body, VersionedHandler.etag = b"v2", '"v2"'
+
+    assert fetch.fetch_html(versioned) == b"v2"
+    assert fetch.fetch_html(versioned) == b"v2"
+
+    assert VersionedHandler.requests[1:] == [{"If-None-Match": '"v1"'}, {"If-None-Match": '"v2"'}]
+    assert fetch.cache_stats() == {"hits": 0, "revalidated": 1, "misses": 2}
+
+
+def test_a_page_with_last_modified_is_revalidated_with_it(versioned):
+    VersionedHandler.etag, VersionedHandler.last_modified = None, "Wed, 01 Feb 2023 09:00:00 GMT"
+
+    fetch.fetch_html(versioned)
+    assert fetch.fetch_html(versioned) == b"v1"
+
+    assert VersionedHandler.requests[1] == {"If-Modified-Since": "Wed, 01 Feb 2023 09:00:00 GMT"}
+    assert fetch.cache_stats()["revalidated"] == 1
+
+
+def test_a_fresh_page_is_not_requested(versioned):
+    fetch.HTTP_CACHE.max_age = 60
+
+    fetch.fetch_html(versioned)
+    assert fetch.fetch_html(versioned) == b"v1"
+
+    assert len(VersionedHandler.requests) == 1
+    assert fetch.cache_stats() == {"hits": 1, "revalidated": 0, "misses": 1}
+
+
+def test_a_page_without_validators_is_not_cached(versioned):
+    VersionedHandler.etag = None
+
+    fetch.fetch_html(versioned)
+    fetch.fetch_html(versioned)
+
+    assert VersionedHandler.requests == [{}, {}]
+    assert fetch.cache_stats() == {"hits": 0, "revalidated": 0, "misses": 2}
+
+
+def test_brotli_is_asked_for_only_when_it_can_be_decoded(monkeypatch):
+    monkeypatch.setitem(sys.modules, "brotli", types.ModuleType("brotli"))
+    assert fetch._accept_encoding() == "gzip, deflate, br"
+
+    monkeypatch.setitem(sys.modules, "brotli", None)  # Not installed
+    monkeypatch.setitem(sys.modules, "brotlicffi", None)
+    assert fetch._accept_encoding() == "gzip, deflate"
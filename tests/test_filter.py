@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+import pytest
+
+from data import filter_search_terms, page_frame, strip_accents
+
+
+def scraped(*pages) -> pd.DataFrame:
+    """The pages of a store, every page is a search term and its product names"""
+    data = pd.concat(
+        [page_frame([[name, "$ 1.00", True] for name in names], "Gama", search_term) for search_term, names in pages],
+        ignore_index=True,
+    )
+    return data.astype({"search_term": "category"})
+
+
+def kept(data: pd.DataFrame, accent_insensitive: bool = False) -> list:
+    return filter_search_terms(data, accent_insensitive)["product_name"].tolist()
+
+
+def test_strip_accents():
+    assert strip_accents("Café Ñandú PIÑA") == "Cafe Nandu PINA"
+
+
+@pytest.mark.parametrize(
+    "search_term, names, matches, accent_insensitive_matches",
+    [
+        # An accented term only matches the accented names, unless the accents are ignored
+        ("café", ["CAFÉ FAMA 500G", "Cafe Amanecer", "Té verde"], ["CAFÉ FAMA 500G"], ["CAFÉ FAMA 500G", "Cafe Amanecer"]),
+        # An unaccented term only matches the unaccented names, unless the accents are ignored
+        ("arroz", ["Arroz Mary", "ARRÓZ PRIMOR", "Pasta"], ["Arroz Mary"], ["Arroz Mary", "ARRÓZ PRIMOR"]),
+        ("azucar", ["Azúcar Montalbán", "AZUCAR 1KG"], ["AZUCAR 1KG"], ["Azúcar Montalbán", "AZUCAR 1KG"]),
+    ],
+)
+def test_accented_and_unaccented_search_terms(search_term, names, matches, accent_insensitive_matches):
+    data = scraped((search_term, names))
+
+    assert kept(data) == matches
+    assert kept(data, accent_insensitive=True) == accent_insensitive_matches
+
+
+@pytest.mark.parametrize(
+    "search_term, names, matches",
+    [
+        ("1/2", ["Leche 1/2 kg", "Leche 1 kg"], ["Leche 1/2 kg"]),
+        ("c++", ["Libro C++", "Libro C"], ["Libro C++"]),
+        ("(light)", ["Mayonesa (light)", "Mayonesa light"], ["Mayonesa (light)"]),
+        ("a.b", ["a.b", "axb"], ["a.b"]),
+        ("[500g]", ["Pasta [500g]", "Pasta 5"], ["Pasta [500g]"]),
+        ("ajo*", ["AJO* MOLIDO", "AJ MOLIDO", "AJOOO"], ["AJO* MOLIDO"]),
+    ],
+)
+def test_regex_metacharacters_are_matched_literally(search_term, names, matches):
+    data = scraped((search_term, names))
+
+    assert kept(data) == matches
+    assert kept(data, accent_insensitive=True) == matches
+
+
+def test_every_search_term_group_is_matched_with_its_own_term():
+    # The pages of the search terms are interleaved, and a name that contains another search term is dropped
+    data = scraped(
+        ("huevo", ["Huevos 30", "Arroz Mary"]),
+        ("arroz", ["Arroz Primor", "Huevos 12"]),
+        ("huevo", ["Pasta al huevo", "Café"]),
+        ("harina pan", ["Harina PAN", "Arepa"]),  # Multi word search terms keep every product
+    )
+    data.index = data.index[::-1]  # The mask does not depend on the index order
+
+    assert kept(data) == ["Huevos 30", "Arroz Primor", "Pasta al huevo", "Harina PAN", "Arepa"]
+
+
+def test_products_without_name_are_dropped():
+    data = scraped(("huevo", ["Huevos 30", None]))
+
+    assert kept(data) == ["Huevos 30"]
+    assert kept(data, accent_insensitive=True) == ["Huevos 30"]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import random
+import string
+import time
+
+import identity
+from identity import ProductIndex
+
+
+def random_names(count: int, seed: int) -> list:
+    """Names like "Xkqa Pmzr Tuvw 500 GR", almost all of different products"""
+    rng = random.Random(seed)
+    word = lambda: "".join(rng.choice(string.ascii_lowercase) for _ in range(6))
+    return [f"{word()} {word()} {word()} {rng.randint(1, 999)} GR" for _ in range(count)]
+
+
+def test_names_of_the_same_product_get_the_same_id(tmp_path):
+    index = ProductIndex(str(tmp_path / "product_index.json"))
+
+    ids = index.assign(["ARROZ MARY INTEGRAL 800 GR", "Arroz Mary Integral 800Gr.", "Arroz Primor 1 KG"])
+    index.save()
+
+    assert ids[0] == ids[1] != ids[2]
+    reloaded = ProductIndex(index.path)
+    assert reloaded.assign(["Arroz Mary Integral 0,8 Kg"]) == [ids[0]]
+
+
+def test_assign_does_not_grow_with_the_index(tmp_path, monkeypatch):
+    index = ProductIndex(str(tmp_path / "product_index.json"))
+    index.assign(random_names(17000, seed=1))
+    index.save()
+    index = ProductIndex(index.path)  # The leaders are blocked once, when loaded
+
+    calls = []
+    features = identity.name_features
+    monkeypatch.setattr(identity, "name_features", lambda name: calls.append(name) or features(name))
+
+    pages = [random_names(25, seed=page) for page in range(100, 140)]
+    start = time.perf_counter()
+    for page in pages:
+        index.assign(page)
+    seconds = time.perf_counter() - start
+
+    # The features of the page names only (twice for the new ones), not of the known names
+    assert len(calls) <= 2 * 25 * len(pages)
+    assert seconds < 2, f"40 pages took {seconds:.1f}s against {len(index)} names"
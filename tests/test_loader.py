@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+import pytest
+from sqlalchemy import inspect
+
+from loader import _copy_rows, _records, copy_insert, get_engine, load_dataframe, upsert_dataframe
+from migrations import count_duplicates, dedupe_natural_key
+from pipeline import DBSink
+
+KEY = ["name", "store_name", "date_scrapt", "search_term"]
+
+
+def food_rows(prices: list) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "name": [f"Arroz {i}" for i in range(len(prices))],
+            "price_dollar": prices,
+            "store_name": "Gama",
+            "date_scrapt": pd.Timestamp("2023-02-01"),
+            "search_term": "arroz",
+        }
+    )
+
+
+class CopyCursor:
+    """DBAPI cursor of psycopg2 that records the COPY statements and their CSV"""
+
+    def __init__(self, copies):
+        self.copies = copies
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def copy_expert(self, sql, buffer):
+        self.copies.append((sql, buffer.read()))
+
+
+class CopyConnection:
+    def __init__(self):
+        self.copies = []
+        self.connection = self  # The DBAPI connection of a SQLAlchemy connection
+
+    def cursor(self):
+        return CopyCursor(self.copies)
+
+
+class Table:
+    """The SQLTable given by to_sql to its method"""
+
+    def __init__(self, name, schema=None):
+        self.name = name
+        self.schema = schema
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return get_engine(f"sqlite:///{tmp_path / 'vfood.db'}")
+
+
+def read_food(engine) -> pd.DataFrame:
+    return pd.read_sql("SELECT * FROM food ORDER BY name", engine)
+
+
+def test_dbsink_creates_the_missing_table(engine):
+    with DBSink(engine, "food", KEY) as sink:
+        sink.write(food_rows([1.0, 2.0]))
+
+    assert read_food(engine)["price_dollar"].tolist() == [1.0, 2.0]
+    indexes = inspect(engine).get_indexes("food")
+    assert [index["name"] for index in indexes] == ["food_natural_key"]
+
+
+def test_upsert_twice_updates_the_rows(engine):
+    upsert_dataframe(food_rows([1.0, 2.0]), "food", engine, KEY)
+    upsert_dataframe(food_rows([1.5, 2.0, 3.0]), "food", engine, KEY)
+
+    assert read_food(engine)["price_dollar"].tolist() == [1.5, 2.0, 3.0]
+
+
+def test_upsert_does_not_delete_the_duplicated_rows(engine):
+    load_dataframe(pd.concat([food_rows([1.0, 2.0]), food_rows([1.1])]), "food", engine)
+
+    with pytest.raises(ValueError, match="duplicated"):
+        upsert_dataframe(food_rows([1.0]), "food", engine, KEY)
+    assert read_food(engine).shape[0] == 3
+
+
+def test_migration_dedupes_the_natural_key(engine):
+    load_dataframe(pd.concat([food_rows([1.0, 2.0]), food_rows([1.1])]), "food", engine)
+
+    assert dedupe_natural_key("food", engine, KEY, dry_run=True) == 1
+    assert read_food(engine).shape[0] == 3
+
+    assert dedupe_natural_key("food", engine, KEY) == 1
+    assert count_duplicates("food", engine, KEY) == 0
+    assert read_food(engine)["price_dollar"].tolist() == [1.1, 2.0]  # The last row loaded
+
+    upsert_dataframe(food_rows([1.2]), "food", engine, KEY)
+    assert read_food(engine)["price_dollar"].tolist() == [1.2, 2.0]
+
+
+def test_copy_insert_sends_the_chunk_as_csv():
+    conn = CopyConnection()
+
+    copy_insert(Table("food", "public"), conn, ["name", "price_dollar"], iter([("Arroz, 1 KG", 1.5), ('Pan "canilla"', None)]))
+
+    assert conn.copies == [
+        (
+            'COPY "public"."food" ("name", "price_dollar") FROM STDIN WITH (FORMAT csv)',
+            '"Arroz, 1 KG",1.5\r\n"Pan ""canilla""",\r\n',
+        )
+    ]
+
+
+def test_copy_rows_quotes_the_columns_and_writes_missing_values_empty():
+    conn = CopyConnection()
+    data = food_rows([1.0, float("nan")])[["name", "price_dollar"]].rename(columns={"name": 'odd "name'})
+
+    _copy_rows(conn, '"stage_food"', list(data.columns), _records(data))
+
+    sql, csv_text = conn.copies[0]
+    assert sql == 'COPY "stage_food" ("odd ""name", "price_dollar") FROM STDIN WITH (FORMAT csv)'
+    assert csv_text.splitlines() == ["Arroz 0,1.0", "Arroz 1,"]
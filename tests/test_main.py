@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import os
+import subprocess
+import sys
+
+VFOOD = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "vfood")
+
+# Run the command line in a new interpreter and print the modules it loaded
+SCRIPT = """
+import runpy, sys
+sys.argv = ["vfood"] + sys.argv[1:]
+try:
+    runpy.run_path({vfood!r}, run_name="__main__")
+finally:
+    print(" ".join(sorted(sys.modules)))
+"""
+
+
+def loaded_modules(*argv):
+    result = subprocess.run(
+        [sys.executable, "-c", SCRIPT.format(vfood=VFOOD), *argv],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return set(result.stdout.split())
+
+
+def test_exchange_job_does_not_load_the_scraping_modules():
+    modules = loaded_modules("--import-only", "exchange")
+
+    assert {"update_db", "exchange", "exchange_tw"} <= modules
+    assert not {"data", "pipeline", "parsers", "bs4", "regex"} & modules
+
+
+def test_foods_job_loads_the_pipeline():
+    modules = loaded_modules("--import-only", "foods")
+
+    assert {"update_db", "pipeline", "data"} <= modules
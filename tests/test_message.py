@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+The TelegramNotifier against a local stub of the Telegram Bot API.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import message
+from message import TelegramNotifier
+
+
+class TelegramStub(BaseHTTPRequestHandler):
+    """Record every request, and answer like sendMessage (or hang while hang is set)"""
+
+    requests = []
+    hang = threading.Event()
+    release = threading.Event()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        TelegramStub.requests.append({"path": self.path, "body": json.loads(body)})
+        if TelegramStub.hang.is_set():
+            TelegramStub.release.wait(5)
+        answer = json.dumps({"ok": True, "result": {}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(answer)))
+        self.end_headers()
+        self.wfile.write(answer)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    TelegramStub.requests = []
+    TelegramStub.hang.clear()
+    TelegramStub.release.clear()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), TelegramStub)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(message, "TELEGRAM_API_URL", f"http://127.0.0.1:{server.server_port}")
+    yield TelegramStub
+    TelegramStub.release.set()
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def notifier(stub):
+    notifier = TelegramNotifier("TOKEN", "42", batch_window=0.2)
+    yield notifier
+    notifier.close()
+
+
+def test_message_is_posted_in_the_json_body(stub, notifier):
+    notifier.send("Hola *mundo*")
+    notifier.flush()
+
+    assert len(stub.requests) == 1
+    request = stub.requests[0]
+    assert request["path"] == "/botTOKEN/sendMessage"  # Nothing in the query string
+    assert request["body"] == {"chat_id": "42", "text": "Hola *mundo*", "parse_mode": "MarkdownV2"}
+    assert notifier.sent == 1
+
+
+def test_messages_sent_together_are_batched(stub, notifier):
+    for text in ["uno", "dos", "tres"]:
+        notifier.send(text)
+    notifier.send("sin formato", mk=False)
+    notifier.flush()
+
+    assert [request["body"]["text"] for request in stub.requests] == ["uno\n\ndos\n\ntres", "sin formato"]
+    assert "parse_mode" not in stub.requests[1]["body"]
+
+
+def test_hanging_api_times_out(stub):
+    stub.hang.set()
+    notifier = TelegramNotifier("TOKEN", "42", timeout=0.3, batch_window=0)
+    start = time.monotonic()
+    notifier.send("uno")
+    notifier.flush()
+    notifier.close()
+
+    assert time.monotonic() - start < 2
+    assert len(stub.requests) == 1
+    assert notifier.sent == 0
+
+
+@pytest.mark.parametrize("finish", ["flush", "close"])
+def test_everything_queued_is_sent(stub, finish):
+    notifier = TelegramNotifier("TOKEN", "42", batch_window=0.05)
+    texts = [f"mensaje {i}" for i in range(5)]
+    for i, text in enumerate(texts):
+        notifier.send(text, mk=i % 2 == 0)  # Alternate parsers, so they are not joined
+
+    getattr(notifier, finish)()
+
+    assert [request["body"]["text"] for request in stub.requests] == texts
+    assert notifier.sent == 5
+    notifier.close()
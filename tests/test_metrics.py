@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+
+import pytest
+
+from metrics import RunMetrics
+
+
+def test_timers_and_counters_are_added_by_labels():
+    metrics = RunMetrics()
+    for _ in range(2):
+        with metrics.timer("fetch", store="Gama", search_term="huevo"):
+            pass
+    metrics.count("pages", store="Gama", search_term="huevo")
+    metrics.count("bytes", 100, host="gamaenlinea.com")
+    metrics.count("bytes", 50, host="gamaenlinea.com")
+
+    report = metrics.report()
+
+    assert report["stages"] == [
+        {
+            "stage": "fetch",
+            "search_term": "huevo",
+            "store": "Gama",
+            "seconds": pytest.approx(report["totals"]["fetch_seconds"]),
+            "calls": 2,
+        }
+    ]
+    assert report["totals"]["pages"] == 1
+    assert report["totals"]["bytes"] == 150
+
+
+def test_timer_observes_the_block_that_raises():
+    metrics = RunMetrics()
+    with pytest.raises(ValueError):
+        with metrics.timer("parse", store="Gama"):
+            raise ValueError
+
+    assert metrics.report()["stages"][0]["calls"] == 1
+
+
+def test_counts_from_several_threads_are_not_lost():
+    metrics = RunMetrics()
+
+    def count():
+        for _ in range(1000):
+            metrics.count("rows", store="Plazas")
+
+    threads = [threading.Thread(target=count) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert metrics.report()["totals"]["rows"] == 4000
+
+
+def test_prometheus_escapes_the_labels():
+    metrics = RunMetrics()
+    metrics.observe("load", 1.5, sink='csv "test"')
+    metrics.count("loaded_rows", 10, sink="csv")
+
+    text = metrics.prometheus()
+
+    assert 'vfood_stage_seconds_total{stage="load",sink="csv \\"test\\""} 1.500000' in text
+    assert 'vfood_stage_calls_total{stage="load",sink="csv \\"test\\""} 1' in text
+    assert "# TYPE vfood_loaded_rows_total counter" in text
+    assert 'vfood_loaded_rows_total{sink="csv"} 10' in text
+    assert text.endswith("\n")
+
+
+def test_save_writes_the_report_and_the_textfile(tmp_path):
+    metrics = RunMetrics()
+    metrics.count("pages", store="Gama")
+
+    report_path, prometheus_path = metrics.save(str(tmp_path), name="run")
+
+    with open(report_path, encoding="utf-8") as report_file:
+        assert json.load(report_file)["totals"] == {"pages": 1}
+    assert prometheus_path == str(tmp_path / "run.prom")
+    assert 'vfood_pages_total{store="Gama"} 1' in (tmp_path / "run.prom").read_text()
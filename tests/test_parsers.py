@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from parsers import available_parsers, parse_html, select_attrs, select_rows, select_texts
+
+PAGE = b"""<html><body>
+  <div class="product featured"><span class="name">Arroz</span><span class="price">Bs. 10</span></div>
+  <div class="product"><span class="name">Harina</span></div>
+  <div class="banner">Oferta</div>
+  <nav><a class="page-numbers" href="/page/2/">2</a><a class="next page-numbers" href="/page/2/">next</a></nav>
+</body></html>"""
+
+
+@pytest.mark.parametrize("parser", available_parsers())
+def test_parse_only_keeps_the_elements_with_several_classes(parser):
+    doc = parse_html(PAGE, parser, only={"class_": ["product", "page-numbers"]})
+
+    assert select_texts(doc, "a.page-numbers") == ["2", "next"]
+    assert select_attrs(doc, "a.page-numbers", "href") == ["/page/2/", "/page/2/"]
+    assert select_rows(doc, "div.product", {"name": "span.name", "price": "span.price"}) == [
+        {"name": "Arroz", "price": "Bs. 10"},
+        {"name": "Harina", "price": None},
+    ]
+
+
+def test_parse_only_drops_the_other_elements():
+    doc = parse_html(PAGE, "html.parser", only={"class_": "product"})
+
+    assert select_texts(doc, "div.banner") == []
+    assert len(select_texts(doc, "div.product")) == 2
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+import pytest
+
+import pipeline
+from data import page_frame
+from identity import ProductIndex
+from loader import get_engine, load_dataframe
+from migrations import food_product_id
+from pipeline import DBSink, run_pipeline
+from update_db import FOOD_KEY, prepare_food_data
+
+PAGES = [
+    ("Gama", [["ARROZ MARY INTEGRAL 800 GR", "Total Ref. 2,50", True], ["Arroz Primor 1 KG", "Total Ref. 1,90", True]]),
+    ("Gama", [["Arroz Mary Integral 800Gr.", "Total Ref. 2,60", True]]),
+]
+
+
+@pytest.fixture
+def scraped(monkeypatch):
+    """Scrape the pages above instead of the stores"""
+
+    def scrape_batches(products, registry, limits=None, journal=None):
+        for store_name, products_information in PAGES:
+            yield page_frame(products_information, store_name, "arroz")
+
+    monkeypatch.setattr(pipeline, "scrape_batches", scrape_batches)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return get_engine(f"sqlite:///{tmp_path / 'vfood.db'}")
+
+
+def read_food(engine) -> pd.DataFrame:
+    return pd.read_sql("SELECT * FROM food ORDER BY price_dollar", engine)
+
+
+def test_products_get_their_id_in_the_food_table(scraped, engine, tmp_path):
+    index = ProductIndex(str(tmp_path / "product_index.json"))
+    with DBSink(engine, "food", FOOD_KEY, transform=prepare_food_data) as sink:
+        rows = run_pipeline(["arroz"], [sink], 1.0, stores=["Gama"], product_index=index)
+
+    food = read_food(engine)
+    assert rows == 3 and food.shape[0] == 3
+    mary = food.loc[food["name"].str.contains("Mary"), "product_id"]
+    assert mary.nunique() == 1
+    assert food["product_id"].nunique() == 2
+    assert ProductIndex(index.path).ids == index.ids  # Saved at the end of the run
+
+
+def test_food_table_without_product_id(scraped, engine, tmp_path):
+    old_rows = prepare_food_data(page_frame([["Arroz viejo", "$ 1.00", True]], "Gama", "arroz").assign(product_price_dollar=1.0))
+    load_dataframe(old_rows, "food", engine)  # A food table of before the product ids
+
+    def scrape(index_name):
+        index = ProductIndex(str(tmp_path / index_name))
+        with DBSink(engine, "food", FOOD_KEY, transform=prepare_food_data) as sink:
+            run_pipeline(["arroz"], [sink], 1.0, stores=["Gama"], product_index=index)
+
+    scrape("first.json")
+    assert "product_id" not in read_food(engine).columns  # Dropped, the load does not fail
+
+    assert food_product_id(engine) == 1
+    scrape("second.json")
+    assert read_food(engine)["product_id"].notna().sum() == 3
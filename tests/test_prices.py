@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+import math
+
+import pandas as pd
+
+from data import convert_prices_dollar, split_prices
+
+PRICES = pd.Series(
+    ["Bs. 194.00", "$ 2.50", "  $3.25 ", "12.5", None, "Bs. abc", "Bs.  7"],
+    index=range(10, 17),
+)
+
+
+def test_split_prices():
+    price_data = split_prices(PRICES)
+
+    assert list(price_data.index) == list(PRICES.index)
+    assert price_data["currency"].fillna("").tolist() == ["Bs.", "$", "$", "", "", "Bs.", "Bs."]
+    amounts = price_data["amount"].astype("float64").tolist()
+    assert amounts[:4] == [194.0, 2.5, 3.25, 12.5]
+    assert math.isnan(amounts[4]) and math.isnan(amounts[5])
+    assert amounts[6] == 7.0
+
+
+def test_convert_prices_dollar():
+    prices = convert_prices_dollar(PRICES, 19.4)
+
+    assert list(prices.index) == list(PRICES.index)
+    assert prices.tolist()[:3] == [10.0, 2.5, 3.25]
+    assert prices.iloc[3:6].isna().all()  # No currency or no amount
+    assert prices.iat[6] == 0.36
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+from requests.exceptions import ConnectionError as RequestConnectionError
+
+import resilience
+from resilience import CircuitOpenError, call_with_retry, get_breaker
+
+URL = "https://store.test/search"
+
+
+@pytest.fixture(autouse=True)
+def breakers():
+    resilience.reset_breakers()
+    yield
+    resilience.reset_breakers()
+
+
+def fail():
+    raise RequestConnectionError("down")
+
+
+def open_breaker():
+    """Open the breaker of the host, ready to be probed"""
+    breaker = get_breaker(URL)
+    breaker.reset_timeout = 0
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(RequestConnectionError):
+            call_with_retry(fail, URL, retries=0)
+    assert breaker.state == "half-open"
+    return breaker
+
+
+def test_breaker_opens_after_the_failures():
+    breaker = open_breaker()
+    breaker.reset_timeout = 60
+    with pytest.raises(CircuitOpenError):
+        call_with_retry(lambda: "page", URL, retries=0)
+
+
+@pytest.mark.parametrize("error", [ValueError("parser error"), KeyboardInterrupt()])
+def test_probe_that_raises_other_errors_is_released(error):
+    breaker = open_breaker()
+
+    def probe():
+        raise error
+
+    with pytest.raises(type(error)):
+        call_with_retry(probe, URL, retries=0)
+
+    assert not breaker._probing
+    assert call_with_retry(lambda: "page", URL, retries=0) == "page"
+    assert breaker.state == "closed"
+
+
+def test_probe_is_not_released_by_another_thread():
+    breaker = open_breaker()
+    assert breaker.allow()  # This thread probes
+
+    thread = threading.Thread(target=breaker.release_probe)
+    thread.start()
+    thread.join()
+
+    assert breaker._probing
+    assert not breaker.allow()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import sys
+import threading
+from datetime import datetime
+
+import pytest
+
+import scheduler
+from scheduler import CronSchedule, Scheduler, command_line, load_jobs, parse_cron_field
+
+
+@pytest.mark.parametrize(
+    "text, values",
+    [
+        ("*", set(range(0, 24))),
+        ("9,15", {9, 15}),
+        ("1-5", {1, 2, 3, 4, 5}),
+        ("*/6", {0, 6, 12, 18}),
+        ("8-18/5", {8, 13, 18}),
+        ("20/2", {20, 22}),
+        ("1-3,7,*/12", {0, 1, 2, 3, 7, 12}),
+    ],
+)
+def test_cron_fields(text, values):
+    assert parse_cron_field(text, 0, 23) == values
+
+
+@pytest.mark.parametrize("text", ["24", "5-1", "a", "1-", "*/0"])
+def test_wrong_cron_fields(text):
+    with pytest.raises(ValueError):
+        parse_cron_field(text, 0, 23)
+
+
+@pytest.mark.parametrize(
+    "expression, moment, next_run",
+    [
+        ("0 9,15 * * *", datetime(2023, 2, 1, 9, 0, 30), datetime(2023, 2, 1, 15, 0)),
+        ("*/10 * * * *", datetime(2023, 2, 1, 9, 55), datetime(2023, 2, 1, 10, 0)),
+        ("0 6 * * *", datetime(2023, 1, 31, 7), datetime(2023, 2, 1, 6, 0)),
+        ("0 6 1 * *", datetime(2023, 12, 15), datetime(2024, 1, 1, 6, 0)),
+        ("30 23 31 12 *", datetime(2023, 12, 31, 23, 30), datetime(2024, 12, 31, 23, 30)),
+        ("0 0 29 2 *", datetime(2023, 3, 1), datetime(2024, 2, 29, 0, 0)),
+        ("0 6 * * 1-5", datetime(2023, 2, 3, 7), datetime(2023, 2, 6, 6, 0)),  # Friday to Monday
+        # Either the day or the weekday: the 13th (a Monday) or a Friday
+        ("0 6 13 * 5", datetime(2023, 2, 4), datetime(2023, 2, 10, 6, 0)),
+        ("0 6 13 * 5", datetime(2023, 2, 10, 7), datetime(2023, 2, 13, 6, 0)),
+    ],
+)
+def test_next_run(expression, moment, next_run):
+    assert CronSchedule(expression).next_after(moment) == next_run
+
+
+def test_cron_expressions_need_five_fields():
+    with pytest.raises(ValueError):
+        CronSchedule("0 6 * *")
+
+
+def test_the_schedule_of_the_repo_loads():
+    jobs = load_jobs()
+
+    assert [job["command"] for job in jobs] == ["foods", "exchange"]
+
+
+def test_unknown_commands_are_rejected(tmp_path):
+    path = tmp_path / "schedule.toml"
+    path.write_text('[[job]]\nname = "x"\ncommand = "rm"\ncron = "* * * * *"\n')
+
+    with pytest.raises(ValueError, match="command"):
+        load_jobs(str(path))
+
+
+def test_every_job_runs_in_its_own_process(monkeypatch):
+    runs = []
+    monkeypatch.setattr(scheduler.subprocess, "run", lambda argv, check: runs.append(argv))
+
+    scheduler.run_command("foods", {"delta": True, "resume": False, "stores": ["Gama", "Plazas"]})
+
+    assert runs == [[sys.executable, scheduler.VFOOD_DIR, "foods", "--delta", "--stores", "Gama", "Plazas"]]
+    assert command_line("exchange", {}) == [sys.executable, scheduler.VFOOD_DIR, "exchange"]
+
+
+def test_a_job_still_running_is_skipped():
+    release = threading.Event()
+    runs = []
+
+    def runner(command, args):
+        runs.append(command)
+        release.wait(5)
+
+    job = {"name": "foods", "command": "foods", "args": {}}
+    jobs = Scheduler([job], runner=runner)
+
+    assert jobs.run_job(job)
+    assert not jobs.run_job(job)  # The first run has not finished
+    release.set()
+    jobs._running["foods"].join()
+    assert jobs.run_job(job)
+    jobs._running["foods"].join()
+
+    assert runs == ["foods", "foods"]
+
+
+def test_a_failed_run_does_not_stop_the_job():
+    def runner(command, args):
+        raise RuntimeError("the store is down")
+
+    job = {"name": "foods", "command": "foods", "args": {}}
+    jobs = Scheduler([job], runner=runner)
+
+    jobs.run_job(job)
+    jobs._running["foods"].join()
+    assert jobs.run_job(job)
+    jobs._running["foods"].join()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+import pytest
+
+import data
+from scrape import clean_prices
+from stores import PAGINATIONS, load_stores, store_limits
+
+REGISTRY = load_stores()
+
+# Raw price texts of every store and their clean prices
+PRICES = {
+    "Plazas": [("Precio con IVA 1,029.88", "Bs. 1029.88"), ("(E) Precio con IVA 29.88 (E)", "Bs. 29.88"), ("48.50", "Bs. 48.50")],
+    "Gama": [("Total Ref. 2,50", "$ 2.50"), ("Total Ref. 1.234,50", "$ 1234.50")],
+    "Central Madeirense": [("#10,50", "$ 10.50"), ("#\u00a01\u00a0234,56", "$ 1234.56")],
+    "Plan Suarez": [("Bs.1,234.56", "Bs. 1234.56"), ("Bs.29.88", "Bs. 29.88")],
+}
+
+
+def test_the_registry_has_every_store_with_its_defaults():
+    assert list(REGISTRY) == ["Plazas", "Gama", "Central Madeirense", "Plan Suarez"]
+    for store in REGISTRY.values():
+        assert store["pagination"] in PAGINATIONS
+        assert store["search_url"].count("{product}") == 1
+        assert "price" in store and "product_availability" in store
+    assert store_limits(REGISTRY)["Gama"] == {"max_workers": 2, "min_interval": 1.0}
+
+
+def test_the_registry_keeps_the_stores_asked_for():
+    assert list(load_stores(names=["Gama", "Plazas"])) == ["Plazas", "Gama"]
+    with pytest.raises(ValueError, match="Tiendas"):
+        load_stores(names=["Tiendas"])
+
+
+@pytest.mark.parametrize(
+    "entry, error",
+    [
+        ('name = "Test"\nsearch_url = "x"', "misses the keys"),
+        (
+            'name = "Test"\nsearch_url = "x"\nitem = "x"\nproduct_name = "x"\nproduct_price = "x"\n'
+            'currency = "$"\npagination = "infinite"',
+            "pagination",
+        ),
+    ],
+)
+def test_wrong_stores_are_rejected(tmp_path, entry, error):
+    path = tmp_path / "stores.toml"
+    path.write_text(f"[[store]]\n{entry}\n")
+
+    with pytest.raises(ValueError, match=error):
+        load_stores(str(path))
+
+
+@pytest.mark.parametrize("store_name", list(PRICES))
+def test_the_prices_of_every_store_are_cleaned_with_its_rules(store_name):
+    store = REGISTRY[store_name]
+    raw, clean = zip(*PRICES[store_name])
+
+    prices = clean_prices(pd.Series(raw), store["price"], store["currency"])
+
+    assert prices.tolist() == list(clean)
+
+
+def test_the_no_break_space_rule_of_central_madeirense():
+    # The page separates the currency and the thousands with no-break spaces
+    assert "\u00a0" in REGISTRY["Central Madeirense"]["price"]["remove"]
+
+
+def test_the_store_searches_read_the_registry_once(monkeypatch):
+    loads = []
+    monkeypatch.setattr(data, "load_stores", lambda *args, **kwargs: loads.append(1) or load_stores(*args, **kwargs))
+    monkeypatch.setattr(data, "store_product_search", lambda store, product: store["name"])
+    data._registry.cache_clear()
+
+    searched = [search("huevo") for search in (data.gama_product_search, data.plazas_product_search, data.gama_product_search)]
+
+    assert searched == ["Gama", "Plazas", "Gama"]
+    assert len(loads) == 1
+    data._registry.cache_clear()
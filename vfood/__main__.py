@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Command line of vfood.
+
+    python vfood foods [--resume] [--delta] [--stores Gama Plazas]
+    python vfood exchange
+    python vfood run huevo arroz --stores Gama --csv huevo.csv
+    python vfood schedule [--config ref_table/schedule.toml]
+    python vfood migrate food-natural-key|food-product-id [--dry-run]
+
+Every subcommand imports only the modules it uses, when it runs: the exchange job
+does not load the scraping pipeline, and the food jobs do not need tweepy.
+--import-only loads the modules of a subcommand and exits, to measure its startup
+(see benchmark.py startup).
+
+The .env is loaded before any job module is imported, because the modules read
+their VFOOD_* settings when they are imported.
+"""
+
+import argparse
+import logging
+import os
+
+from dotenv import load_dotenv
+
+
+def foods(args):
+    """Scrape the list of foods and update the food table, see update_db.update_foods."""
+    from update_db import update_foods
+
+    if args.import_only:
+        import pipeline  # noqa: F401, imported by update_foods when it runs
+        return
+    update_foods(resume=args.resume, delta=args.delta, stores=args.stores)
+
+
+def exchange(args):
+    """Update the exchange rate table, see update_db.update_exchange."""
+    from update_db import update_exchange
+
+    if args.import_only:
+        import exchange, exchange_tw  # noqa: F401, imported by update_exchange when it runs
+        return
+    update_exchange()
+
+
+def run(args):
+    """Scrape products to a CSV file, without touching the database."""
+    from checkpoint import RunJournal
+    from metrics import METRICS
+    from pipeline import CSVSink, run_pipeline
+
+    if args.import_only:
+        return
+    products = args.products
+    if not products:
+        from update_db import get_list_foods
+
+        products = get_list_foods(os.path.join(os.getcwd(), "ref_table", "foods.csv"))
+
+    with CSVSink(args.csv) as csv_sink:
+        run_pipeline(
+            products, [csv_sink], stores=args.stores, journal=RunJournal(resume=args.resume)
+        )
+    report_path, prometheus_path = METRICS.save()
+    print(f"Run metrics saved to {report_path} and {prometheus_path}")
+
+
+def schedule(args):
+    """Run the jobs of the schedule from this process, see scheduler.py."""
+    import scheduler
+
+    if args.import_only:
+        return
+    scheduler.serve(args.config)
+
+
+def migrate(args):
+    """Run a one-off migration of the database, see migrations.py."""
+    import migrations
+
+    if args.import_only:
+        return
+    migrations.run_migration(args.name, url=args.url, dry_run=args.dry_run)
+
+
+def main(argv: list = None):
+    """Run the subcommand given in the command line."""
+    load_dotenv()
+    parser = argparse.ArgumentParser(prog="vfood", description="Food prices of Venezuela")
+    parser.add_argument(
+        "--import-only",
+        action="store_true",
+        help="load the modules of the subcommand and exit",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    foods_cmd = subparsers.add_parser("foods", help="update the food table")
+    foods_cmd.add_argument(
+        "--resume", action="store_true", help="skip the pages already scraped by today's run"
+    )
+    foods_cmd.add_argument(
+        "--delta", action="store_true", help="load only the products whose price changed"
+    )
+    foods_cmd.add_argument("--stores", nargs="+", help="stores to scrape")
+    foods_cmd.set_defaults(handler=foods)
+
+    exchange_cmd = subparsers.add_parser("exchange", help="update the exchange rate table")
+    exchange_cmd.set_defaults(handler=exchange)
+
+    run_cmd = subparsers.add_parser("run", help="scrape products to a CSV file")
+    run_cmd.add_argument("products", nargs="*", help="by default ref_table/foods.csv")
+    run_cmd.add_argument("--stores", nargs="+", help="stores to scrape")
+    run_cmd.add_argument("--csv", default="test_data.csv", help="CSV file written")
+    run_cmd.add_argument(
+        "--resume", action="store_true", help="skip the pages already scraped by today's run"
+    )
+    run_cmd.set_defaults(handler=run)
+
+    schedule_cmd = subparsers.add_parser("schedule", help="run the jobs of the schedule")
+    schedule_cmd.add_argument("--config", help="by default ref_table/schedule.toml")
+    schedule_cmd.set_defaults(handler=schedule)
+
+    migrate_cmd = subparsers.add_parser("migrate", help="run a one-off migration of the database")
+    migrate_cmd.add_argument("name", choices=["food-natural-key", "food-product-id"], help="the migration")
+    migrate_cmd.add_argument("--url", help="SQLAlchemy url, by default the database of the .env")
+    migrate_cmd.add_argument(
+        "--dry-run", action="store_true", help="only log what the migration would change"
+    )
+    migrate_cmd.set_defaults(handler=migrate)
+
+    args = parser.parse_args(argv)
+    # VFOOD_LOG_LEVEL=DEBUG logs every product of every page
+    logging.basicConfig(
+        level=os.getenv("VFOOD_LOG_LEVEL", "INFO"), format="%(name)s: %(message)s"
+    )
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar archive of the daily scrapes.
+
+Every run is appended to a Parquet dataset partitioned by date and store
+(archive/date=2023-01-16/store=Plazas/part-....parquet), with the repeated texts
+(store, search_term and currency) dictionary encoded. The reader pushes the
+filters down to the dataset, so only the partitions and row groups that can
+match are read.
+
+    prices = read_archive(start="2023-01-01", stores=["Gama"], search_terms=["huevo"])
+
+Needs pyarrow, imported when the archive is used.
+"""
+
+import os
+import shutil
+import uuid
+from datetime import date, datetime
+from urllib.parse import quote
+
+import pandas as pd
+
+from data import parse_dates, split_prices
+
+ARCHIVE_DIR = os.getenv("VFOOD_ARCHIVE_DIR", os.path.join(os.getcwd(), "archive"))
+
+CATEGORICAL_COLUMNS = ["store", "search_term", "currency"]
+
+
+def _schema():
+    """Schema of the archive and of its partitions"""
+    import pyarrow as pa
+
+    dictionary = pa.dictionary(pa.int32(), pa.string())
+    schema = pa.schema(
+        [
+            ("product_name", pa.string()),
+            ("product_price", pa.string()),
+            ("product_availability", pa.bool_()),
+            ("date", pa.date32()),
+            ("store", pa.string()),
+            ("search_term", dictionary),
+            ("currency", dictionary),
+            ("product_price_dollar", pa.float64()),
+        ]
+    )
+    partitions = pa.schema([("date", pa.date32()), ("store", pa.string())])
+    return schema, partitions
+
+
+def archive_frame(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Give the scraped data the columns and dtypes of the archive.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Data with the columns of test_data.csv (date as datetime64 or with the
+        format %d/%m/%Y).
+
+    Returns
+    -------
+    pd.DataFrame :
+        A new DataFrame with date as datetime.date, the currency of the prices, and
+        store, search_term and currency as categories.
+    """
+    data = data.loc[
+        :,
+        [
+            "product_name",
+            "product_price",
+            "product_availability",
+            "date",
+            "store",
+            "search_term",
+            "product_price_dollar",
+        ],
+    ].copy()
+    data["date"] = parse_dates(data["date"]).dt.date
+    data["currency"] = split_prices(data["product_price"])["currency"]
+    data["product_availability"] = data["product_availability"].astype(bool)
+    data["product_price_dollar"] = (
+        data["product_price_dollar"].astype("float64").round(2)
+    )  # Undo the float32 rounding of the compact frames
+    for column in CATEGORICAL_COLUMNS:
+        data[column] = data[column].astype("category")
+    return data
+
+
+def _partition_dir(path: str, day: date, store_name: str) -> str:
+    """Directory of the partition of a day and a store"""
+    return os.path.join(path, f"date={day.isoformat()}", f"store={quote(store_name)}")
+
+
+def write_archive(data: pd.DataFrame, path: str = None, basename: str = None):
+    """
+    Append scraped data to the archive.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Data with the columns of test_data.csv, see archive_frame.
+
+    path : str
+        (optional) Directory of the archive, by default ARCHIVE_DIR.
+
+    basename : str
+        (optional) Prefix of the files written, by default a random one. Use a
+        different one in every call, the files with the same name are replaced.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    schema, partitions = _schema()
+    table = pa.Table.from_pandas(archive_frame(data), schema=schema, preserve_index=False)
+    ds.write_dataset(
+        table,
+        path or ARCHIVE_DIR,
+        format="parquet",
+        partitioning=ds.partitioning(partitions, flavor="hive"),
+        basename_template=f"{basename or uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+def drop_partition(day: date, store_name: str, path: str = None):
+    """Delete the archived data of a store in a day, e.g. before archiving it again."""
+    shutil.rmtree(_partition_dir(path or ARCHIVE_DIR, day, store_name), ignore_errors=True)
+
+
+def _as_date(value) -> date:
+    """A date from a datetime.date or an ISO date text"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(value)
+
+
+def read_archive(
+    path: str = None,
+    columns: list = None,
+    start=None,
+    end=None,
+    stores: list = None,
+    search_terms: list = None,
+    filter=None,
+) -> pd.DataFrame:
+    """
+    Read the archived prices that match the filters.
+
+    The filters are pushed down to the dataset: the partitions of other dates and
+    stores are not opened, and the row groups whose statistics can not match are
+    skipped.
+
+    Parameters
+    ----------
+    path : str
+        (optional) Directory of the archive, by default ARCHIVE_DIR.
+
+    columns : list
+        (optional) The columns to read, by default all of them.
+
+    start, end : datetime.date or str
+        (optional) First and last date (inclusive) to read, e.g. "2023-01-16".
+
+    stores : list
+        (optional) Names of the stores to read.
+
+    search_terms : list
+        (optional) Search terms to read.
+
+    filter : pyarrow.dataset.Expression
+        (optional) Any other filter, e.g. ds.field("product_price_dollar") < 2.
+
+    Returns
+    -------
+    pd.DataFrame :
+        The archived rows, with store, search_term and currency as categories. An
+        empty DataFrame if the archive does not exist.
+    """
+    import pyarrow.dataset as ds
+
+    path = path or ARCHIVE_DIR
+    schema, partitions = _schema()
+    if not os.path.isdir(path):
+        return pd.DataFrame(columns=columns or schema.names)
+
+    dataset = ds.dataset(
+        path,
+        schema=schema,
+        format="parquet",
+        partitioning=ds.partitioning(partitions, flavor="hive"),
+    )
+
+    conditions = []
+    if start is not None:
+        conditions.append(ds.field("date") >= _as_date(start))
+    if end is not None:
+        conditions.append(ds.field("date") <= _as_date(end))
+    if stores is not None:
+        conditions.append(ds.field("store").isin(stores))
+    if search_terms is not None:
+        conditions.append(ds.field("search_term").isin(search_terms))
+    if filter is not None:
+        conditions.append(filter)
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    data = dataset.to_table(columns=columns, filter=expression).to_pandas()
+    for column in CATEGORICAL_COLUMNS:
+        if column in data.columns:
+            data[column] = data[column].astype("category")
+    return data
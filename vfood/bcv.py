@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+The official exchange rate $/Bs of the BCV (Banco Central de Venezuela).
+
+This module is kept light: the exchange job imports it without the scraping
+modules of data.py (pandas, regex, the store parsers). The HTML parser is only
+imported when the BCV page is scraped.
+"""
+
+import math
+import os
+from datetime import datetime
+
+from requests.exceptions import HTTPError  # For error handling
+from requests.exceptions import ConnectionError as RequestConnectionError  # For error handling
+from requests.exceptions import Timeout  # For error handling
+
+from cache import ExchangeRateProvider
+from fetch import fetch_html
+from resilience import CircuitOpenError  # For error handling
+
+
+def bcv_exchange_rate() -> dict:
+    """Get the Exchange Rate $/Bs from BCV.
+
+    Returns
+    -------
+    dict :
+        A dictionary with the current date; the exchange rate as float, and the source
+        of the data (BCV).
+    """
+    from parsers import parse_html, select_texts
+
+    url = "http://www.bcv.org.ve/"
+
+    #Create the default information
+    data_output = {
+        #"date": date.today().strftime("%d/%m/%Y "),  # Current date
+        "date":datetime.now(),#.strftime("%Y-%m-%d %H:%M:%S"),
+        "exchange_rate": math.nan,
+        "exchange": "Bs./$",
+        "source": "BCV",
+    }
+    # When a error is raise when loading the page, return a Nan in the exchange Rate
+    try:
+        html = fetch_html(url)  # Url of the Central Bank of Venezuela
+    except CircuitOpenError as e:
+        print(f"{e}, skipping {url}")
+        return data_output
+    except HTTPError as e:
+        print("HTTPError")
+        print("The Exception raised was:")
+        print(e)
+        return data_output
+    except Timeout:
+        print(f"{url} took too long to answer!")
+        return data_output
+    except RequestConnectionError:
+        print("The server could not be found!")
+        return data_output
+    except Exception as e:
+        print(f"Something unexpected happen trying opening {url}")
+        print("The Exception raised was:")
+        print(e)
+        return data_output
+    else:
+
+        # Scrap the exchange Rate of $ to BS
+        doc = parse_html(html, only={"id": "dolar"})
+        dollar_boc = select_texts(doc, "#dolar div.col-sm-6.col-xs-6.centrado")[0]
+
+        # Convert the exchange rate text to a float
+        dollar_text = dollar_boc.strip().replace(".", "").replace(",", ".")
+        exchange_rate = float(dollar_text)
+        assert isinstance(exchange_rate,float),"exchange_rate must be float"
+
+        # Update exchange rate dictionary
+        data_output.update({"exchange_rate": exchange_rate})
+        assert isinstance(data_output,dict), "data_output must be a dict object"
+    return data_output
+
+
+# BCV exchange rate shared by every consumer of a run, fetched at most once per ttl
+BCV_RATE = ExchangeRateProvider(
+    bcv_exchange_rate, "bcv", ttl=float(os.getenv("VFOOD_RATE_TTL", 3600))
+)
+
+
+def get_exchange_rate(fallback: bool = False) -> dict:
+    """Get the Exchange Rate $/Bs from BCV, from the cache when it is fresh.
+
+    Parameters
+    ----------
+    fallback : bool
+        True to get the last known good rate when the BCV page can not be scraped.
+
+    Returns
+    -------
+    dict :
+        The same dictionary as bcv_exchange_rate.
+    """
+    return BCV_RATE.get(fallback=fallback)
@@ -0,0 +1,417 @@
+# -*- coding: utf-8 -*-
+"""
+Caches shared by a run.
+
+The files of the caches are saved in VFOOD_CACHE_DIR (by default .vfood_cache in
+the working directory), so they are also shared between runs. The entries not
+used for VFOOD_CACHE_MAX_DAYS days are pruned at the start of a run.
+"""
+
+import glob
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime
+
+CACHE_DIR = os.getenv("VFOOD_CACHE_DIR", os.path.join(os.getcwd(), ".vfood_cache"))
+
+# Days an entry of the on disk caches is kept without being used, 0 to keep them forever
+CACHE_MAX_DAYS = float(os.getenv("VFOOD_CACHE_MAX_DAYS", 30))
+
+
+def cache_path(*names: str) -> str:
+    """Path to a file (or directory) inside the cache directory, creating its parent.
+
+    Parameters
+    ----------
+    *names : str
+        The parts of the path, relative to CACHE_DIR.
+
+    Returns
+    -------
+    str :
+        The absolute path.
+    """
+    path = os.path.join(CACHE_DIR, *names)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def write_atomic(path: str, content: bytes):
+    """Write a file so that readers never see it half written.
+
+    Parameters
+    ----------
+    path : str
+        Path of the file.
+
+    content : bytes
+        The content of the file.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as tmp_file:
+        tmp_file.write(content)
+    os.replace(tmp_path, path)
+
+
+def _older_files(directory: str, pattern: str, max_days: float) -> list:
+    """The files of a cache directory (and its subdirectories) modified more than max_days ago"""
+    if max_days <= 0 or not os.path.isdir(directory):
+        return []
+    cutoff = time.time() - max_days * 86400
+    older = []
+    for path in glob.glob(os.path.join(directory, "**", pattern), recursive=True):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                older.append(path)
+        except OSError:  # Removed by another process
+            continue
+    return older
+
+
+def _remove(path: str):
+    """Remove a file of a cache, if it still exists"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class ExchangeRateProvider:
+    """Cache the exchange rate of a source in memory and on disk for ttl seconds.
+
+    Every consumer of a run gets the same rate, and the source is only fetched
+    again when the cached rate is older than ttl. The date of the rate (when it
+    was scraped) is kept as it was.
+
+    Parameters
+    ----------
+    fetch : callable
+        Function without arguments that returns the exchange rate dict (with the
+        keys date, exchange_rate, exchange and source), e.g. bcv.bcv_exchange_rate.
+        If it raises, the rate is NaN.
+
+    name : str
+        Name of the cache file, and the source of the NaN rate when fetch raises.
+
+    ttl : float
+        Seconds the rate is valid.
+    """
+
+    def __init__(self, fetch, name: str, ttl: float = 3600):
+        self.fetch = fetch
+        self.name = name
+        self.ttl = ttl
+        self.path = os.path.join(CACHE_DIR, "exchange_rate", f"{name}.json")
+        self._entry = None  # {"cached_at": float, "data": dict}
+        self._lock = threading.Lock()
+
+    def _read_disk(self) -> dict:
+        """The entry saved on disk, None if there is no one"""
+        try:
+            with open(self.path, "r") as cache_file:
+                entry = json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+        entry["data"]["date"] = datetime.fromisoformat(entry["data"]["date"])
+        return entry
+
+    def _write_disk(self, entry: dict):
+        """Save an entry on disk"""
+        data = dict(entry["data"], date=entry["data"]["date"].isoformat())
+        content = json.dumps({"cached_at": entry["cached_at"], "data": data})
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        write_atomic(self.path, content.encode("utf-8"))
+
+    def _is_fresh(self, entry: dict) -> bool:
+        """True if the entry is younger than ttl"""
+        return entry is not None and time.time() - entry["cached_at"] < self.ttl
+
+    def _fetch(self) -> dict:
+        """Fetch the rate from the source, a NaN rate if the source raises"""
+        try:
+            return self.fetch()
+        except Exception as e:
+            print(f"The {self.name} exchange rate could not be fetched: {e!r}")
+            return {
+                "date": datetime.now(),
+                "exchange_rate": math.nan,
+                "exchange": "Bs./$",
+                "source": self.name,
+            }
+
+    def get(self, fallback: bool = False) -> dict:
+        """Get the exchange rate, from the cache when it is fresh.
+
+        Parameters
+        ----------
+        fallback : bool
+            True to return the last known good rate (even if it is older than ttl)
+            when the source fails (its rate is NaN or it raises).
+
+        Returns
+        -------
+        dict :
+            A copy of the exchange rate dict, so consumers can change it.
+        """
+        with self._lock:
+            if not self._is_fresh(self._entry):
+                disk_entry = self._read_disk()
+                if self._is_fresh(disk_entry):
+                    self._entry = disk_entry
+                else:
+                    data = self._fetch()
+                    if not math.isnan(data["exchange_rate"]):
+                        self._entry = {"cached_at": time.time(), "data": data}
+                        self._write_disk(self._entry)
+                    else:
+                        last_good = self._entry or disk_entry
+                        if fallback and last_good is not None:
+                            print(
+                                f"Using the last known {data['source']} exchange rate from {last_good['data']['date']}"
+                            )
+                            return dict(last_good["data"])
+                        return dict(data)
+
+            return dict(self._entry["data"])
+
+    def clear(self):
+        """Forget the cached rate, in memory and on disk."""
+        with self._lock:
+            self._entry = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+class HTTPCache:
+    """On disk cache of the bodies of the pages, keyed by url.
+
+    The validators of each page (ETag and Last-Modified) are saved with its body,
+    so the next request of the page can be conditional: when the page did not
+    change the server answers 304 and the body is read from the cache.
+
+    Parameters
+    ----------
+    max_age : float
+        Seconds a cached page is used without asking the server, 0 to always
+        revalidate it.
+    """
+
+    def __init__(self, max_age: float = 0):
+        self.max_age = max_age
+        self.directory = os.path.join(CACHE_DIR, "http")
+        self.counters = {"hits": 0, "revalidated": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    def _path(self, url: str, extension: str) -> str:
+        """Path of the file of a url in the cache"""
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, key[:2], f"{key}.{extension}")
+
+    def count(self, counter: str):
+        """Add one to a counter (hits, revalidated or misses)."""
+        with self._lock:
+            self.counters[counter] += 1
+
+    def stats(self) -> dict:
+        """Get a copy of the counters of the cache."""
+        with self._lock:
+            return dict(self.counters)
+
+    def get(self, url: str) -> dict:
+        """Get the cached page of a url.
+
+        Parameters
+        ----------
+        url : str
+            Url of the page.
+
+        Returns
+        -------
+        dict :
+            The body, etag, last_modified, and stored_at (time.time()) of the page,
+            None if the url is not cached.
+        """
+        try:
+            with open(self._path(url, "json"), "r") as meta_file:
+                entry = json.load(meta_file)
+            with open(self._path(url, "body"), "rb") as body_file:
+                entry["body"] = body_file.read()
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def is_fresh(self, entry: dict) -> bool:
+        """True if the page can be used without asking the server"""
+        return self.max_age > 0 and time.time() - entry["stored_at"] < self.max_age
+
+    def conditional_headers(self, entry: dict) -> dict:
+        """The headers to revalidate a cached page"""
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def put(self, url: str, body: bytes, etag: str = None, last_modified: str = None):
+        """Save a page in the cache.
+
+        Parameters
+        ----------
+        url : str
+            Url of the page.
+
+        body : bytes
+            The body of the page.
+
+        etag, last_modified : str
+            The ETag and Last-Modified headers of the response.
+        """
+        meta_path = self._path(url, "json")
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        write_atomic(self._path(url, "body"), body)
+        meta = {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "stored_at": time.time(),
+        }
+        write_atomic(meta_path, json.dumps(meta).encode("utf-8"))
+
+    def touch(self, url: str, entry: dict):
+        """Mark a cached page as just revalidated."""
+        meta = {key: value for key, value in entry.items() if key != "body"}
+        meta["stored_at"] = time.time()
+        write_atomic(self._path(url, "json"), json.dumps(meta).encode("utf-8"))
+
+    def prune(self, max_days: float = None) -> int:
+        """Remove the pages not stored nor revalidated in the last max_days days.
+
+        Parameters
+        ----------
+        max_days : float
+            (optional) Age in days of the pages removed, by default CACHE_MAX_DAYS.
+            0 keeps every page.
+
+        Returns
+        -------
+        int :
+            The number of pages removed.
+        """
+        max_days = CACHE_MAX_DAYS if max_days is None else max_days
+        older = _older_files(self.directory, "*.json", max_days)
+        for meta_path in older:
+            _remove(os.path.splitext(meta_path)[0] + ".body")
+            _remove(meta_path)
+        return len(older)
+
+
+def content_key(content: bytes, *parts: str) -> str:
+    """Hash of the content of a page and the parts that change how it is parsed.
+
+    Parameters
+    ----------
+    content : bytes
+        The body of the page.
+
+    *parts : str
+        Extra texts of the key, e.g. the url and the selectors used.
+
+    Returns
+    -------
+    str :
+        The sha256 hexdigest.
+    """
+    digest = hashlib.sha256(content)
+    for part in parts:
+        digest.update(b"\0" + part.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ParsedCache:
+    """On disk store of the data extracted from a page, keyed by a content_key.
+
+    When a page is byte identical to one parsed before (e.g. yesterday), the data
+    extracted from it is reused and the page is not parsed again.
+    """
+
+    def __init__(self):
+        self.directory = os.path.join(CACHE_DIR, "parsed")
+        self.counters = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        """Path of the file of a key in the store"""
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def stats(self) -> dict:
+        """Get a copy of the counters of the store."""
+        with self._lock:
+            return dict(self.counters)
+
+    def get(self, key: str):
+        """Get the data extracted from a page.
+
+        Parameters
+        ----------
+        key : str
+            The content_key of the page.
+
+        Returns
+        -------
+        The saved data, None if the page was not parsed before.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "r") as parsed_file:
+                data = json.load(parsed_file)
+            os.utime(path)  # Used now, so it is not pruned
+        except (OSError, ValueError):
+            data = None
+        with self._lock:
+            self.counters["misses" if data is None else "hits"] += 1
+        return data
+
+    def put(self, key: str, data):
+        """Save the data extracted from a page.
+
+        Parameters
+        ----------
+        key : str
+            The content_key of the page.
+
+        data :
+            Data that can be saved as JSON.
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_atomic(path, json.dumps(data).encode("utf-8"))
+
+    def prune(self, max_days: float = None) -> int:
+        """Remove the pages not parsed nor reused in the last max_days days.
+
+        Parameters
+        ----------
+        max_days : float
+            (optional) Age in days of the pages removed, by default CACHE_MAX_DAYS.
+            0 keeps every page.
+
+        Returns
+        -------
+        int :
+            The number of pages removed.
+        """
+        max_days = CACHE_MAX_DAYS if max_days is None else max_days
+        older = _older_files(self.directory, "*.json", max_days)
+        for path in older:
+            _remove(path)
+        return len(older)
+
+
+# Data extracted from pages already parsed, set VFOOD_PARSED_CACHE=0 to turn it off
+PARSED_CACHE_ENABLED = os.getenv("VFOOD_PARSED_CACHE", "1") != "0"
+PARSED_CACHE = ParsedCache()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Checkpoint journal of a scraping run.
+
+Every result page scraped (a unit: store, search term, and page number) is
+appended to a JSON Lines journal with its products and the links of the other
+result pages. When a run dies partway, the run can be resumed: the completed
+units are read back from the journal and only the missing ones are scraped.
+
+The journal of each day is saved in VFOOD_CACHE_DIR/runs/<date>.jsonl.
+"""
+
+import json
+import os
+import threading
+from datetime import date
+
+from cache import cache_path
+
+
+def journal_path(run_date: date = None) -> str:
+    """Path of the journal of the run of a day (by default today)."""
+    run_date = run_date or date.today()
+    return cache_path("runs", f"{run_date.isoformat()}.jsonl")
+
+
+class RunJournal:
+    """Append-only journal of the pages completed by a run.
+
+    Parameters
+    ----------
+    path : str
+        (optional) Path of the journal, by default journal_path().
+
+    resume : bool
+        True to keep the units completed by a previous run of the journal, False
+        to start it again.
+    """
+
+    def __init__(self, path: str = None, resume: bool = False):
+        self.path = path or journal_path()
+        self._units = {}
+        self._lock = threading.Lock()
+
+        if resume:
+            self._read()
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _read(self):
+        """Load the units of the journal, removing a last line half written
+
+        The half written line is cut from the file, otherwise the next unit recorded
+        would be appended to it and lost too.
+        """
+        try:
+            with open(self.path, "rb+") as journal_file:
+                complete = 0  # Bytes of the complete lines
+                for line in journal_file:
+                    if not line.endswith(b"\n"):
+                        journal_file.truncate(complete)
+                        break
+                    complete += len(line)
+                    try:
+                        unit = json.loads(line)
+                    except ValueError:
+                        continue
+                    key = (unit["store"], unit["search_term"], unit["page"])
+                    self._units[key] = unit
+        except OSError:
+            pass
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._units)
+
+    def get(self, store_name: str, search_term: str, page: int) -> dict:
+        """Get a completed unit.
+
+        Parameters
+        ----------
+        store_name : str
+            The name of the store.
+
+        search_term : str
+            The name of the product use in the search.
+
+        page : int
+            The number of the result page, 1 for the search page.
+
+        Returns
+        -------
+        dict :
+            The products and links of the page, None if the unit was not completed.
+        """
+        with self._lock:
+            return self._units.get((store_name, search_term, page))
+
+    def record(
+        self,
+        store_name: str,
+        search_term: str,
+        page: int,
+        products: list,
+        links: list = None,
+    ):
+        """Record a completed unit, flushed to disk before returning.
+
+        Parameters
+        ----------
+        store_name : str
+            The name of the store.
+
+        search_term : str
+            The name of the product use in the search.
+
+        page : int
+            The number of the result page, 1 for the search page.
+
+        products : list
+            The name, price, and availability of every product of the page.
+
+        links : list
+            (optional) The links of the other result pages, for the search page.
+        """
+        unit = {
+            "store": store_name,
+            "search_term": search_term,
+            "page": page,
+            "rows": len(products),
+            "products": products,
+            "links": links or [],
+        }
+        line = json.dumps(unit) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as journal_file:
+                journal_file.write(line)
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+            self._units[(store_name, search_term, page)] = unit
@@ -7,33 +7,78 @@ Created on Wed Dec 15 13:57:22 2021
 This is the module for collecting information of food prices.
 """
 
-import time
-
 # Web Scraping libraries
-from urllib.request import urlopen
-from bs4 import BeautifulSoup
-from urllib.error import HTTPError  # For error handling
-from urllib.error import URLError  # For error handling
+from requests.exceptions import HTTPError  # For error handling
+from requests.exceptions import ConnectionError as RequestConnectionError  # For error handling
+from requests.exceptions import Timeout  # For error handling
+from resilience import CircuitOpenError  # For error handling
+
+from fetch import cache_stats, fetch_html, prune_cache, set_rate_limit
+from parsers import parse_html
 
 # Data manipulation libraries
 import pandas as pd
 import regex as re
+import re as std_re  # The pandas .str methods only take patterns compiled by re
 import numpy as np
 
 # Miscellaneous
+import functools
+import json
+import unicodedata
 from datetime import date  # For getting the Date
-from datetime import datetime
-import http.client  # For establishing the number of header
 
 
 # Import utility functions
-from scrape import (
-    collect_data_global,
-    gama_get_products,
-    central_m_get_product,
-)
+from scrape import clean_prices, get_store_products, get_page_links
+from engine import run_searches
+from stores import load_stores, store_limits
+from bcv import BCV_RATE, bcv_exchange_rate, get_exchange_rate  # noqa: F401, re-exported, see bcv.py
+from cache import PARSED_CACHE, PARSED_CACHE_ENABLED, content_key
+from metrics import METRICS
+
+
+# Compact dtypes of the scraped frames, the repeated texts are categories
+SCRAPED_DTYPES = {
+    "product_availability": "boolean",
+    "store": "category",
+    "search_term": "category",
+    "product_price_dollar": "float32",
+}
+
+
+def parse_dates(dates: pd.Series) -> pd.Series:
+    """The dates of the scraped data as datetime64, from texts with the %d/%m/%Y format if needed."""
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return dates
+    return pd.to_datetime(dates, format="%d/%m/%Y")
+
 
-http.client._MAXHEADERS = 1000  # Set the limit of headers, more than this will raise an error when using urlopen()
+def compact_frame(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Give the scraped data the compact schema, see SCRAPED_DTYPES.
+
+    The date is a datetime64 instead of a %d/%m/%Y text, store and search_term are
+    categories (one code per row instead of a repeated text), the availability is
+    boolean, and the price in dollars is a float32. Frames with the shape of
+    test_data.csv take a fraction of the memory.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Scraped data, only the columns it has are converted.
+
+    Returns
+    -------
+    pd.DataFrame :
+        The same DataFrame with the compact dtypes.
+    """
+    if "date" in data.columns:
+        data["date"] = parse_dates(data["date"])
+    dtypes = {
+        column: dtype for column, dtype in SCRAPED_DTYPES.items() if column in data.columns
+    }
+    return data.astype(dtypes)
 
 
 def add_general_columns(
@@ -55,403 +100,393 @@ def add_general_columns(
     Returns
     -------
     pd.DataFrame :
-        A pandas Data Frame with a column with the column date (with the value of the current
-        date with %d/%m/%Y format), store_name, and
-        search_term.
+        A pandas Data Frame with a column with the column date (the current date as
+        datetime64), store_name, and search_term (both categories).
     """
     assert isinstance(data, pd.DataFrame), f"data must be a pandas DataFrame object"
 
-    data["date"] = date.today().strftime("%d/%m/%Y")
-    data["store"] = store_name
-    data["search_term"] = search_term
+    data["date"] = pd.Series(pd.Timestamp(date.today()), index=data.index)
+    data["store"] = pd.Series(store_name, index=data.index, dtype="category")
+    data["search_term"] = pd.Series(search_term, index=data.index, dtype="category")
 
     assert isinstance(data, pd.DataFrame), f"data must be a pandas DataFrame object"
     return data
 
 
-def bcv_exchange_rate() -> dict:
-    """Get the Exchange Rate $/Bs from BCV.
+def get_store_page(url: str) -> bytes:
+    """
+    Download a page of a store.
+
+    Parameters
+    ----------
+    url : str
+        Url of the page.
 
     Returns
     -------
-    dict :
-        A dictionary with the current date; the exchange rate as float, and the source
-        of the data (BCV).
+    bytes :
+        The html of the page, or None if the page could not be opened.
     """
-    url = "http://www.bcv.org.ve/"
-
-    #Create the default information
-    data_output = {
-        #"date": date.today().strftime("%d/%m/%Y "),  # Current date
-        "date":datetime.now(),#.strftime("%Y-%m-%d %H:%M:%S"),
-        "exchange_rate": np.nan,
-        "exchange": "Bs./$",
-        "source": "BCV",
-    }
-    # When a error is raise when loading the page, return a Nan in the exchange Rate
+    print("Trying url  : " + url)
+
+    # Check for HTTP and URL errors
     try:
-        html = urlopen(url)  # Url of the Central Bank of Venezuela
+        html = fetch_html(url)  # Get the hmtl code
+    except CircuitOpenError as e:
+        print(f"{e}, skipping {url}")
+        return None
     except HTTPError as e:
-        print("HTTPError")
-        print("The Exception raised was:")
         print(e)
-        return data_output 
-    except URLError as e:
+        return None
+    except Timeout:
+        print(f"{url} took too long to answer!")
+        return None
+    except RequestConnectionError:
         print("The server could not be found!")
-        return data_output
+        return None
     except Exception as e:
         print(f"Something unexpected happen trying opening {url}")
         print("The Exception raised was:")
         print(e)
-        return data_output
+        print(" None will be return")
+        return None
     else:
+        print("Html Loaded successfully from " + url)
+        return html
 
-        # Scrap the exchange Rate of $ to BS
-        bs = BeautifulSoup(html.read(), "html.parser")
-        dollar_boc = bs.find(id="dolar").find(
-            "div", {"class": "col-sm-6 col-xs-6 centrado"}
-        )
-
-        # Convert the exchange rate text to a float
-        dollar_text = dollar_boc.get_text().replace(".", "").replace(",", ".")
-        exchange_rate = float(dollar_text)
-        assert isinstance(exchange_rate,float),"exchange_rate must be float"
-
-        # Update exchange rate dictionary
-        data_output.update({"exchange_rate": exchange_rate})
-        assert isinstance(data_output,dict), "data_output must be a dict object"
-    return data_output
 
-
-def gama_product_search(product: str) -> pd.DataFrame:
+def parse_store_page(html: bytes, url: str, store: dict) -> tuple:
     """
-    Scrape the search results from the Gama supermarket website.
+    Get the products of a page of a store and the links of its other result pages.
+
+    If the same page (same content, url and store configuration) was parsed before,
+    the products and links saved then are used and the page is not parsed again.
 
     Parameters
     ----------
-    product : str
-        The name of the product to look for.
+    html : bytes
+        The html of the page.
+
+    url : str
+        Url of the page.
+
+    store : dict
+        The configuration of the store, from stores.load_stores.
 
     Returns
     -------
-    pd.DataFrame :
-        a DataFrame with information of the product. It has columns for the name
-        the price, availability, date, the store name, and the search_term.
-
+    tuple :
+        The list of products (see scrape.get_store_products) and the list of links
+        of the other result pages (see scrape.get_page_links).
     """
+    key = content_key(html, url, json.dumps(store, sort_keys=True))
+    if PARSED_CACHE_ENABLED:
+        parsed = PARSED_CACHE.get(key)
+        if parsed is not None:
+            print("Page unchanged since it was parsed, reusing its products")
+            return parsed["products"], parsed["links"]
+
+    # Only build the elements with the products and the pagination
+    only = {"class_": store["parse_only"]} if store["parse_only"] else None
+    doc = parse_html(html, only=only)
+
+    products = get_store_products(doc, store)
+    links = get_page_links(doc, store, url)
+    if PARSED_CACHE_ENABLED:
+        PARSED_CACHE.put(key, {"products": products, "links": links})
+    return products, links
+
+
+def scrape_store_page(
+    store: dict, url: str, search_term: str, page: int, journal=None
+) -> tuple:
+    """
+    Get the products and links of a result page, from the journal of the run if
+    the page was already completed.
 
-    #Prepare product name for the url search
-    product_cl = product.strip()  # Strip white spaces
-    product = re.sub(
-        "\s", "+", product_cl
-    )  # Replace white spaces with plus marker, to make the search valid
+    Parameters
+    ----------
+    store : dict
+        The configuration of the store, from stores.load_stores.
 
-    store_name = "Gama"
-    url = (
-        "https://gamaenlinea.com/search/?text=" + product
-    )  # Url to get the search page of the product
+    url : str
+        Url of the page.
 
-    print("-" * 20)
-    print(f"Searching {product_cl} in {store_name} Supermarket WegPage")
-    print("Trying url  : " + url)
+    search_term : str
+        The name of the product use in the search.
 
-    # Check for HTTP and URL errors
-    try:
-        html = urlopen(url)  # Get the hmtl code
-    except HTTPError as e:
-        print(e)
-        return None
-    except URLError as e:
-        print("The server could not be found!")
-        return None
-    except Exception as e:
-        print(f"Something unexpected happen trying opening {url}")
-        print("The Exception raised was:")
-        print(e)
-        print(" None will be return")
+    page : int
+        The number of the result page, 1 for the search page.
+
+    journal : checkpoint.RunJournal
+        (optional) The journal where the completed pages are recorded.
+
+    Returns
+    -------
+    tuple :
+        The list of products and the list of links of the other result pages (see
+        parse_store_page). None if the page could not be opened.
+    """
+    if journal is not None:
+        unit = journal.get(store["name"], search_term, page)
+        if unit is not None:
+            print(f"Page {page} of {search_term} in {store['name']} already scraped")
+            return unit["products"], unit["links"]
+
+    labels = {"store": store["name"], "search_term": search_term}
+    with METRICS.timer("fetch", **labels):
+        html = get_store_page(url)
+    if html is None:
+        METRICS.count("errors", **labels)
         return None
-    else:
-        bs = BeautifulSoup(
-            html.read(), "html.parser"
-        )  # BeatifulSoup Object to parse the html
-        # products_list = bs.find_all("li",class_="product__list--item")#This class is the one that will let us search if element list
-        products_information = []  # List to save all the products information
-        products_information = products_information + gama_get_products(
-            bs
-        )  # Get the search result of the first search page
-
-        link_list = [url]  # List of link opened
-
-        # Open every page result and get the list of products on it
-        if bs.find("ul", class_="pagination") != None:
-            for page_ref in bs.find("ul", class_="pagination").find_all("a"):
-                url = (
-                    "https://gamaenlinea.com" + page_ref["href"]
-                )  # Link to the new page result
-
-                # Check if the new link was not already open
-                if url not in link_list:
-                    link_list.append(url)  # Update list of link already open
-                    # Check for HTTP and URL errors
-                    try:
-                        html = urlopen(url)  # Get the hmtl code
-                    except HTTPError as e:
-                        print(e)
-                    except URLError as e:
-                        print("The server could not be found!")
-                    else:
-                        bs = BeautifulSoup(
-                            html.read(), "html.parser"
-                        )  # BeatifulSoup Object to parse the html d
-                        new_gama_products = gama_get_products(bs)
-                        assert isinstance(
-                            new_gama_products, list
-                        ), f"The function gama_get_products() was unavailable to make a product list from thi url: {url}"
-                        
-                        # Add the products of the new page
-                        products_information = (
-                            products_information + new_gama_products
-                        )  
-
-        # Convert data to DataFrame format
-        df_data = pd.DataFrame(
-            products_information,
-            columns=["product_name", "product_price", "product_availability"],
-        )  
-        add_general_columns(df_data, store_name, product_cl)
-        assert df_data.shape[1] == 6, f"The DataFrame has extra columns"
-
-        return df_data
 
+    with METRICS.timer("parse", **labels):
+        products, links = parse_store_page(html, url, store)
+    METRICS.count("pages", **labels)
+    METRICS.count("rows", len(products), **labels)
+    if journal is not None:
+        journal.record(store["name"], search_term, page, products, links)
+    return products, links
 
-def central_m_product_search(product: str) -> pd.DataFrame:
+
+def iter_store_pages(store: dict, product: str, journal=None):
     """
-    Scrape the search results from the Central  Madeirense   supermarket website.
+    Scrape the search results of a product from a store of the registry, one
+    result page at a time.
 
     Parameters
     ----------
+    store : dict
+        The configuration of the store, from stores.load_stores.
+
     product : str
-        The name of the product to look up.
+        The name of the product to look for.
 
-    Returns
-    -------
-    df_data : pd.DataFrame
-        a DataFrame with information of the product. It has columns for the name
-        the price, availability, date, the store name, and the search_term.
+    journal : checkpoint.RunJournal
+        (optional) The journal of the run. The pages it has are not scraped again,
+        and the pages scraped are recorded in it.
+
+    Yields
+    ------
+    pd.DataFrame :
+        The products of each result page (with at least one product), with the raw
+        price text and the columns product_name, product_price, product_availability,
+        date, store, and search_term. See clean_store_data.
     """
-    store_name = "Central Madeirense"
+    store_name = store["name"]
 
+    # Prepare product name for the url search
     product_cl = product.strip()  # Strip white spaces
-    product = re.sub(
-        "\s", "+", product_cl
-    )  # Replace white spaces with plus marker, to add it to the url link
-
-    url = f"https://tucentralonline.com/La-Lagunita-44/?count=40&paged=&post_type=product&s={product}&asp_active=1&p_asid=1&p_asp_data=1&current_page_id=143&woo_currency=BSD&qtranslate_lang=0&filters_changed=0&filters_initial=1&asp_gen%5B%5D=title&asp_gen%5B%5D=content&asp_gen%5B%5D=excerpt&customset%5B%5D=product&customset%5B%5D=postt"  # Url to get the search page of the product
+    url = store["search_url"].replace(
+        "{product}", re.sub(r"\s", store["space"], product_cl)
+    )  # Replace white spaces, to make the search valid in the url
 
     print("\n" + "-" * 20)
     print(f"Searching {product_cl} in {store_name} Supermarket WegPage")
 
-    # Check for HTTP and URL errors before opening the search result page
-    try:
-        html = urlopen(url)  # Get the hmtl code
-    except HTTPError as e:
-        print(e)
-        return None
-    except URLError as e:
-        print("The server could not be found!")
-        return None
-    except Exception as e:
-        print(f"Something unexpected happen trying opening {url}")
-        print("The Exception raised was:")
-        print(e)
-        print(" None will be return")
-        return None
-    else:
-        bs = BeautifulSoup(
-            html.read(), "html.parser"
-        )  # BeatifulSoup Object to parse the html
+    search_page = scrape_store_page(store, url, product_cl, 1, journal)
+    if search_page is None:
+        return
+
+    products_information, link_list = search_page  # The search result of the first search page
+    if len(products_information) > 0:
+        yield page_frame(products_information, store_name, product_cl)
 
-        products_information = []  # List to save all the products information
+    # Open every other page result and get the list of products on it
+    for pagination, page_url in enumerate(link_list, start=2):
         print("-------------")
-        print(f"Trying Page 1 of {store_name} search results")
-        products_information.append(
-            central_m_get_product(url)
-        )  # Get the search result of the first search page
-
-        link_list = [url]  # List of link opened
-
-        # , if there are more than one result pages, Get tej data of all of them
-        if len(bs.find_all("a", class_="page-numbers")) > 0:
-            num_pages = bs.find_all("a", class_="page-numbers")[
-                -2
-            ].get_text()  # Ge the number search result pages
-
-            # Creates links for every page result, after the first one and append it to the link list
-            for num in range(2, int(num_pages) + 1):
-                new_link = bs.find("a", class_="page-numbers")["href"].replace(
-                    r"page/2/", r"page/" + str(num) + r"/"
-                )
-                link_list.append(new_link)
-
-            # Open every page result and get the list of products on it
-            for pagination, page_ref in enumerate(link_list, start=2):
-                print("-------------")
-                print(f"Trying Page {pagination} of {store_name} search results")
-                products_information.append(central_m_get_product(page_ref))
-
-        df_data = pd.concat(products_information)
-        df_data = add_general_columns(df_data, store_name, product_cl)
-        assert df_data.shape[1] == 6, f"The DataFrame has extra columns"
-        return df_data
+        print(f"Trying Page {pagination} of {store_name} search results")
+        result_page = scrape_store_page(store, page_url, product_cl, pagination, journal)
+        if result_page is not None:
+            page_products, _ = result_page
+            if len(page_products) > 0:
+                yield page_frame(page_products, store_name, product_cl)
 
 
-def plazas_product_search(product: str) -> pd.DataFrame:
+def page_frame(products_information: list, store_name: str, search_term: str) -> pd.DataFrame:
     """
-    Scrape the search results from the Plazas   supermarket website.
+    Convert the products of a page to DataFrame format.
 
     Parameters
     ----------
-    product : str
-        The name of the product to look up.
+    products_information : list
+        The name, price, and availability of every product of the page.
+
+    store_name : str
+        The name of the store.
+
+    search_term : str
+        The name of the product use in the search.
 
     Returns
     -------
-    df_data : pd.DataFrame
-        a DataFrame with information of the product. It has columns for the name
-        the price, availability, date, the store name, and the search_term.
+    pd.DataFrame :
+        A DataFrame with the columns product_name, product_price, product_availability,
+        date, store, and search_term.
     """
-    # Clean and prep the search term
-    product_cl = product.strip()  # Strip white spaces
-    product = re.sub(
-        "\s", "%20", product_cl
-    )  # Replace white spaces with plus marker, to make the search in the url
+    df_data = pd.DataFrame(
+        products_information,
+        columns=["product_name", "product_price", "product_availability"],
+    )
+    add_general_columns(df_data, store_name, search_term)
+    assert df_data.shape[1] == 6, f"The DataFrame has extra columns"
+    return compact_frame(df_data)
 
-    store_name = "Plazas"
 
-    url = (
-        "https://www.elplazas.com/Products.php?des=" + product
-    )  # Url to get the search page of the product
-    print("\n" + "-" * 20)
-    print(f"Searching {product_cl} in {store_name} Supermarket WegPage")
+def clean_store_data(data: pd.DataFrame, store: dict) -> pd.DataFrame:
+    """
+    Clean the names and prices of the products scraped from a store.
 
-    # Collect raw data from the page result
-    products_data = collect_data_global(
-        url, "div", "Product", "div", "Description", "div", "Price"
-    )
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Products of the store, from iter_store_pages.
 
-    # If the raw data is not empty, clean it
-    if not products_data.empty:
-        print(f"Prepping Data from {store_name} supermarket")
-
-        products_data["product_name"] = products_data[
-            "product_name"
-        ].str.strip()  # Cleans name text
-
-        def clean_price(price_text: str, currency="Bs.") -> str:
-            """Cleans the price text of Plazas supermarket"""
-            if "IVA" in price_text:
-                price_text = price_text.split("IVA")[1]
-
-            price_text = re.sub("\s", "", price_text)
-            price_text = price_text.replace("(E)", "").replace(
-                ",", ""
-            )  # Clean price Tag text
-            price_text = currency + " " + price_text  # Use the corresponding currency
-            return price_text
-
-        products_data["product_price"] = products_data["product_price"].apply(
-            clean_price
-        )  # Cleans price text
-
-        print(f"Data From {store_name} supermarket ready")
-        add_general_columns(
-            products_data, store_name, product_cl
-        )  # Adds date, store name and search term
-        assert products_data.shape[1] == 6, f"The DataFrame has extra columns"
-        return products_data
-    else:
-        return None
+    store : dict
+        The configuration of the store, from stores.load_stores.
 
+    Returns
+    -------
+    pd.DataFrame :
+        The same DataFrame, with the names stripped and the prices with the format
+        "currency amount".
+    """
+    data["product_name"] = data["product_name"].str.strip()
+    data["product_price"] = clean_prices(
+        data["product_price"], store["price"], store["currency"]
+    )
+    return data
 
-def plansuarez_product_search(product: str) -> pd.DataFrame:
+
+def store_product_search(store: dict, product: str) -> pd.DataFrame:
     """
-    Scrape the search results from the Plansuarez   supermarket website.
+    Scrape the search results of a product from a store of the registry.
 
     Parameters
     ----------
+    store : dict
+        The configuration of the store, from stores.load_stores.
+
     product : str
-        The name of the product to look up.
+        The name of the product to look for.
 
     Returns
     -------
-    df_data : pd.DataFrame
+    pd.DataFrame :
         a DataFrame with information of the product. It has columns for the name
-        the price, availability, date, the store name, and the search_term.
+        the price, availability, date, the store name, and the search_term. None
+        if the search page could not be opened or has no products.
     """
+    pages = list(iter_store_pages(store, product))
 
-    # Clean and prepare search term
-    product_cl = product.strip()  # Strip white spaces
-    product = re.sub(
-        "\s", "%20", product_cl
-    )  # Replace white spaces with plus marker, to make the search valid in the url
+    if len(pages) == 0:
+        print(f"0 Products where found in {store['name']}")
+        return None
 
-    store_name = "Plan Suarez"
+    # Clean the names and prices of all the pages at once
+    print(f"Prepping Data from {store['name']} supermarket")
+    with METRICS.timer("clean", store=store["name"], search_term=product.strip()):
+        df_data = clean_store_data(pd.concat(pages, ignore_index=True), store)
 
-    url = f"https://www.plansuarez.com/index.php?route=product/search&search={product}&limit=100"  # Url of the search result page
+    print(f"Data From {store['name']} supermarket ready")
+    return df_data
 
-    print("\n" + "-" * 20)
-    print(f"Searching {product_cl} in {store_name} Supermarket WegPage")
 
-    # Get Raw data from the page result
-    products_data = collect_data_global(
-        url, "div", "product-thumb", "div", "name", "span", "price-normal"
-    )
+@functools.lru_cache(maxsize=None)
+def _registry() -> dict:
+    """The store registry, read once per process for the per store searches"""
+    return load_stores()
 
-    # if the data frame is not empty, clean it
-    if not products_data.empty:
-        print(f"Cleaning Data from {store_name} supermarket")
-        products_data["product_name"] = products_data[
-            "product_name"
-        ].str.strip()  # Clean the name
-
-        products_data["product_price"] = (
-            products_data["product_price"]
-            .replace("Bs.", "Bs. ", regex=True)
-            .replace(",", "", regex=True)
-        )  # Clean the price text
-
-        print(f"Data From {store_name} supermarket ready")
-        add_general_columns(products_data, store_name, product_cl)
-        assert products_data.shape[1] == 6, f"The DataFrame has extra columns"
-        return products_data
-    else:
-        return None
 
+def gama_product_search(product: str) -> pd.DataFrame:
+    """Scrape the search results from the Gama supermarket website, see store_product_search."""
+    return store_product_search(_registry()["Gama"], product)
 
-def scrape_raw_data(products: list) -> pd.DataFrame:
+
+def central_m_product_search(product: str) -> pd.DataFrame:
+    """Scrape the search results from the Central Madeirense supermarket website, see store_product_search."""
+    return store_product_search(_registry()["Central Madeirense"], product)
+
+
+def plazas_product_search(product: str) -> pd.DataFrame:
+    """Scrape the search results from the Plazas supermarket website, see store_product_search."""
+    return store_product_search(_registry()["Plazas"], product)
+
+
+def plansuarez_product_search(product: str) -> pd.DataFrame:
+    """Scrape the search results from the Plan Suarez supermarket website, see store_product_search."""
+    return store_product_search(_registry()["Plan Suarez"], product)
+
+
+def prune_caches():
+    """Remove the entries of the on disk caches not used in VFOOD_CACHE_MAX_DAYS days, see cache.py."""
+    pages = prune_cache()
+    if pages > 0:
+        print(f"{pages} old pages removed from the HTTP cache")
+    parsed = PARSED_CACHE.prune()
+    if parsed > 0:
+        print(f"{parsed} old pages removed from the parsed pages store")
+
+
+def limit_store_requests(registry: dict, limits: dict):
+    """
+    Apply the rate limit of every store to the requests sent to its host.
+
+    Parameters
+    ----------
+    registry : dict
+        The stores, from stores.load_stores.
+
+    limits : dict
+        Store name as key and a dict with max_workers and min_interval as value.
     """
-    Scrape product information from Plaza, Gama, Central Madeirense, and Plan Suarez.
+    for store_name, store in registry.items():
+        set_rate_limit(store["search_url"], limits[store_name]["min_interval"])
+
+
+def scrape_raw_data(
+    products: list, limits: dict = None, stores: list = None
+) -> pd.DataFrame:
+    """
+    Scrape product information from the stores of the registry (Plaza, Gama,
+    Central Madeirense, and Plan Suarez).
+
+    The stores are scraped in parallel, each one with its own concurrency cap
+    and rate limit (max_workers and min_interval in ref_table/stores.toml). The
+    rate limit spaces every request to the store, the result pages included.
 
     Parameters
     ----------
     products : list
         A list of product to search for.
 
+    limits : dict
+        (optional) Store name as key and a dict with max_workers and min_interval
+        as value, to override the limits of the registry.
+
+    stores : list
+        (optional) Names of the stores to scrape, by default all the stores of the
+        registry.
+
     Returns
     -------
     raw_data : pd.DataFrame
         A Pandas Data Frame with the following columns product_name, product_price,
         product_availability, date, store,and search_term.
     """
-    data_list = []
-    for product in products:
-        product = product.lower()
+    registry = load_stores(names=stores)
+    searches = {
+        store_name: functools.partial(store_product_search, store)
+        for store_name, store in registry.items()
+    }
+    limits = {**store_limits(registry), **(limits or {})}
+    limit_store_requests(registry, limits)
+    prune_caches()
 
-        data_list.append(plazas_product_search(product))
-        data_list.append(gama_product_search(product))
-        data_list.append(central_m_product_search(product))
-        data_list.append(plansuarez_product_search(product))
-        time.sleep(3)
+    products = [product.lower() for product in products]
+    data_list = run_searches(searches, products, limits)
+    print(f"HTTP cache: {cache_stats()}")
+    print(f"Parsed pages store: {PARSED_CACHE.stats()}")
 
     # Check if all the data is empty
     if not all(i is None for i in data_list):
@@ -459,21 +494,154 @@ def scrape_raw_data(products: list) -> pd.DataFrame:
         raw_data = pd.concat(data_list).reset_index(drop=True)
         assert raw_data.shape[1] == 6, f"The DataFrame has extra columns"
         print("Raw data extracted")
-        return raw_data
+        return compact_frame(raw_data)  # The categories of the stores are merged
     else:
-        return pd.DataFrame(
-            columns=[
-                "product_name",
-                "product_price",
-                "product_availability",
-                "date",
-                "store",
-                "search_term",
-            ]
+        return compact_frame(
+            pd.DataFrame(
+                {
+                    "product_name": pd.Series(dtype="object"),
+                    "product_price": pd.Series(dtype="object"),
+                    "product_availability": pd.Series(dtype="boolean"),
+                    "date": pd.Series(dtype="datetime64[ns]"),
+                    "store": pd.Series(dtype="object"),
+                    "search_term": pd.Series(dtype="object"),
+                }
+            )
         )
 
 
-def scrape_prep_data(products: list, exchange_rate=None) -> pd.DataFrame:
+def _price_parts(prices: pd.Series) -> tuple:
+    """The Bs. and $ masks (numpy) and the amounts (float Series) of the price texts"""
+    prices = prices.astype("string").str.strip()
+    # The currency is at the start of the price, startswith is much faster than a regex
+    is_bs = prices.str.startswith("Bs.").fillna(False).to_numpy(dtype=bool)
+    is_dollar = prices.str.startswith("$").fillna(False).to_numpy(dtype=bool)
+
+    amounts = (
+        prices.mask(is_bs, prices.str.slice(3)).mask(is_dollar, prices.str.slice(1)).str.strip()
+    )
+    try:
+        amounts = amounts.astype("float64")
+    except (TypeError, ValueError):  # Some amount is not a number
+        amounts = pd.to_numeric(amounts, errors="coerce")
+    return is_bs, is_dollar, amounts
+
+
+def split_prices(prices: pd.Series) -> pd.DataFrame:
+    """
+    Split the price texts in a currency column and a numeric amount column.
+
+    Parameters
+    ----------
+    prices : pd.Series
+        Prices with the format "currency amount", e.g. "Bs. 1234.56" or "$ 2.50".
+        The currency is only looked for at the start of the price.
+
+    Returns
+    -------
+    pd.DataFrame :
+        A DataFrame with the same index as prices and the columns currency ("Bs.",
+        "$", or NaN if the price has no currency) and amount (float, NaN if the
+        amount is not a number).
+    """
+    is_bs, is_dollar, amounts = _price_parts(prices)
+    currency = np.select([is_bs, is_dollar], ["Bs.", "$"], default=None)
+    return pd.DataFrame(
+        {"currency": pd.Series(currency, index=prices.index, dtype="string"), "amount": amounts}
+    )
+
+
+def convert_prices_dollar(prices: pd.Series, rate_bs_dollar: float) -> pd.Series:
+    """
+    Convert the prices to US Dollars using the given exchange rate (Bs.s/$).
+
+    The prices in Bs. are divided by the exchange rate (rounded to 2 decimals) and
+    the prices in $ are kept, all the column at once.
+
+    Parameters
+    ----------
+    prices : pd.Series
+        Prices with the format "currency amount", e.g. "Bs. 1234.56" or "$ 2.50".
+
+    rate_bs_dollar : float
+        The exchange rate (Bs.s/$).
+
+    Returns
+    -------
+    pd.Series :
+        The prices in US Dollars as float, NaN where the price has no currency.
+    """
+    is_bs, is_dollar, amounts = _price_parts(prices)
+    amount = amounts.to_numpy(dtype="float64", na_value=np.nan)
+
+    price_dollar = np.where(
+        is_bs,
+        np.round(amount / rate_bs_dollar, 2),
+        np.where(is_dollar, amount, np.nan),
+    )
+    return pd.Series(price_dollar, index=prices.index, dtype="float")
+
+
+def strip_accents(text: str) -> str:
+    """Remove the accents and diacritics of a text, e.g. "arróz" -> "arroz"."""
+    return unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+
+
+def filter_search_terms(
+    data: pd.DataFrame, accent_insensitive: bool = False
+) -> pd.DataFrame:
+    """
+    Drop the products whose name does not contain their single word search term.
+
+    The search result pages list many unrelated products. When the search term is a
+    single word, only the products whose name contains it (ignoring the case) are
+    kept; products of multi word search terms are all kept. The whole frame is
+    filtered in one pass, with a mask built by search_term group.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Scraped data with the columns product_name and search_term.
+
+    accent_insensitive : bool
+        True to also ignore accents and diacritics, so "ARROZ" matches "arróz".
+
+    Returns
+    -------
+    pd.DataFrame :
+        The related products, with a new index.
+    """
+    names = data["product_name"].astype("string")
+    if accent_insensitive:
+        names = (
+            names.str.normalize("NFKD")
+            .str.encode("ascii", errors="ignore")
+            .str.decode("ascii")
+        )  # Remove accents of all the names at once
+
+    mask = pd.Series(True, index=data.index)
+    for search_term, index in data.groupby(
+        "search_term", sort=False, observed=True
+    ).groups.items():
+        search_term = search_term.strip()
+        if " " in search_term:
+            continue
+        if accent_insensitive:
+            search_term = strip_accents(search_term)
+
+        matcher = std_re.compile(std_re.escape(search_term), std_re.IGNORECASE)
+        mask.loc[index] = names.loc[index].str.contains(matcher).fillna(False)
+
+    return data.loc[mask.to_numpy(dtype=bool)].reset_index(drop=True)
+
+
+def scrape_prep_data(
+    products: list,
+    exchange_rate=None,
+    accent_insensitive: bool = False,
+    limits: dict = None,
+    stores: list = None,
+) -> pd.DataFrame:
     """
     Add a column to show all the prices in us dollars and drop unrelated rows.
 
@@ -484,7 +652,16 @@ def scrape_prep_data(products: list, exchange_rate=None) -> pd.DataFrame:
 
     exchange_rate : float
         (optional) a float number representing the exchange rate ($/Bs).
-        If no value is given, the exchange rate will be scrape from the BCV web page.
+        If no value is given, the cached exchange rate of the BCV web page is used.
+
+    accent_insensitive : bool
+        True to ignore accents when dropping unrelated products, see filter_search_terms.
+
+    limits : dict
+        (optional) Limits of the stores, see scrape_raw_data.
+
+    stores : list
+        (optional) Names of the stores to scrape, by default all the registry.
     Return
     ----------
     pd.DataFrame :
@@ -492,52 +669,26 @@ def scrape_prep_data(products: list, exchange_rate=None) -> pd.DataFrame:
         with out unrelated products and a new column with the price in USA Dollars of
         the product.
     """
-    raw_data = scrape_raw_data(products)  # Get the raw data
+    raw_data = scrape_raw_data(products, limits, stores)  # Get the raw data
     assert raw_data.shape[1] == 6, f"The DataFrame has extra columns"
     if raw_data.shape[0] != 0:
         # If the product is a single, check if the name of the product contains it
-        search_terms = list(raw_data["search_term"].unique())
-        for search_term in search_terms:
-            if not " " in search_term.strip():
-                print(f"{search_term}")
-                condition = raw_data.loc[
-                    raw_data["search_term"] == search_term.lower().strip(),
-                    "product_name",
-                ].str.contains(search_term.strip(), case=False)
-
-                raw_data = raw_data.drop(
-                    raw_data.loc[
-                        raw_data["search_term"] == search_term.lower().strip(), :
-                    ][~condition].index
-                )
-                raw_data = raw_data.reset_index(drop=True)
-
-        # If No exchange rate is given, scrape the current exchange rate according to the BCV
+        with METRICS.timer("filter"):
+            raw_data = filter_search_terms(raw_data, accent_insensitive)
+
+        # If No exchange rate is given, get the current exchange rate according to the BCV
         if exchange_rate == None:
-            rate_bs_dollar = bcv_exchange_rate()["exchange_rate"]
+            rate_bs_dollar = get_exchange_rate(fallback=True)["exchange_rate"]
         else:
             rate_bs_dollar = exchange_rate
 
-        def convert_bs_dollar(price_text: str, rate_bs_dollar: float) -> float:
-            """Converts Bs to US Dollars using the given exchange rate (Bs.s/$), dollar prices are ignore"""
-
-            if "Bs." in price_text:
-                price = float(price_text.replace("Bs.", "").strip())
-                price = round(price / rate_bs_dollar,2)
-                return price
-            elif "$" in price_text:
-                price = float(price_text.replace("$", "").strip())
-                return price
-
         # Make a column for prices in dollars,
-        raw_data["product_price_dollar"] = raw_data["product_price"]
-        raw_data["product_price_dollar"] = (
-            raw_data["product_price_dollar"]
-            .apply(lambda x: convert_bs_dollar(x, rate_bs_dollar))
-            .astype("float")
-        )
+        with METRICS.timer("convert"):
+            raw_data["product_price_dollar"] = convert_prices_dollar(
+                raw_data["product_price"], rate_bs_dollar
+            )
 
-        process_data = raw_data.reset_index(drop=True)
+            process_data = compact_frame(raw_data.reset_index(drop=True))
         assert raw_data.shape[1] == 7, f"The DataFrame has extra columns"
         return process_data
     else:
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+Delta loading of the food prices.
+
+Most products have the same price every day, so instead of the full snapshot of
+each day only the changes are loaded to the delta table (food_delta): the
+products that are new, the ones whose price or availability changed, and the ones
+that vanished from the search results. Every store scraped in a day also gets a
+heartbeat row in the runs table (food_runs), so a day without changes can be told
+apart from a day the store was not scraped.
+
+The full snapshot of a day is the latest delta row of each product up to that day
+(without the vanished ones), for the stores with a heartbeat that day. See
+create_snapshot_view and read_snapshot.
+
+The tables use the columns of the food table (see update_db.prepare_food_data).
+"""
+
+import pandas as pd
+from sqlalchemy import DateTime, bindparam, inspect, text
+
+DELTA_TABLE = "food_delta"
+RUNS_TABLE = "food_runs"
+SNAPSHOT_VIEW = "food_snapshot"
+
+# A product is identified by its store, its search term and its name
+PRODUCT_KEY = ["store_name", "search_term", "name"]
+
+# A product changed when one of these columns changed
+COMPARED_COLUMNS = ["price_label", "availability"]
+
+
+def has_table(engine, table_name: str) -> bool:
+    """True if the table exists in the database."""
+    return inspect(engine).has_table(table_name)
+
+
+def latest_prices(
+    engine, stores: list, before, table_name: str = DELTA_TABLE
+) -> pd.DataFrame:
+    """
+    Get the latest known row of every product of the stores, before a date.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        The engine of the database, see loader.get_engine.
+
+    stores : list
+        Names of the stores.
+
+    before : datetime
+        Only the rows of earlier dates are considered (e.g. the date of the run,
+        so running the same day again compares with the day before).
+
+    table_name : str
+        The name of the delta table.
+
+    Returns
+    -------
+    pd.DataFrame :
+        The latest row (with its change) of every product, empty if the table
+        does not exist.
+    """
+    if not has_table(engine, table_name):
+        return pd.DataFrame(columns=[*PRODUCT_KEY, *COMPARED_COLUMNS, "change"])
+
+    query = text(
+        f"""
+        SELECT * FROM (
+            SELECT d.*, ROW_NUMBER() OVER (
+                PARTITION BY {', '.join(f'd.{key}' for key in PRODUCT_KEY)}
+                ORDER BY d.date_scrapt DESC
+            ) AS latest_rank
+            FROM {table_name} d
+            WHERE d.store_name IN :stores AND d.date_scrapt < :before
+        ) latest
+        WHERE latest_rank = 1
+        """
+    ).bindparams(
+        bindparam("stores", expanding=True), bindparam("before", type_=DateTime())
+    )
+    with engine.connect() as conn:
+        latest = pd.read_sql(
+            query, conn, params={"stores": list(stores), "before": before}
+        )
+    return latest.drop(columns="latest_rank")
+
+
+def price_changes(data: pd.DataFrame, latest: pd.DataFrame) -> pd.DataFrame:
+    """
+    Keep the products that are new or whose price or availability changed.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Scraped products, with the columns of the food table.
+
+    latest : pd.DataFrame
+        The latest known row of the products, see latest_prices.
+
+    Returns
+    -------
+    pd.DataFrame :
+        The new and changed products, with a change column (new or changed).
+    """
+    known = latest.loc[latest["change"] != "vanished", [*PRODUCT_KEY, *COMPARED_COLUMNS]]
+    merged = data.merge(
+        known.astype({"availability": "boolean"}),
+        on=PRODUCT_KEY,
+        how="left",
+        suffixes=("", "_latest"),
+        indicator=True,
+    )
+
+    is_new = (merged["_merge"] == "left_only").to_numpy()
+    differs = pd.Series(False, index=merged.index)
+    for column in COMPARED_COLUMNS:
+        differs |= (
+            merged[column].astype("string") != merged[f"{column}_latest"].astype("string")
+        ).fillna(True)
+    is_changed = ~is_new & differs.to_numpy(dtype=bool)
+
+    changes = data.loc[is_new | is_changed].copy()
+    changes["change"] = pd.Series(is_new, index=data.index)[is_new | is_changed].map(
+        {True: "new", False: "changed"}
+    )
+    return changes
+
+
+def vanished_products(
+    latest: pd.DataFrame, seen: set, search_terms: set, day
+) -> pd.DataFrame:
+    """
+    Get the known products that were not found by the run.
+
+    Parameters
+    ----------
+    latest : pd.DataFrame
+        The latest known row of the products of a store, see latest_prices.
+
+    seen : set
+        The keys (see PRODUCT_KEY) of the products found by the run.
+
+    search_terms : set
+        The search terms scraped by the run, the products of other search terms
+        are not considered.
+
+    day : datetime
+        The date of the run.
+
+    Returns
+    -------
+    pd.DataFrame :
+        The vanished products, with their last known row, the date of the run and
+        the change vanished.
+    """
+    latest = latest.loc[
+        (latest["change"] != "vanished") & latest["search_term"].isin(search_terms)
+    ]
+    keys = pd.Series(list(zip(*(latest[key] for key in PRODUCT_KEY))), index=latest.index)
+    vanished = latest.loc[~keys.isin(seen)].copy()
+    vanished["date_scrapt"] = day
+    vanished["change"] = "vanished"
+    return vanished
+
+
+def delete_day(engine, table_name: str, store_name: str, day):
+    """Delete the rows of a store in a day, e.g. before loading the day again."""
+    if not has_table(engine, table_name):
+        return
+    query = text(
+        f"DELETE FROM {table_name} WHERE store_name = :store AND date_scrapt = :day"
+    ).bindparams(bindparam("day", type_=DateTime()))
+    with engine.begin() as conn:
+        conn.execute(query, {"store": store_name, "day": day})
+
+
+def create_snapshot_view(
+    engine,
+    view_name: str = SNAPSHOT_VIEW,
+    delta_table: str = DELTA_TABLE,
+    runs_table: str = RUNS_TABLE,
+):
+    """
+    Create the view with the full snapshot of every day, from the delta and runs tables.
+
+    The view has the columns snapshot_date, name, price_label, availability,
+    date_scrapt (when the price was last seen changing), store_name, search_term,
+    price_dollar (the one of date_scrapt), and product_id if the delta table has it
+    (see identity.py and migrations.food_product_id).
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        The engine of the database, see loader.get_engine.
+
+    view_name, delta_table, runs_table : str
+        The names of the view and the tables.
+    """
+    partition = ", ".join(f"d.{key}" for key in PRODUCT_KEY)
+    columns = [
+        "name", "price_label", "availability", "date_scrapt",
+        "store_name", "search_term", "price_dollar",
+    ]
+    if "product_id" in {column["name"] for column in inspect(engine).get_columns(delta_table)}:
+        columns.append("product_id")
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            f"""
+            CREATE VIEW {view_name} AS
+            SELECT snapshot_date, {', '.join(columns)}
+            FROM (
+                SELECT r.date_scrapt AS snapshot_date, d.*, ROW_NUMBER() OVER (
+                    PARTITION BY r.date_scrapt, {partition}
+                    ORDER BY d.date_scrapt DESC
+                ) AS latest_rank
+                FROM {runs_table} r
+                JOIN {delta_table} d
+                  ON d.store_name = r.store_name AND d.date_scrapt <= r.date_scrapt
+            ) latest
+            WHERE latest_rank = 1 AND change <> 'vanished'
+            """
+        )
+
+
+def read_snapshot(
+    engine, day, stores: list = None, view_name: str = SNAPSHOT_VIEW
+) -> pd.DataFrame:
+    """
+    Rebuild the full snapshot of the food prices of a day.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        The engine of the database, see loader.get_engine.
+
+    day : datetime
+        The date of the snapshot.
+
+    stores : list
+        (optional) Names of the stores, by default all the stores scraped that day.
+
+    view_name : str
+        The name of the snapshot view, created if it does not exist.
+
+    Returns
+    -------
+    pd.DataFrame :
+        The products of the day as the food table would have them (date_scrapt is
+        the date of the snapshot).
+    """
+    if view_name not in inspect(engine).get_view_names():
+        create_snapshot_view(engine, view_name)
+
+    query = f"SELECT * FROM {view_name} WHERE snapshot_date = :day"
+    params = {"day": pd.Timestamp(day).to_pydatetime()}
+    binds = [bindparam("day", type_=DateTime())]
+    if stores is not None:
+        query += " AND store_name IN :stores"
+        params["stores"] = list(stores)
+        binds.append(bindparam("stores", expanding=True))
+
+    with engine.connect() as conn:
+        snapshot = pd.read_sql(text(query).bindparams(*binds), conn, params=params)
+    snapshot["date_scrapt"] = pd.to_datetime(snapshot.pop("snapshot_date"))
+    return snapshot
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent scraping engine.
+
+Runs the search of every product in every store at the same time. Each store has
+its own pool of workers (concurrency cap), so a slow store does not hold back the
+others. The rate limit of a store is applied to every request sent to its host by
+the fetch layer (see fetch.set_rate_limit), including the requests of the result
+pages, so the pools only decide how many searches run at once.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+# Concurrency cap and minimum seconds between two requests to a store without limits
+DEFAULT_LIMIT = {"max_workers": 1, "min_interval": 3.0}
+
+
+_DONE = object()  # Marks the end of a stream of batches
+
+
+class RateLimiter:
+    """Space the calls made to a host by at least min_interval seconds.
+
+    Parameters
+    ----------
+    min_interval : float
+        Minimum number of seconds between the start of two calls.
+    """
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self._next_call = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Block until the next call is allowed."""
+        with self._lock:
+            now = time.monotonic()
+            call_at = max(self._next_call, now)
+            self._next_call = call_at + self.min_interval
+        if call_at > now:
+            time.sleep(call_at - now)
+
+
+def _make_pools(searches: dict, limits: dict) -> dict:
+    """An executor for every store"""
+    executors = {}
+    for store_name in searches:
+        store_limit = limits.get(store_name, DEFAULT_LIMIT)
+        executors[store_name] = ThreadPoolExecutor(
+            max_workers=store_limit["max_workers"],
+            thread_name_prefix=store_name.replace(" ", "_"),
+        )
+    return executors
+
+
+def run_searches(searches: dict, products: list, limits: dict = None) -> list:
+    """
+    Run every store search for every product concurrently.
+
+    Parameters
+    ----------
+    searches : dict
+        Store name as key and its search function as value. The function receives
+        the product name and returns a DataFrame (or None).
+
+    products : list
+        A list of products to search for.
+
+    limits : dict
+        (optional) Store name as key and a dict with max_workers as value. Stores
+        not listed use DEFAULT_LIMIT.
+
+    Returns
+    -------
+    list :
+        The results of the searches, ordered by product and then by store in the
+        same order of searches, just like the sequential loop.
+    """
+    executors = _make_pools(searches, limits or {})
+
+    try:
+        futures = []
+        for product in products:
+            for store_name, search in searches.items():
+                futures.append(executors[store_name].submit(search, product))
+        results = [future.result() for future in futures]
+    finally:
+        for executor in executors.values():
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    return results
+
+
+def stream_searches(
+    searches: dict, products: list, limits: dict = None, max_pending: int = 16
+):
+    """
+    Run every store search for every product concurrently, and yield the batches
+    of the searches as soon as they are ready.
+
+    The batches wait in a queue of at most max_pending batches, so the searches
+    pause when the consumer is slower than them and the memory stays bounded.
+
+    Parameters
+    ----------
+    searches : dict
+        Store name as key and its search function as value. The function receives
+        the product name and returns an iterable of batches (e.g. a generator of
+        DataFrames, one per result page).
+
+    products : list
+        A list of products to search for.
+
+    limits : dict
+        (optional) Store name as key and a dict with max_workers as value. Stores
+        not listed use DEFAULT_LIMIT.
+
+    max_pending : int
+        Maximum number of batches waiting to be consumed.
+
+    Yields
+    ------
+    The batches of all the searches, in the order they are ready.
+    """
+    executors = _make_pools(searches, limits or {})
+    batches = queue.Queue(maxsize=max_pending)
+    stop = threading.Event()
+
+    def put(item):
+        """Put an item in the queue, unless the consumer stopped"""
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def run_search(search, product):
+        """Run the search and queue its batches"""
+        for batch in search(product):
+            if stop.is_set():
+                return
+            put(batch)
+
+    try:
+        futures = []
+        for product in products:
+            for store_name, search in searches.items():
+                futures.append(executors[store_name].submit(run_search, search, product))
+
+        # Mark the end of the stream when every search is done
+        threading.Thread(
+            target=lambda: (wait(futures), put(_DONE)), daemon=True
+        ).start()
+
+        while True:
+            batch = batches.get()
+            if batch is _DONE:
+                break
+            yield batch
+
+        for future in futures:
+            future.result()  # Raise the errors of the searches
+    finally:
+        stop.set()
+        for executor in executors.values():
+            executor.shutdown(wait=True, cancel_futures=True)
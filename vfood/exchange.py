@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+Exchange rates ($/Bs) from several sources, fetched concurrently.
+
+Every source (the BCV web page, the tweets of an exchange monitor, a local file,
+or a fixed rate for tests) returns the same dict as bcv.bcv_exchange_rate. The
+sources are fetched at the same time, each one with its own timeout, and the
+results are handed over as they arrive, so a slow source does not delay the
+others. The rates are then aggregated in one record (min, median, max, spread).
+
+    rates = fetch_rates(default_sources(), on_result=print)
+    summary = aggregate_rates(rates)
+"""
+
+import json
+import math
+import os
+import queue
+import statistics
+import threading
+import time
+from datetime import datetime
+
+# Seconds a source is waited for, can be set in the .env
+EXCHANGE_TIMEOUT = float(os.getenv("VFOOD_EXCHANGE_TIMEOUT", 60))
+
+
+def failed_rate(source: str) -> dict:
+    """The rate dict of a source that could not be fetched"""
+    return {
+        "date": datetime.now(),
+        "exchange_rate": math.nan,
+        "exchange": "Bs./$",
+        "source": source,
+    }
+
+
+class ExchangeSource:
+    """A source of the exchange rate.
+
+    Subclasses implement fetch().
+
+    Parameters
+    ----------
+    name : str
+        Name of the source, the source of its rates.
+
+    timeout : float
+        (optional) Seconds the source is waited for, by default EXCHANGE_TIMEOUT.
+    """
+
+    def __init__(self, name: str, timeout: float = None):
+        self.name = name
+        self.timeout = EXCHANGE_TIMEOUT if timeout is None else timeout
+
+    def fetch(self) -> dict:
+        """Get the exchange rate, with the keys date, exchange_rate, exchange and source."""
+        raise NotImplementedError
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.name!r})"
+
+
+class BCVSource(ExchangeSource):
+    """The official rate of the BCV web page, through the cache of the run (see bcv.BCV_RATE)."""
+
+    def __init__(self, timeout: float = None):
+        super().__init__("BCV", timeout)
+
+    def fetch(self) -> dict:
+        from bcv import get_exchange_rate
+
+        return get_exchange_rate()
+
+
+class MonitorTweetSource(ExchangeSource):
+    """The rate of the latest tweet of an exchange monitor, see exchange_tw.
+
+    The tweepy client is shared by the process, so its connections are reused.
+
+    Parameters
+    ----------
+    user : str
+        The Twitter user, by default monitordolarvla.
+    """
+
+    def __init__(self, user: str = "monitordolarvla", timeout: float = None):
+        super().__init__(user, timeout)
+
+    def fetch(self) -> dict:
+        from exchange_tw import exchange_from_tw_user
+
+        rate = exchange_from_tw_user(self.name)
+        rate.setdefault("exchange", "Bs./$")
+        return rate
+
+
+class FileSource(ExchangeSource):
+    """A rate saved in a JSON file, e.g. {"exchange_rate": 24.5, "date": "2023-02-01T09:00:00"}.
+
+    Parameters
+    ----------
+    path : str
+        Path to the JSON file.
+
+    name : str
+        (optional) Name of the source, by default the one of the file or its name.
+    """
+
+    def __init__(self, path: str, name: str = None, timeout: float = None):
+        super().__init__(name or os.path.splitext(os.path.basename(path))[0], timeout)
+        self.path = path
+
+    def fetch(self) -> dict:
+        with open(self.path, "r", encoding="utf-8") as rate_file:
+            saved = json.load(rate_file)
+        rate = failed_rate(saved.get("source", self.name))
+        rate["exchange_rate"] = float(saved["exchange_rate"])
+        if "date" in saved:
+            rate["date"] = datetime.fromisoformat(saved["date"])
+        return rate
+
+
+class StaticSource(ExchangeSource):
+    """A fixed rate, e.g. to test without the network.
+
+    Parameters
+    ----------
+    exchange_rate : float
+        The rate returned.
+
+    delay : float
+        Seconds fetch takes, to simulate a slow source.
+    """
+
+    def __init__(
+        self, exchange_rate: float, name: str = "static", delay: float = 0, timeout: float = None
+    ):
+        super().__init__(name, timeout)
+        self.exchange_rate = exchange_rate
+        self.delay = delay
+
+    def fetch(self) -> dict:
+        time.sleep(self.delay)
+        rate = failed_rate(self.name)
+        rate["exchange_rate"] = float(self.exchange_rate)
+        return rate
+
+
+def default_sources() -> list:
+    """The sources of the exchange table: the BCV and the monitordolarvla tweets."""
+    return [BCVSource(), MonitorTweetSource()]
+
+
+def _fetch_source(source: ExchangeSource) -> dict:
+    """Fetch a source, with the failed rate if it raises"""
+    try:
+        rate = source.fetch()
+    except Exception as e:
+        print(f"The exchange rate of {source.name} could not be fetched: {e!r}")
+        return failed_rate(source.name)
+    if not isinstance(rate, dict) or "exchange_rate" not in rate:
+        print(f"The exchange rate of {source.name} has no exchange_rate")
+        return failed_rate(source.name)
+    return rate
+
+
+def fetch_rates(sources: list, on_result=None) -> list:
+    """
+    Fetch the exchange rate of every source at the same time.
+
+    Parameters
+    ----------
+    sources : list
+        The sources, see ExchangeSource.
+
+    on_result : callable
+        (optional) Function called with every rate as soon as it arrives (in this
+        thread), e.g. to load it to the database without waiting for the slower
+        sources.
+
+    Returns
+    -------
+    list :
+        The rate dict of every source, in the order of sources. The rate is NaN for
+        the sources that failed or took longer than their timeout (a source that
+        times out keeps running in a daemon thread, but it is not waited for, not even
+        when the process exits).
+    """
+    if len(sources) == 0:
+        return []
+
+    # Daemon threads, so a source that hangs does not keep the process alive
+    results = queue.Queue()
+    start = time.monotonic()
+    for i, source in enumerate(sources):
+        threading.Thread(
+            target=lambda i, source: results.put((i, _fetch_source(source))),
+            args=(i, source),
+            name=f"vfood-rate-{source.name}",
+            daemon=True,
+        ).start()
+
+    rates = [None] * len(sources)
+    pending = set(range(len(sources)))
+    while pending:
+        deadline = min(sources[i].timeout for i in pending)
+        try:
+            i, rate = results.get(timeout=max(deadline - (time.monotonic() - start), 0))
+        except queue.Empty:
+            now = time.monotonic() - start
+            for i in sorted(i for i in pending if sources[i].timeout <= now):
+                print(f"The exchange rate of {sources[i].name} took longer than {sources[i].timeout:g}s")
+                rates[i] = failed_rate(sources[i].name)
+                pending.discard(i)
+            continue
+        if i not in pending:  # It arrived after its timeout
+            continue
+        pending.discard(i)
+        rates[i] = rate
+        if on_result is not None:
+            on_result(rate)
+    return rates
+
+
+def aggregate_rates(rates: list) -> dict:
+    """
+    Aggregate the rates of several sources in one record.
+
+    Parameters
+    ----------
+    rates : list
+        The rate dicts, see fetch_rates.
+
+    Returns
+    -------
+    dict :
+        The date of the aggregation, the number of sources (with a valid rate), the
+        min, median and max rates, the spread (max - min) and the relative spread
+        (spread / median), NaN when no source has a rate, and the rate of every
+        source.
+    """
+    valid = {
+        rate["source"]: rate["exchange_rate"]
+        for rate in rates
+        if not math.isnan(rate["exchange_rate"])
+    }
+    values = list(valid.values())
+    summary = {
+        "date": datetime.now(),
+        "exchange": "Bs./$",
+        "sources": len(values),
+        "min": math.nan,
+        "median": math.nan,
+        "max": math.nan,
+        "spread": math.nan,
+        "spread_pct": math.nan,
+        "rates": valid,
+    }
+    if values:
+        summary.update(
+            {
+                "min": min(values),
+                "median": statistics.median(values),
+                "max": max(values),
+                "spread": max(values) - min(values),
+            }
+        )
+        summary["spread_pct"] = summary["spread"] / summary["median"] * 100
+    return summary
@@ -2,6 +2,7 @@ import tweepy
 from dotenv import load_dotenv
 import os
 import re
+import threading
 from datetime import datetime
 from dateutil import tz
 
@@ -20,6 +21,22 @@ def create_tw_client():
     client = tweepy.Client(BEARER_TOKEN)
     return(client)
 
+_client = None
+_client_lock = threading.Lock()
+
+def get_tw_client():
+    """Get the tweepy.Client shared by the process, created the first time
+
+    Returns :
+    ---------
+    tweepy.Client
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = create_tw_client()
+    return _client
+
 def get_recent_tweets(user:str,num_tw=10)->tweepy.Response :
     """Get the last tweets from a user
     
@@ -37,7 +54,7 @@ def get_recent_tweets(user:str,num_tw=10)->tweepy.Response :
         The fields in responses from Twitter’s API.
     
     """
-    client = create_tw_client()
+    client = get_tw_client() #Reused, so its connections are kept between calls
     query = f'from:{user}'
 
     tweets = client.search_recent_tweets(query=query, tweet_fields=['text', 'created_at'], max_results=num_tw)
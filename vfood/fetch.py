@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Shared fetch layer for all the scrapers.
+
+Every page is downloaded through one requests.Session, that keeps a pool of
+keep-alive connections per host (so a store pays the TCP connection and TLS
+handshake once per run), decodes gzip/brotli responses, and never waits on a
+store longer than the configured connect and read timeouts.
+
+Every request to a host waits for the rate limit of the host (see
+set_rate_limit), so the result pages of a search are spaced like the searches.
+
+Failed requests are retried with exponential backoff and jitter, and a host that
+keeps failing is skipped by its circuit breaker (see resilience.py).
+
+The pages are kept in an on disk HTTP cache and requested again with
+If-None-Match/If-Modified-Since, so a page that did not change costs a 304
+instead of the full page.
+
+While a replay server runs (see replay.py) the requests are sent to it instead of
+the live web pages.
+"""
+
+import os
+import threading
+from urllib.parse import quote, urlsplit
+import http.client  # For establishing the number of header
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cache import HTTPCache
+from engine import RateLimiter
+from metrics import METRICS
+from resilience import call_with_retry
+
+http.client._MAXHEADERS = 1000  # Set the limit of headers, more than this will raise an error when opening the page
+
+# Timeouts in seconds, can be set in the .env
+CONNECT_TIMEOUT = float(os.getenv("VFOOD_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.getenv("VFOOD_READ_TIMEOUT", 30))
+
+# Url of a replay server (see replay.py), every request is sent to it when set
+REPLAY_URL = os.getenv("VFOOD_REPLAY_URL")
+
+# Set VFOOD_HTTP_CACHE=0 to turn off the HTTP cache
+HTTP_CACHE_ENABLED = os.getenv("VFOOD_HTTP_CACHE", "1") != "0"
+HTTP_CACHE = HTTPCache(max_age=float(os.getenv("VFOOD_HTTP_MAX_AGE", 0)))
+
+POOL_CONNECTIONS = 8  # Number of hosts with a connection pool
+POOL_MAXSIZE = 8  # Number of keep-alive connections kept for each host
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) vfood",
+    "Connection": "keep-alive",
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+_limiters = {}  # Host: its RateLimiter
+_limiters_lock = threading.Lock()
+
+
+def _accept_encoding() -> str:
+    """Encodings the session can decode, brotli only if a decoder is installed"""
+    try:
+        import brotli  # noqa: F401
+    except ImportError:
+        try:
+            import brotlicffi  # noqa: F401
+        except ImportError:
+            return "gzip, deflate"
+    return "gzip, deflate, br"
+
+
+def get_session() -> requests.Session:
+    """Get the session shared by all the scrapers, create it the first time.
+
+    Returns
+    -------
+    requests.Session :
+        A session with a connection pool for each host.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update(HEADERS)
+            session.headers["Accept-Encoding"] = _accept_encoding()
+            _session = session
+    return _session
+
+
+def close_session():
+    """Close the shared session and all its pooled connections."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def configure(connect_timeout: float = None, read_timeout: float = None):
+    """Change the default timeouts of the fetch layer.
+
+    Parameters
+    ----------
+    connect_timeout : float
+        Seconds to wait for the connection to the server.
+
+    read_timeout : float
+        Seconds to wait between bytes sent by the server.
+    """
+    global CONNECT_TIMEOUT, READ_TIMEOUT
+    if connect_timeout is not None:
+        CONNECT_TIMEOUT = connect_timeout
+    if read_timeout is not None:
+        READ_TIMEOUT = read_timeout
+
+
+def set_rate_limit(url: str, min_interval: float):
+    """Space the requests to the host of a url by at least min_interval seconds.
+
+    Parameters
+    ----------
+    url : str
+        A url of the host, e.g. the search url of a store.
+
+    min_interval : float
+        Minimum number of seconds between the start of two requests to the host.
+    """
+    host = urlsplit(url).netloc
+    with _limiters_lock:
+        if host in _limiters:
+            _limiters[host].min_interval = min_interval
+        else:
+            _limiters[host] = RateLimiter(min_interval)
+
+
+def _wait_rate_limit(url: str):
+    """Block until the host of the url can be requested, hosts without a limit never wait"""
+    limiter = _limiters.get(urlsplit(url).netloc)
+    if limiter is not None:
+        limiter.wait()
+
+
+def _target(url: str) -> str:
+    """The url actually requested, the one of the replay server when there is one"""
+    if REPLAY_URL:
+        return f"{REPLAY_URL.rstrip('/')}/{quote(url, safe='')}"
+    return url
+
+
+def fetch_html(
+    url: str, timeout: tuple = None, use_cache: bool = None, retries: int = None
+) -> bytes:
+    """Download a page using the shared session and the HTTP cache.
+
+    Parameters
+    ----------
+    url : str
+        Url of the page.
+
+    timeout : tuple
+        (optional) The connect and read timeouts, by default CONNECT_TIMEOUT and
+        READ_TIMEOUT.
+
+    use_cache : bool
+        (optional) False to skip the HTTP cache, by default HTTP_CACHE_ENABLED.
+
+    retries : int
+        (optional) Retries of a failed request, by default resilience.RETRIES.
+
+    Returns
+    -------
+    bytes :
+        The decoded body of the page.
+
+    Raises
+    ------
+    resilience.CircuitOpenError
+        If the host failed repeatedly and its circuit breaker is open.
+    requests.exceptions.HTTPError
+        If the server answers with an error status (after the retries for 5xx and 429).
+    requests.exceptions.Timeout
+        If the server takes longer than the timeouts in every attempt.
+    requests.exceptions.ConnectionError
+        If the server could not be reached in any attempt.
+    """
+    if timeout is None:
+        timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+    if use_cache is None:
+        use_cache = HTTP_CACHE_ENABLED
+
+    entry = HTTP_CACHE.get(url) if use_cache else None
+    if entry is not None and HTTP_CACHE.is_fresh(entry):
+        HTTP_CACHE.count("hits")
+        return entry["body"]
+
+    headers = HTTP_CACHE.conditional_headers(entry) if entry is not None else {}
+
+    def request():
+        _wait_rate_limit(url)
+        response = get_session().get(_target(url), timeout=timeout, headers=headers)
+        if not (entry is not None and response.status_code == 304):
+            response.raise_for_status()
+        return response
+
+    response = call_with_retry(request, url, retries)
+    METRICS.count("bytes", len(response.content), host=urlsplit(url).netloc)
+
+    # The page did not change since it was cached
+    if entry is not None and response.status_code == 304:
+        HTTP_CACHE.count("revalidated")
+        HTTP_CACHE.touch(url, entry)
+        return entry["body"]
+
+    if use_cache:
+        HTTP_CACHE.count("misses")
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if etag or last_modified or HTTP_CACHE.max_age > 0:
+            HTTP_CACHE.put(url, response.content, etag, last_modified)
+    return response.content
+
+
+def prune_cache(max_days: float = None) -> int:
+    """Remove the pages of the HTTP cache older than max_days, see cache.HTTPCache.prune."""
+    return HTTP_CACHE.prune(max_days)
+
+
+def cache_stats() -> dict:
+    """Get the hits, revalidated (304) and misses counters of the HTTP cache."""
+    return HTTP_CACHE.stats()
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+Product identity across stores and days.
+
+The same product is listed with slightly different names by every store (and
+sometimes by the same store on different days), e.g. "ARROZ MARY INTEGRAL 800 GR"
+and "Arroz Mary Integral 800Gr". The ProductIndex gives every name a product_id,
+the same for the names of the same product:
+
+1. The name is normalised (no accents, lower case, no punctuation) and its size
+   is extracted and converted to a canonical unit ("1 KG" -> "1000g").
+2. The products are grouped in blocks by their size and the 4 letter prefix of
+   each token, and a name is only compared with the products of its blocks
+   (blocks of very common tokens are skipped), so the matching does not compare
+   every pair of names.
+3. A name is the product whose first name (its leader) is the most similar, if
+   the trigram similarity is over the threshold; otherwise it is a new product.
+
+The ids are saved in VFOOD_CACHE_DIR/product_index.json, so a name keeps its id
+between runs and the new names take the id of the product they match.
+
+    index = ProductIndex()
+    data["product_id"] = index.assign(data["product_name"])
+    index.save()
+"""
+
+import hashlib
+import json
+import os
+from collections import defaultdict
+
+import pandas as pd
+import regex as re
+
+from cache import cache_path, write_atomic
+from data import strip_accents
+
+THRESHOLD = 0.6  # Minimum trigram similarity of two names of the same product
+MAX_BLOCK = 500  # Blocks with more names are too common to tell products apart
+
+STOPWORDS = {"de", "del", "la", "el", "al", "los", "las", "con", "y", "en", "para"}
+
+# Grams, milliliters, or units of each unit
+UNITS = {
+    "kg": (1000, "g"),
+    "kgs": (1000, "g"),
+    "k": (1000, "g"),
+    "g": (1, "g"),
+    "gr": (1, "g"),
+    "grs": (1, "g"),
+    "grm": (1, "g"),
+    "mg": (0.001, "g"),
+    "l": (1000, "ml"),
+    "lt": (1000, "ml"),
+    "lts": (1000, "ml"),
+    "cl": (10, "ml"),
+    "ml": (1, "ml"),
+    "cc": (1, "ml"),
+    "un": (1, "un"),
+    "und": (1, "un"),
+    "unid": (1, "un"),
+    "x": (1, "un"),
+}
+
+SIZE_PATTERN = re.compile(
+    r"\b(?:(?P<count>x)\s*(?P<count_value>\d+)|(?P<value>\d+(?:[.,]\d+)?)\s*(?P<unit>"
+    + "|".join(sorted(UNITS, key=len, reverse=True))
+    + r"))\b"
+)
+
+
+def normalize_name(name: str) -> str:
+    """The name without accents, punctuation and repeated spaces, in lower case."""
+    name = strip_accents(str(name)).lower()
+    return " ".join(re.sub(r"[^\w.,]+|(?<!\d)[.,]|[.,](?!\d)", " ", name).split())
+
+
+def extract_size(name: str) -> tuple:
+    """
+    Get the size of a normalised name.
+
+    Parameters
+    ----------
+    name : str
+        A name normalised with normalize_name.
+
+    Returns
+    -------
+    tuple :
+        The canonical size (e.g. "250g", "1500ml", "30un", "" if the name has no
+        size) and the name without it.
+    """
+    match = SIZE_PATTERN.search(name)
+    if match is None:
+        return "", name
+
+    if match.group("count"):
+        size = f"{int(match.group('count_value'))}un"
+    else:
+        factor, unit = UNITS[match.group("unit")]
+        value = float(match.group("value").replace(",", ".")) * factor
+        size = f"{value:g}{unit}"
+    return size, (name[: match.start()] + " " + name[match.end() :]).strip()
+
+
+def name_features(name: str) -> tuple:
+    """
+    Get the features used to match a name.
+
+    Parameters
+    ----------
+    name : str
+        The name of a product.
+
+    Returns
+    -------
+    tuple :
+        The normalised name, the size (see extract_size), the tokens without stop
+        words, and the set of character trigrams of the tokens.
+    """
+    normalized = normalize_name(name)
+    size, rest = extract_size(normalized)
+    tokens = [token for token in rest.split() if token not in STOPWORDS]
+    text = " " + " ".join(sorted(tokens)) + " "
+    trigrams = {text[i : i + 3] for i in range(len(text) - 2)}
+    return normalized, size, tokens, trigrams
+
+
+def similarity(trigrams_a: set, trigrams_b: set) -> float:
+    """Jaccard similarity of two sets of trigrams"""
+    if not trigrams_a or not trigrams_b:
+        return 0.0
+    common = len(trigrams_a & trigrams_b)
+    return common / (len(trigrams_a) + len(trigrams_b) - common)
+
+
+def new_product_id(normalized: str) -> str:
+    """A product_id derived from the normalised name of a product"""
+    return "p" + hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:12]
+
+
+def _block_keys(size: str, tokens: list) -> set:
+    """The blocks of a name: its size with the prefix of each token"""
+    return {(size, token[:4]) for token in tokens if len(token) >= 3}
+
+
+class ProductIndex:
+    """Index of the product_id of every product name seen.
+
+    Parameters
+    ----------
+    path : str
+        (optional) Path of the saved index, by default
+        VFOOD_CACHE_DIR/product_index.json.
+
+    threshold : float
+        Minimum trigram similarity of two names of the same product.
+    """
+
+    def __init__(self, path: str = None, threshold: float = THRESHOLD):
+        self.path = path or cache_path("product_index.json")
+        self.threshold = threshold
+        self.load()
+
+    def load(self):
+        """Load the saved index (an empty one if there is no one) and block its leaders."""
+        self.ids = {}  # Normalised name: product_id
+        try:
+            with open(self.path, "r", encoding="utf-8") as index_file:
+                self.ids = json.load(index_file)
+        except (OSError, ValueError):
+            pass
+
+        # Every product is represented by its first name (its leader), blocked by its
+        # size and the prefix of its tokens. _match adds the new leaders.
+        self._leaders = {}  # product_id: features of the leader
+        self._blocks = defaultdict(list)  # (size, prefix): product_ids
+        for normalized, product_id in self.ids.items():
+            if product_id not in self._leaders:
+                self._add_leader(product_id, name_features(normalized))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def save(self):
+        """Save the index."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        write_atomic(self.path, json.dumps(self.ids).encode("utf-8"))
+
+    def assign(self, names) -> list:
+        """
+        Get the product_id of every name, matching the new names to the known ones.
+
+        Parameters
+        ----------
+        names : iterable
+            The names of the products, e.g. the product_name column.
+
+        Returns
+        -------
+        list :
+            The product_id of every name, in the same order.
+        """
+        names = list(names)
+        features = {}
+        for name in names:
+            if name not in features:
+                features[name] = name_features(name)
+
+        new_names = {
+            normalized
+            for normalized, _, _, _ in features.values()
+            if normalized not in self.ids
+        }
+        if new_names:
+            self._match(new_names)
+        return [self.ids[features[name][0]] for name in names]
+
+    def _add_leader(self, product_id: str, features: tuple):
+        """Add the leader of a product to its blocks"""
+        _, size, tokens, _ = features
+        self._leaders[product_id] = features
+        for key in _block_keys(size, tokens):
+            self._blocks[key].append(product_id)
+
+    def _match(self, new_names: set):
+        """Give an id to the new normalised names"""
+        for normalized in sorted(new_names):
+            features = name_features(normalized)
+            _, size, tokens, trigrams = features
+
+            # Compare the name only with the leaders of its blocks
+            candidates = set()
+            for key in _block_keys(size, tokens):
+                block = self._blocks.get(key, ())
+                if len(block) <= MAX_BLOCK:
+                    candidates.update(block)
+
+            best_id, best_score = None, self.threshold
+            for product_id in candidates:
+                score = similarity(trigrams, self._leaders[product_id][3])
+                if score >= best_score:
+                    best_id, best_score = product_id, score
+
+            if best_id is None:  # A new product, the name is its leader
+                best_id = new_product_id(normalized)
+                if best_id not in self._leaders:
+                    self._add_leader(best_id, features)
+            self.ids[normalized] = best_id
+
+
+def add_product_ids(data: pd.DataFrame, index: ProductIndex = None) -> pd.DataFrame:
+    """
+    Add a product_id column to scraped data, e.g. the result of data.scrape_prep_data.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Data with a product_name column.
+
+    index : ProductIndex
+        (optional) The index used, by default the saved one (which is updated).
+
+    Returns
+    -------
+    pd.DataFrame :
+        The same DataFrame with the product_id column.
+    """
+    save = index is None
+    if index is None:
+        index = ProductIndex()
+    data["product_id"] = index.assign(data["product_name"])
+    if save:
+        index.save()
+    return data
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk loading of DataFrames to the database.
+
+Each process keeps one pooled engine per database url, and PostgreSQL tables are
+loaded with COPY FROM STDIN from an in-memory CSV buffer, in chunks, instead of
+batches of INSERTs. Other databases (e.g. SQLite, to test without a PostgreSQL
+server) are loaded with the executemany of their driver, through the same
+interface.
+
+Tables with a natural key can be upserted: the rows are staged in a temporary
+table and merged with INSERT ... ON CONFLICT, so loading the same rows twice
+does not duplicate them. A table that does not exist is created from the first
+rows upserted, with the unique index of its key.
+"""
+
+import csv
+import io
+import threading
+
+import pandas as pd
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.exc import IntegrityError
+
+CHUNKSIZE = 50_000  # Rows sent in each COPY (or executemany)
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def db_url(user: str, password: str, host: str, port: str, db_name: str) -> str:
+    """Build the url of a PostgreSQL database.
+
+    Parameters
+    ----------
+    user, password, host, port : str
+        The credentials of the PostgreSQL server.
+
+    db_name : str
+        The name of the Data Base.
+
+    Returns
+    -------
+    str :
+        The SQLAlchemy url of the database.
+    """
+    return f"postgresql://{user}:{password}@{host}:{port}/{db_name}"
+
+
+def get_engine(url: str):
+    """Get the engine of a database, created once per process.
+
+    Parameters
+    ----------
+    url : str
+        The SQLAlchemy url of the database.
+
+    Returns
+    -------
+    sqlalchemy.engine.Engine :
+        An engine with a pool of connections to the database.
+    """
+    with _engines_lock:
+        if url not in _engines:
+            _engines[url] = create_engine(url, pool_pre_ping=True)
+        return _engines[url]
+
+
+def dispose_engines():
+    """Close the connections of all the engines of the process."""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+
+def _quote(name: str) -> str:
+    """Quote a PostgreSQL identifier"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def copy_insert(table, conn, keys: list, data_iter):
+    """Insert the rows of a chunk with PostgreSQL COPY FROM STDIN.
+
+    It has the signature of the method argument of pd.DataFrame.to_sql.
+
+    Parameters
+    ----------
+    table : pandas.io.sql.SQLTable
+        The table where the rows are inserted.
+
+    conn : sqlalchemy.engine.Connection
+        The connection used by to_sql.
+
+    keys : list
+        The names of the columns.
+
+    data_iter : iterable
+        The rows of the chunk.
+    """
+    table_name = _quote(table.name)
+    if table.schema:
+        table_name = _quote(table.schema) + "." + table_name
+
+    _copy_rows(conn.connection, table_name, keys, data_iter)
+
+
+def _copy_rows(dbapi_conn, table_name: str, keys: list, rows):
+    """Send rows to a (quoted) PostgreSQL table with COPY FROM STDIN"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+
+    columns = ", ".join(_quote(key) for key in keys)
+    with dbapi_conn.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer
+        )
+
+
+def drop_missing_columns(data: pd.DataFrame, table_name: str, engine) -> pd.DataFrame:
+    """Drop the columns that an existing table does not have, with a warning.
+
+    E.g. the product_id of the rows, before the table got the column with
+    python vfood migrate food-product-id.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Data to be loaded.
+
+    table_name : str
+        The name of the table.
+
+    engine : sqlalchemy.engine.Engine
+        The engine of the database, see get_engine.
+
+    Returns
+    -------
+    pd.DataFrame :
+        data, without the columns the table does not have.
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table(table_name):
+        return data
+    columns = {column["name"] for column in inspector.get_columns(table_name)}
+    missing = [column for column in data.columns if column not in columns]
+    if missing:
+        print(f"The table {table_name} has no columns {missing}, they are not loaded")
+        data = data.drop(columns=missing)
+    return data
+
+
+def load_dataframe(
+    data: pd.DataFrame, table_name: str, engine, chunksize: int = CHUNKSIZE
+) -> int:
+    """Append a DataFrame to a table, with COPY when the database is PostgreSQL.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Data to be appended. The columns must have the same name as the table,
+        the ones the table does not have are dropped (see drop_missing_columns).
+
+    table_name : str
+        The name of the table.
+
+    engine : sqlalchemy.engine.Engine
+        The engine of the database, see get_engine.
+
+    chunksize : int
+        Rows loaded in each chunk.
+
+    Returns
+    -------
+    int :
+        The number of rows loaded.
+    """
+    data = drop_missing_columns(data, table_name, engine)
+    # executemany in the other databases, multi-row INSERTs are slower in SQLite
+    method = copy_insert if engine.dialect.name == "postgresql" else None
+
+    data.to_sql(
+        table_name,
+        con=engine,
+        if_exists="append",
+        index=False,
+        method=method,
+        chunksize=chunksize,
+    )
+    return data.shape[0]
+
+
+def _records(data: pd.DataFrame) -> list:
+    """The rows of a DataFrame as tuples, with None in the missing values"""
+    return list(
+        data.astype(object).where(data.notna(), None).itertuples(index=False, name=None)
+    )
+
+
+def ensure_unique_key(table_name: str, engine, keys: list):
+    """Create the unique index of the natural key of a table, if it does not exist.
+
+    Parameters
+    ----------
+    table_name : str
+        The name of the table.
+
+    engine : sqlalchemy.engine.Engine
+        The engine of the database, see get_engine.
+
+    keys : list
+        The columns of the natural key.
+
+    Raises
+    ------
+    ValueError
+        If the table has rows duplicated on the key, they are not deleted here
+        (see migrations.dedupe_natural_key).
+    """
+    index_name = f"{table_name}_natural_key"
+    indexes = inspect(engine).get_indexes(table_name)
+    if any(index["name"] == index_name for index in indexes):
+        return
+
+    columns = ", ".join(_quote(key) for key in keys)
+    try:
+        with engine.begin() as conn:
+            conn.exec_driver_sql(
+                f"CREATE UNIQUE INDEX IF NOT EXISTS {_quote(index_name)} "
+                f"ON {_quote(table_name)} ({columns})"
+            )
+    except IntegrityError as e:
+        raise ValueError(
+            f"The table {table_name} has rows duplicated on {keys}, "
+            "remove them with python vfood migrate before upserting"
+        ) from e
+
+
+def upsert_dataframe(
+    data: pd.DataFrame,
+    table_name: str,
+    engine,
+    keys: list,
+    chunksize: int = CHUNKSIZE,
+) -> int:
+    """Insert the new rows of a DataFrame and update the rows whose key already exists.
+
+    The rows are deduplicated on the key, staged in a temporary table (with COPY
+    in PostgreSQL, with to_sql in other databases), and merged into the table with INSERT ... ON CONFLICT, all in
+    one transaction. If the table does not exist, it is created with the columns
+    of data and the unique index of the key.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Data to be upserted. The columns must have the same name as the table,
+        the ones the table does not have are dropped (see drop_missing_columns).
+
+    table_name : str
+        The name of the table.
+
+    engine : sqlalchemy.engine.Engine
+        The engine of the database, see get_engine.
+
+    keys : list
+        The columns of the natural key of the table.
+
+    chunksize : int
+        Rows staged in each chunk.
+
+    Returns
+    -------
+    int :
+        The number of rows upserted (after deduplication).
+    """
+    data = data.drop_duplicates(subset=keys, keep="last")
+    if not inspect(engine).has_table(table_name):
+        data.head(0).to_sql(table_name, con=engine, index=False)
+    data = drop_missing_columns(data, table_name, engine)
+    ensure_unique_key(table_name, engine, keys)
+
+    table = _quote(table_name)
+    stage = _quote(f"stage_{table_name}")
+    columns = ", ".join(_quote(column) for column in data.columns)
+    updates = ", ".join(
+        f"{_quote(column)} = EXCLUDED.{_quote(column)}"
+        for column in data.columns
+        if column not in keys
+    )
+    on_conflict = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            conn.exec_driver_sql(
+                f"CREATE TEMP TABLE {stage} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP"
+            )
+            for start in range(0, data.shape[0], chunksize):
+                _copy_rows(
+                    conn.connection,
+                    stage,
+                    list(data.columns),
+                    _records(data.iloc[start : start + chunksize]),
+                )
+        else:
+            # Stage with pandas, so the values have the same format as in the table
+            data.to_sql(
+                f"stage_{table_name}",
+                con=conn,
+                if_exists="replace",
+                index=False,
+                chunksize=chunksize,
+            )
+
+        # WHERE true avoids the ambiguity of SELECT ... ON CONFLICT in SQLite
+        conn.exec_driver_sql(
+            f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {stage} WHERE true "
+            f"ON CONFLICT ({', '.join(_quote(key) for key in keys)}) {on_conflict}"
+        )
+
+        if engine.dialect.name != "postgresql":
+            conn.exec_driver_sql(f"DROP TABLE {stage}")
+
+    return data.shape[0]
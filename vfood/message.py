@@ -1,17 +1,147 @@
 """
 Functions to send messages
+
+The Telegram messages are sent by a TelegramNotifier in a background thread, so a slow Telegram API
+never blocks the scrape or the load of the DataBase. The messages queued within batch_window seconds
+are sent together in one request, through a reused session, with a timeout.
 """
 import os
+import queue
+import threading
+import atexit
 from dotenv import load_dotenv
 import requests
 from datetime import datetime
 import re
 
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL","https://api.telegram.org") #Can point to a local stub server
+TELEGRAM_TIMEOUT = float(os.getenv("TELEGRAM_TIMEOUT",10)) #Seconds to wait for the Telegram API
+TELEGRAM_MAX_LENGTH = 4096 #Characters allowed in a Telegram message
+
+#Characters escaped for the MarkdownV2 parser (* and _ are kept for bold and italic)
+MARKDOWN_SPECIAL = re.compile(r"([\[\]()>#+\-={}.!])")
+
+_STOP = object() #Queued by close, the thread stops after sending the messages before it
+
+_notifier = None
+_notifier_lock = threading.Lock()
+
+
+class TelegramNotifier:
+    """Send Telegram messages in a background thread.
+
+    Parameters
+    ----------
+    token : str
+        The token of the Telegram bot.
+    chat_id : str
+        The chat where the messages are sent.
+    api_url : str
+        The url of the Telegram Bot API, by default TELEGRAM_API_URL.
+    timeout : float
+        Seconds to wait for the Telegram API, by default TELEGRAM_TIMEOUT.
+    batch_window : float
+        Seconds the notifier waits for more messages to send them together.
+    """
+
+    def __init__(self,token:str,chat_id:str,api_url:str=None,timeout:float=None,batch_window:float=1.0):
+        self.token = token
+        self.chat_id = chat_id
+        self.api_url = (api_url or TELEGRAM_API_URL).rstrip("/")
+        self.timeout = TELEGRAM_TIMEOUT if timeout is None else timeout
+        self.batch_window = batch_window
+        self.session = requests.Session() #Keep-alive connection to the Telegram API
+        self.sent = 0 #Requests sent successfully
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run,name="telegram_notifier",daemon=True)
+        self._thread.start()
+
+    def send(self,message:str,mk:bool=True):
+        """Queue a message, it is sent in the background.
+
+        Parameters
+        ----------
+        message : str
+            The message, already escaped with prep_message_mk if mk is True.
+        mk : bool
+            True to activate MarkdownV2 parser, false otherwise.
+        """
+        assert isinstance(message,str)
+        self._queue.put((message,mk))
+
+    def flush(self):
+        """Wait until every queued message was sent."""
+        self._queue.join()
+
+    def close(self):
+        """Send the queued messages, then stop the thread and close the session."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self.session.close()
+
+    def _batch(self,first:tuple)->tuple:
+        """Join the first message with the ones queued within batch_window with the same parser.
+
+        Returns the text, the parser, the number of messages joined, and the next item (None if there is no one,
+        _STOP if close was called).
+        """
+        messages, mk = [first[0]], first[1]
+        length = len(first[0])
+        while True:
+            try:
+                item = self._queue.get(timeout=self.batch_window)
+            except queue.Empty:
+                return "\n\n".join(messages), mk, len(messages), None
+            if item is _STOP or item[1] != mk or length+2+len(item[0]) > TELEGRAM_MAX_LENGTH:
+                return "\n\n".join(messages), mk, len(messages), item
+            messages.append(item[0])
+            length += 2+len(item[0])
+
+    def _post(self,text:str,mk:bool):
+        """Send one message to the Telegram API"""
+        payload = {"chat_id":self.chat_id,"text":text}
+        if mk:
+            payload["parse_mode"] = "MarkdownV2"
+        try:
+            response = self.session.post(f"{self.api_url}/bot{self.token}/sendMessage",json=payload,timeout=self.timeout)
+            print(response.json())
+            if response.ok:
+                self.sent += 1
+        except Exception as e:
+            print("Error trying to send Telegram message: "+str(e))
+
+    def _run(self):
+        """Send the queued messages until close is called"""
+        item = self._queue.get()
+        while item is not _STOP:
+            text, mk, joined, next_item = self._batch(item)
+            self._post(text,mk)
+            for _ in range(joined):
+                self._queue.task_done()
+            item = next_item if next_item is not None else self._queue.get()
+        self._queue.task_done() #The stop marker
+
+
+def get_notifier()->TelegramNotifier:
+    """Get the notifier shared by the process, created the first time with the credentials of the .env.
+
+    The queued messages are sent before the process exits.
+    """
+    global _notifier
+    with _notifier_lock:
+        if _notifier is None:
+            load_dotenv()
+            _notifier = TelegramNotifier(os.getenv("TELEGRAM_TOKEN"),os.getenv("TELEGRAM_CHAT_ID"))
+            atexit.register(_notifier.close)
+        return _notifier
+
 
 def telegram_message(message:str,mk=True):
     """Send a Telegram message.
     
-    Reads the Bot token  and the chat id of the chat from a .env to send a message to a Telegram user. 
+    Reads the Bot token  and the chat id of the chat from a .env (once per process) to send a message
+    to a Telegram user. The message is sent in the background, see TelegramNotifier.
 
     Parameters
     ----------
@@ -22,22 +152,10 @@ def telegram_message(message:str,mk=True):
     """
     assert isinstance(message,str)
     
-    #Load Telegram bot credentials
-    load_dotenv()
-    TOKEN = os.getenv("TELEGRAM_TOKEN") #Bot token
-    CHAT_ID = os.getenv("TELEGRAM_CHAT_ID") #Chat where the message will be send
-    
     if mk:
         message= prep_message_mk(message)
-        url = f"https://api.telegram.org/bot{TOKEN}/sendMessage?chat_id={CHAT_ID}&text={message}&parse_mode=MarkdownV2"
-    else :
-        url = f"https://api.telegram.org/bot{TOKEN}/sendMessage?chat_id={CHAT_ID}&text={message}"
 
-    assert isinstance(url,str)
-    try:
-        print(requests.get(url).json())
-    except Exception as e:
-        print("Error trying to send Telegram message"+str(Exception))
+    get_notifier().send(message,mk)
 
 def create_message_food(foods:list,*argv)->str:
     """Create the text to be send with the foods from the scraping
@@ -120,12 +238,4 @@ def prep_message_mk(og_txt:str)->str:
     ---------
         Clean string for Telegram Markdown parser.
     """
-    special_chrs = ['\[', '\]', '\(', '\)','>', '#', '\+', '-', '=', '\{', '\}', '\.', '!']
-
-    for chr in special_chrs :
-        
-        print(og_txt)
-        og_txt = re.sub(chr,"\\"+chr ,og_txt)
-        print(chr)
-
-    return og_txt
\ No newline at end of file
+    return MARKDOWN_SPECIAL.sub(r"\\\1",og_txt) #Escape all the special characters in one pass
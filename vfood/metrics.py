@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Metrics of a scraping run.
+
+The stages of the run (fetch, parse, clean, filter, convert and load) are timed
+for each store and search term, and the bytes downloaded, pages, rows and errors
+are counted. At the end of the run the metrics are saved as a JSON report and in
+the Prometheus textfile format (for the textfile collector of node_exporter).
+
+    with METRICS.timer("fetch", store="Gama", search_term="huevo"):
+        html = fetch_html(url)
+    METRICS.count("pages", store="Gama", search_term="huevo")
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from cache import cache_path, write_atomic
+
+STAGES = ["fetch", "parse", "clean", "filter", "convert", "identify", "load"]
+# Counters of the run and their description
+COUNTERS = {
+    "bytes": "Bytes downloaded from each host (0 for a page not modified).",
+    "pages": "Result pages scraped for each store and search term.",
+    "rows": "Products scraped for each store and search term.",
+    "errors": "Result pages that could not be opened for each store and search term.",
+    "loaded_rows": "Rows written by each sink.",
+}
+
+# Where the reports are saved, can be set in the .env
+METRICS_DIR = os.getenv("VFOOD_METRICS_DIR") or os.path.dirname(
+    cache_path("metrics", "vfood.prom")
+)
+
+
+def _key(labels: dict) -> tuple:
+    """Hashable key of a set of labels"""
+    return tuple(sorted(labels.items()))
+
+
+def _prometheus_labels(key: tuple) -> str:
+    """Labels in the Prometheus format, e.g. {store="Gama"}"""
+    if not key:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in key
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class RunMetrics:
+    """Timers and counters of a run, shared by all the threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget the metrics, e.g. at the start of a run."""
+        with self._lock:
+            self.started_at = time.time()
+            self.timers = {}  # (stage, labels): [seconds, calls]
+            self.counters = {}  # (counter, labels): value
+
+    def observe(self, stage: str, seconds: float, **labels):
+        """Add the seconds of a call of a stage."""
+        with self._lock:
+            timer = self.timers.setdefault((stage, _key(labels)), [0.0, 0])
+            timer[0] += seconds
+            timer[1] += 1
+
+    @contextmanager
+    def timer(self, stage: str, **labels):
+        """Time the block as a call of a stage.
+
+        Parameters
+        ----------
+        stage : str
+            The name of the stage, see STAGES.
+
+        **labels :
+            The labels of the call, e.g. store and search_term.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, **labels)
+
+    def count(self, counter: str, value: float = 1, **labels):
+        """Add a value to a counter (see COUNTERS)."""
+        with self._lock:
+            key = (counter, _key(labels))
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def report(self) -> dict:
+        """
+        Get the metrics of the run.
+
+        Returns
+        -------
+        dict :
+            The start and duration of the run, the stages (seconds and calls by
+            labels), the counters (value by labels), and the totals of each stage
+            and counter.
+        """
+        with self._lock:
+            stages = [
+                {"stage": stage, **dict(labels), "seconds": seconds, "calls": calls}
+                for (stage, labels), (seconds, calls) in sorted(self.timers.items())
+            ]
+            counters = [
+                {"counter": counter, **dict(labels), "value": value}
+                for (counter, labels), value in sorted(self.counters.items())
+            ]
+            started_at = self.started_at
+
+        totals = {}
+        for row in stages:
+            totals[f"{row['stage']}_seconds"] = totals.get(f"{row['stage']}_seconds", 0) + row["seconds"]
+        for row in counters:
+            totals[row["counter"]] = totals.get(row["counter"], 0) + row["value"]
+
+        return {
+            "started_at": datetime.fromtimestamp(started_at).isoformat(),
+            "duration_seconds": time.time() - started_at,
+            "totals": totals,
+            "stages": stages,
+            "counters": counters,
+        }
+
+    def prometheus(self) -> str:
+        """The metrics of the run in the Prometheus text format."""
+        report = self.report()
+        lines = [
+            "# HELP vfood_stage_seconds_total Seconds spent in each stage of the run.",
+            "# TYPE vfood_stage_seconds_total counter",
+        ]
+        with self._lock:
+            timers = sorted(self.timers.items())
+            counters = sorted(self.counters.items())
+
+        for (stage, labels), (seconds, _) in timers:
+            key = (("stage", stage),) + labels
+            lines.append(f"vfood_stage_seconds_total{_prometheus_labels(key)} {seconds:.6f}")
+        lines += [
+            "# HELP vfood_stage_calls_total Calls of each stage of the run.",
+            "# TYPE vfood_stage_calls_total counter",
+        ]
+        for (stage, labels), (_, calls) in timers:
+            key = (("stage", stage),) + labels
+            lines.append(f"vfood_stage_calls_total{_prometheus_labels(key)} {calls}")
+
+        for counter in sorted({counter for (counter, _), _ in counters}):
+            lines += [
+                f"# HELP vfood_{counter}_total {COUNTERS.get(counter, counter)}",
+                f"# TYPE vfood_{counter}_total counter",
+            ]
+            for (name, labels), value in counters:
+                if name == counter:
+                    lines.append(f"vfood_{counter}_total{_prometheus_labels(labels)} {value}")
+
+        lines += [
+            "# HELP vfood_run_duration_seconds Duration of the last run.",
+            "# TYPE vfood_run_duration_seconds gauge",
+            f"vfood_run_duration_seconds {report['duration_seconds']:.3f}",
+            "# HELP vfood_run_timestamp_seconds Unix time of the end of the last run.",
+            "# TYPE vfood_run_timestamp_seconds gauge",
+            f"vfood_run_timestamp_seconds {time.time():.0f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def save(self, directory: str = None, name: str = "vfood") -> tuple:
+        """
+        Save the JSON report of the run and the Prometheus textfile.
+
+        Parameters
+        ----------
+        directory : str
+            (optional) Directory of the files, by default METRICS_DIR.
+
+        name : str
+            Name of the Prometheus file (name.prom), replaced by every run. The
+            JSON report is saved as name-<start of the run>.json.
+
+        Returns
+        -------
+        tuple :
+            The paths of the JSON report and the Prometheus file.
+        """
+        directory = directory or METRICS_DIR
+        os.makedirs(directory, exist_ok=True)
+        report = self.report()
+        stamp = report["started_at"].replace(":", "").replace("-", "").split(".")[0]
+
+        report_path = os.path.join(directory, f"{name}-{stamp}.json")
+        write_atomic(report_path, json.dumps(report, indent=2).encode("utf-8"))
+        prometheus_path = os.path.join(directory, f"{name}.prom")
+        write_atomic(prometheus_path, self.prometheus().encode("utf-8"))
+        return report_path, prometheus_path
+
+
+METRICS = RunMetrics()  # The metrics of the run of the process
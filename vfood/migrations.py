@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+One-off migrations of the database tables.
+
+A migration changes the data of the tables, so it is never run by the jobs: it is
+run once, explicitly, from the command line, and it logs what it changes.
+--dry-run only logs what would change.
+
+    python vfood migrate food-natural-key --dry-run
+    python vfood migrate food-natural-key
+    python vfood migrate food-product-id
+"""
+
+import logging
+import os
+
+from sqlalchemy import inspect
+
+from loader import _quote, db_url, ensure_unique_key, get_engine
+
+logger = logging.getLogger(__name__)
+
+# Database of the jobs, with the credentials of the .env (see update_db)
+DB_NAME = "price_scrapt"
+
+
+def count_duplicates(table_name: str, engine, keys: list) -> int:
+    """
+    Count the rows of a table duplicated on a key.
+
+    Parameters
+    ----------
+    table_name : str
+        The name of the table.
+
+    engine : sqlalchemy.engine.Engine
+        The engine of the database, see loader.get_engine.
+
+    keys : list
+        The columns of the key.
+
+    Returns
+    -------
+    int :
+        The rows that would be deleted to leave one row per key.
+    """
+    columns = ", ".join(_quote(key) for key in keys)
+    with engine.connect() as conn:
+        duplicated = conn.exec_driver_sql(
+            f"SELECT COALESCE(SUM(rows_per_key - 1), 0) FROM "
+            f"(SELECT COUNT(*) AS rows_per_key FROM {_quote(table_name)} "
+            f"GROUP BY {columns} HAVING COUNT(*) > 1) AS duplicated"
+        ).scalar()
+    return int(duplicated)
+
+
+def dedupe_natural_key(table_name: str, engine, keys: list, dry_run: bool = False) -> int:
+    """
+    Delete the rows of a table duplicated on its natural key, keeping the last one
+    loaded, and create the unique index of the key (see loader.ensure_unique_key).
+
+    Parameters
+    ----------
+    table_name : str
+        The name of the table.
+
+    engine : sqlalchemy.engine.Engine
+        The engine of the database, see loader.get_engine.
+
+    keys : list
+        The columns of the natural key.
+
+    dry_run : bool
+        True to only count the duplicated rows.
+
+    Returns
+    -------
+    int :
+        The rows deleted (or that would be deleted, in a dry run).
+    """
+    duplicated = count_duplicates(table_name, engine, keys)
+    logger.info("%s has %d rows duplicated on %s", table_name, duplicated, keys)
+    if dry_run:
+        return duplicated
+
+    table = _quote(table_name)
+    if duplicated > 0:
+        same_key = " AND ".join(f"a.{_quote(key)} = b.{_quote(key)}" for key in keys)
+        columns = ", ".join(_quote(key) for key in keys)
+        with engine.begin() as conn:
+            if engine.dialect.name == "postgresql":
+                deleted = conn.exec_driver_sql(
+                    f"DELETE FROM {table} a USING {table} b WHERE a.ctid < b.ctid AND {same_key}"
+                ).rowcount
+            else:
+                deleted = conn.exec_driver_sql(
+                    f"DELETE FROM {table} WHERE rowid NOT IN "
+                    f"(SELECT MAX(rowid) FROM {table} GROUP BY {columns})"
+                ).rowcount
+        logger.info("Deleted %d duplicated rows of %s", deleted, table_name)
+
+    ensure_unique_key(table_name, engine, keys)
+    logger.info("%s has the unique index of %s", table_name, keys)
+    return duplicated
+
+
+def food_natural_key(engine, dry_run: bool = False) -> int:
+    """Dedupe the food table on update_db.FOOD_KEY, so it can be upserted."""
+    from update_db import FOOD_KEY
+
+    return dedupe_natural_key("food", engine, FOOD_KEY, dry_run)
+
+
+def add_column(table_name: str, engine, column: str, sql_type: str, dry_run: bool = False) -> bool:
+    """
+    Add a column to a table, if the table exists and does not have it.
+
+    Parameters
+    ----------
+    table_name : str
+        The name of the table.
+
+    engine : sqlalchemy.engine.Engine
+        The engine of the database, see loader.get_engine.
+
+    column : str
+        The name of the column.
+
+    sql_type : str
+        The SQL type of the column, e.g. TEXT.
+
+    dry_run : bool
+        True to only log if the column would be added.
+
+    Returns
+    -------
+    bool :
+        True if the column was added (or would be, in a dry run).
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table(table_name):
+        logger.info("%s does not exist, it is created with %s by the job", table_name, column)
+        return False
+    if column in {existing["name"] for existing in inspector.get_columns(table_name)}:
+        logger.info("%s already has %s", table_name, column)
+        return False
+    if dry_run:
+        logger.info("%s %s would be added to %s", column, sql_type, table_name)
+        return True
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            f"ALTER TABLE {_quote(table_name)} ADD COLUMN {_quote(column)} {sql_type}"
+        )
+    logger.info("Added %s %s to %s", column, sql_type, table_name)
+    return True
+
+
+def food_product_id(engine, dry_run: bool = False) -> int:
+    """Add the product_id column (see identity.py) to the food and food_delta tables.
+
+    The snapshot view is dropped when food_delta gets the column, delta.read_snapshot
+    creates it again with product_id.
+    """
+    from delta import DELTA_TABLE, SNAPSHOT_VIEW
+
+    added = add_column("food", engine, "product_id", "TEXT", dry_run)
+    if add_column(DELTA_TABLE, engine, "product_id", "TEXT", dry_run):
+        added += 1
+        if SNAPSHOT_VIEW in inspect(engine).get_view_names():
+            if dry_run:
+                logger.info("%s would be dropped, to be created with product_id", SNAPSHOT_VIEW)
+            else:
+                with engine.begin() as conn:
+                    conn.exec_driver_sql(f"DROP VIEW {_quote(SNAPSHOT_VIEW)}")
+                logger.info("Dropped %s, it is created with product_id by read_snapshot", SNAPSHOT_VIEW)
+    return added
+
+
+# Name: function of the migration, called with the engine and dry_run
+MIGRATIONS = {"food-natural-key": food_natural_key, "food-product-id": food_product_id}
+
+
+def run_migration(name: str, url: str = None, dry_run: bool = False):
+    """
+    Run a migration.
+
+    Parameters
+    ----------
+    name : str
+        One of MIGRATIONS.
+
+    url : str
+        (optional) The SQLAlchemy url of the database, by default the database of
+        the jobs with the credentials of the .env.
+
+    dry_run : bool
+        True to only log what would change.
+    """
+    if name not in MIGRATIONS:
+        raise ValueError(f"The migration must be one of {list(MIGRATIONS)}")
+    if url is None:
+        url = db_url(
+            os.getenv("USER"), os.getenv("PASSWORD"), os.getenv("HOST"), os.getenv("PORT"), DB_NAME
+        )
+    logger.info("Running %s%s", name, " (dry run)" if dry_run else "")
+    MIGRATIONS[name](get_engine(url), dry_run=dry_run)
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Pluggable HTML parser backend for the scrapers.
+
+The pages are parsed with lxml by default (much faster than "html.parser"), and
+with selectolax when VFOOD_PARSER=selectolax is set in the .env. All the product
+extraction is done with CSS selectors, so the same selectors work with every
+backend. With the BeautifulSoup backends a SoupStrainer can be given, so only
+the elements that hold the products are materialised.
+"""
+
+import os
+
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.element import Tag
+
+PARSERS = ("lxml", "html.parser", "selectolax")
+PARSER = os.getenv("VFOOD_PARSER", "lxml")  # Default parser backend
+
+
+def available_parsers() -> list:
+    """List the parser backends that can be used in this environment.
+
+    Returns
+    -------
+    list :
+        The names of the backends whose library is installed.
+    """
+    parsers = []
+    for parser in PARSERS:
+        try:
+            if parser == "lxml":
+                import lxml  # noqa: F401
+            elif parser == "selectolax":
+                import selectolax  # noqa: F401
+        except ImportError:
+            continue
+        parsers.append(parser)
+    return parsers
+
+
+AVAILABLE_PARSERS = available_parsers()  # Checked once, parse_html runs for every page
+
+
+def css_class(tag: str, class_name: str) -> str:
+    """Build the CSS selector of a tag with a (possibly multiple) class name.
+
+    Parameters
+    ----------
+    tag : str
+        Html tag name, e.g. "div".
+
+    class_name : str
+        The class attribute, e.g. "product-inner" or "btn btn-primary".
+
+    Returns
+    -------
+    str :
+        A CSS selector, e.g. "div.btn.btn-primary".
+    """
+    return tag + "".join("." + name for name in class_name.split())
+
+
+def _class_matcher(classes) -> callable:
+    """Match the elements with any of the classes, like a CSS selector does.
+
+    SoupStrainer compares the whole class attribute in recent versions of bs4, so
+    class_="page-numbers" misses <a class="next page-numbers">.
+    """
+    classes = {classes} if isinstance(classes, str) else set(classes)
+
+    def matches(value) -> bool:
+        if value is None:
+            return False
+        return not classes.isdisjoint(value.split() if isinstance(value, str) else value)
+
+    return matches
+
+
+def parse_html(markup, parser: str = None, only: dict = None):
+    """Parse a page with the chosen backend.
+
+    Parameters
+    ----------
+    markup : bytes or str
+        The html of the page.
+
+    parser : str
+        (optional) One of PARSERS, by default PARSER. If lxml or selectolax are
+        not installed, html.parser is used.
+
+    only : dict
+        (optional) Keyword arguments of a SoupStrainer (e.g. {"class_": ["price"]})
+        to build only the matching elements. Ignored by selectolax, that does
+        not build a Python tree.
+
+    Returns
+    -------
+    BeautifulSoup or selectolax.lexbor.LexborHTMLParser :
+        The parsed page, to be used with select_rows, select_texts and select_attrs.
+    """
+    parser = parser or PARSER
+    if parser not in PARSERS:
+        raise ValueError(f"parser must be one of {PARSERS}")
+    if parser not in AVAILABLE_PARSERS:
+        parser = "html.parser"
+
+    if parser == "selectolax":
+        try:
+            from selectolax.lexbor import LexborHTMLParser as HTMLParser
+        except ImportError:  # Older selectolax, without the lexbor backend
+            from selectolax.parser import HTMLParser
+
+        return HTMLParser(markup)
+
+    if only and "class_" in only:
+        only = {**only, "class_": _class_matcher(only["class_"])}
+    parse_only = SoupStrainer(**only) if only else None
+    return BeautifulSoup(markup, parser, parse_only=parse_only)
+
+
+def _select(node, css: str) -> list:
+    """All the elements matching css inside node"""
+    if isinstance(node, Tag):
+        return node.select(css)
+    return node.css(css)
+
+
+def _select_one(node, css: str):
+    """The first element matching css inside node, None if there is no one"""
+    if isinstance(node, Tag):
+        return node.select_one(css)
+    return node.css_first(css)
+
+
+def _text(node) -> str:
+    """The text of an element"""
+    if isinstance(node, Tag):
+        return node.get_text()
+    return node.text()
+
+
+def _attr(node, name: str) -> str:
+    """The value of an attribute of an element, None if it does not have it"""
+    if isinstance(node, Tag):
+        return node.get(name)
+    return node.attributes.get(name)
+
+
+def select_rows(doc, item_css: str, fields: dict) -> list:
+    """Get the text of some fields inside every item of a page.
+
+    Parameters
+    ----------
+    doc : BeautifulSoup or HTMLParser
+        A page parsed with parse_html.
+
+    item_css : str
+        CSS selector of the element that holds each item (product).
+
+    fields : dict
+        Name of the field as key and the CSS selector of the field, inside the
+        item, as value.
+
+    Returns
+    -------
+    list :
+        A dict for each item with the text of every field, or None when the field
+        was not found in the item.
+    """
+    rows = []
+    for item in _select(doc, item_css):
+        row = {}
+        for field, field_css in fields.items():
+            node = _select_one(item, field_css)
+            row[field] = None if node is None else _text(node)
+        rows.append(row)
+    return rows
+
+
+def select_texts(doc, css: str) -> list:
+    """Get the text of every element matching a CSS selector.
+
+    Parameters
+    ----------
+    doc : BeautifulSoup or HTMLParser
+        A page parsed with parse_html.
+
+    css : str
+        CSS selector of the elements.
+
+    Returns
+    -------
+    list :
+        The text of each element.
+    """
+    return [_text(node) for node in _select(doc, css)]
+
+
+def select_attrs(doc, css: str, attr: str) -> list:
+    """Get an attribute of every element matching a CSS selector.
+
+    Parameters
+    ----------
+    doc : BeautifulSoup or HTMLParser
+        A page parsed with parse_html.
+
+    css : str
+        CSS selector of the elements.
+
+    attr : str
+        Name of the attribute, e.g. "href".
+
+    Returns
+    -------
+    list :
+        The value of the attribute for each element that has it.
+    """
+    values = [_attr(node, attr) for node in _select(doc, css)]
+    return [value for value in values if value is not None]
@@ -0,0 +1,481 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming pipeline from the store pages to the database.
+
+The products of each result page flow, as a small DataFrame, through the stages
+clean -> filter -> convert (-> identify, when a product index is given) and are written by the sinks (CSV, Parquet, the
+Parquet archive, or a database table) in chunks of bounded size. The memory used
+does not grow with the run, and a crash near the end of the run keeps what was
+already flushed.
+
+    with CSVSink("test_data.csv") as csv_sink:
+        run_pipeline(["huevo", "arroz"], [csv_sink])
+"""
+
+import functools
+import os
+import uuid
+
+import pandas as pd
+
+from archive import drop_partition, write_archive
+from data import (
+    clean_store_data,
+    compact_frame,
+    convert_prices_dollar,
+    filter_search_terms,
+    get_exchange_rate,
+    iter_store_pages,
+    limit_store_requests,
+    parse_dates,
+    prune_caches,
+)
+from delta import (
+    DELTA_TABLE,
+    PRODUCT_KEY,
+    RUNS_TABLE,
+    delete_day,
+    has_table,
+    latest_prices,
+    price_changes,
+    vanished_products,
+)
+from engine import stream_searches
+from identity import add_product_ids
+from loader import load_dataframe, upsert_dataframe
+from metrics import METRICS
+from resilience import breaker_states, reset_breakers
+from stores import load_stores, store_limits
+
+CHUNK_ROWS = 5_000  # Rows kept by a sink before it is flushed
+
+
+def scrape_batches(
+    products: list, registry: dict, limits: dict = None, journal=None
+):
+    """
+    Scrape the products from the stores concurrently, one result page at a time.
+
+    Parameters
+    ----------
+    products : list
+        A list of product to search for.
+
+    registry : dict
+        The stores to scrape, from stores.load_stores.
+
+    limits : dict
+        (optional) Store name as key and a dict with max_workers and min_interval
+        as value, to override the limits of the registry.
+
+    journal : checkpoint.RunJournal
+        (optional) The journal of the run, see data.iter_store_pages.
+
+    Yields
+    ------
+    pd.DataFrame :
+        The raw products of each result page, see data.iter_store_pages.
+    """
+    searches = {
+        store_name: functools.partial(iter_store_pages, store, journal=journal)
+        for store_name, store in registry.items()
+    }
+    limits = {**store_limits(registry), **(limits or {})}
+    limit_store_requests(registry, limits)
+    products = [product.lower() for product in products]
+    yield from stream_searches(searches, products, limits)
+
+
+def batch_labels(batch: pd.DataFrame) -> dict:
+    """The store and search term of a batch (a result page), to label its metrics"""
+    return {"store": str(batch["store"].iat[0]), "search_term": str(batch["search_term"].iat[0])}
+
+
+def clean_stage(batches, registry: dict):
+    """Clean the names and prices of every batch, see data.clean_store_data."""
+    for batch in batches:
+        labels = batch_labels(batch)
+        with METRICS.timer("clean", **labels):
+            batch = clean_store_data(batch, registry[labels["store"]])
+        yield batch
+
+
+def filter_stage(batches, accent_insensitive: bool = False):
+    """Drop the unrelated products of every batch, see data.filter_search_terms."""
+    for batch in batches:
+        with METRICS.timer("filter", **batch_labels(batch)):
+            batch = filter_search_terms(batch, accent_insensitive)
+        if batch.shape[0] > 0:
+            yield batch
+
+
+def convert_stage(batches, rate_bs_dollar: float):
+    """Add the price in dollars to every batch, see data.convert_prices_dollar."""
+    for batch in batches:
+        with METRICS.timer("convert", **batch_labels(batch)):
+            batch["product_price_dollar"] = convert_prices_dollar(
+                batch["product_price"], rate_bs_dollar
+            )
+            batch = compact_frame(batch)
+        yield batch
+
+
+def identify_stage(batches, product_index):
+    """Add the product_id of every product, see identity.add_product_ids."""
+    for batch in batches:
+        with METRICS.timer("identify", **batch_labels(batch)):
+            batch = add_product_ids(batch, product_index)
+        yield batch
+
+
+class Sink:
+    """Keep the batches written to it and flush them in chunks of chunk_rows rows.
+
+    Subclasses implement _flush(data). Use it as a context manager, so the last
+    chunk is flushed when the run ends.
+
+    Parameters
+    ----------
+    chunk_rows : int
+        Rows kept before they are flushed.
+
+    transform : callable
+        (optional) Function applied to each chunk before it is flushed, e.g.
+        update_db.prepare_food_data.
+    """
+
+    def __init__(self, chunk_rows: int = CHUNK_ROWS, transform=None):
+        self.chunk_rows = chunk_rows
+        self.transform = transform
+        self.rows = 0  # Rows flushed
+        self._pending = []
+        self._pending_rows = 0
+
+    def write(self, batch: pd.DataFrame):
+        """Add a batch, flushing the chunk when it has chunk_rows rows."""
+        self._pending.append(batch)
+        self._pending_rows += batch.shape[0]
+        if self._pending_rows >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        """Flush the pending batches."""
+        if self._pending_rows == 0:
+            return
+        sink = type(self).__name__
+        with METRICS.timer("load", sink=sink):
+            data = pd.concat(self._pending, ignore_index=True)
+            self._pending = []
+            self._pending_rows = 0
+            if self.transform is not None:
+                data = self.transform(data)
+            self._flush(data)
+        self.rows += data.shape[0]
+        METRICS.count("loaded_rows", data.shape[0], sink=sink)
+
+    def _flush(self, data: pd.DataFrame):
+        raise NotImplementedError
+
+    def close(self):
+        """Flush the last chunk."""
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CSVSink(Sink):
+    """Append the chunks to a CSV file (replaced when the sink is created), with the
+    dates in the %d/%m/%Y format of test_data.csv.
+
+    Parameters
+    ----------
+    path : str
+        Path of the CSV file.
+    """
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _flush(self, data: pd.DataFrame):
+        data.index = range(self.rows, self.rows + data.shape[0])  # Keep the row count
+        data.to_csv(
+            self.path, mode="a", header=self.rows == 0, date_format="%d/%m/%Y"
+        )
+
+
+class ParquetSink(Sink):
+    """Write the chunks as row groups of a Parquet file (needs pyarrow).
+
+    Parameters
+    ----------
+    path : str
+        Path of the Parquet file.
+    """
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._writer = None
+
+    def _flush(self, data: pd.DataFrame):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._writer is None:
+            table = pa.Table.from_pandas(data, preserve_index=False)
+            self._writer = pq.ParquetWriter(self.path, table.schema)
+        else:
+            table = pa.Table.from_pandas(
+                data, schema=self._writer.schema, preserve_index=False
+            )
+        self._writer.write_table(table)
+
+    def close(self):
+        super().close()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class ArchiveSink(Sink):
+    """Append the chunks to the Parquet archive partitioned by date and store.
+
+    The partitions of the dates and stores written by the sink are replaced the
+    first time the sink writes to them, so running (or resuming) the scrape of a
+    day again does not duplicate its rows. See archive.write_archive.
+
+    Parameters
+    ----------
+    path : str
+        (optional) Directory of the archive, by default archive.ARCHIVE_DIR.
+    """
+
+    def __init__(self, path: str = None, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._run_id = uuid.uuid4().hex
+        self._chunks = 0
+        self._partitions = set()
+
+    def _flush(self, data: pd.DataFrame):
+        days = parse_dates(data["date"]).dt.date
+        for day, store_name in set(zip(days, data["store"])):
+            if (day, store_name) not in self._partitions:
+                drop_partition(day, store_name, self.path)
+                self._partitions.add((day, store_name))
+        write_archive(data, self.path, f"part-{self._run_id}-{self._chunks}")
+        self._chunks += 1
+
+
+class DBSink(Sink):
+    """Load the chunks to a database table, see loader.load_dataframe.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        The engine of the database, see loader.get_engine.
+
+    table_name : str
+        The name of the table.
+
+    keys : list
+        (optional) The natural key of the table, to upsert instead of append.
+    """
+
+    def __init__(self, engine, table_name: str, keys: list = None, **kwargs):
+        super().__init__(**kwargs)
+        self.engine = engine
+        self.table_name = table_name
+        self.keys = keys
+
+    def _flush(self, data: pd.DataFrame):
+        if self.keys is None:
+            load_dataframe(data, self.table_name, self.engine)
+        else:
+            upsert_dataframe(data, self.table_name, self.engine, self.keys)
+
+
+class DeltaSink(Sink):
+    """Load only the new, changed and vanished products to the delta table, see delta.py.
+
+    The chunks must have the columns of the food table, use it with
+    transform=update_db.prepare_food_data. A product found more than once in a run
+    (see delta.PRODUCT_KEY) is written once, with its first row. Every product is compared with its latest
+    known row before the day of the run; the vanished products and the heartbeat
+    of every store scraped are written when the sink is closed. The rows of the day
+    of the stores scraped are replaced, so the day can be run again.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        The engine of the database, see loader.get_engine.
+
+    delta_table, runs_table : str
+        The names of the delta table and the runs (heartbeat) table.
+    """
+
+    def __init__(
+        self,
+        engine,
+        delta_table: str = DELTA_TABLE,
+        runs_table: str = RUNS_TABLE,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.engine = engine
+        self.delta_table = delta_table
+        self.runs_table = runs_table
+        self.changes = {}  # Store name: rows written to the delta table
+        self._latest = {}  # Store name: latest known rows of its products
+        self._seen = {}  # Store name: keys of the products found
+        self._search_terms = {}  # Store name: search terms found
+        self._days = {}  # Store name: date of the run
+
+    def _start_store(self, store_name: str, day):
+        """Load the latest rows of a store and forget its rows of the day"""
+        self._latest[store_name] = latest_prices(
+            self.engine, [store_name], day, self.delta_table
+        )
+        self._seen[store_name] = set()
+        self._search_terms[store_name] = set()
+        self._days[store_name] = day
+        self.changes[store_name] = 0
+        delete_day(self.engine, self.delta_table, store_name, day)
+
+    def _load(self, store_name: str, changes: pd.DataFrame):
+        if changes.shape[0] > 0:
+            load_dataframe(changes, self.delta_table, self.engine)
+            self.changes[store_name] += changes.shape[0]
+
+    def _flush(self, data: pd.DataFrame):
+        for store_name, store_data in data.groupby("store_name", sort=False, observed=True):
+            if store_name not in self._latest:
+                self._start_store(store_name, store_data["date_scrapt"].iat[0].to_pydatetime())
+            # A product found twice (in the chunk or in an earlier chunk) is written once
+            keys = pd.Series(
+                list(zip(*(store_data[key].astype(str) for key in PRODUCT_KEY))),
+                index=store_data.index,
+            )
+            first = ~keys.duplicated() & ~keys.isin(self._seen[store_name])
+            store_data = store_data.loc[first.to_numpy()]
+            self._seen[store_name].update(keys[first])
+            self._search_terms[store_name].update(store_data["search_term"].astype(str))
+            self._load(store_name, price_changes(store_data, self._latest[store_name]))
+
+    def close(self):
+        """Flush the last chunk, then write the vanished products and the heartbeats."""
+        super().close()
+        with METRICS.timer("load", sink=type(self).__name__):
+            heartbeats = []
+            for store_name, latest in self._latest.items():
+                vanished = vanished_products(
+                    latest,
+                    self._seen[store_name],
+                    self._search_terms[store_name],
+                    self._days[store_name],
+                )
+                self._load(store_name, vanished)
+                heartbeats.append(
+                    {
+                        "date_scrapt": self._days[store_name],
+                        "store_name": store_name,
+                        "products": len(self._seen[store_name]),
+                        "changes": self.changes[store_name],
+                    }
+                )
+            if heartbeats:
+                heartbeats = pd.DataFrame(heartbeats)
+                if has_table(self.engine, self.runs_table):
+                    upsert_dataframe(
+                        heartbeats, self.runs_table, self.engine, ["date_scrapt", "store_name"]
+                    )
+                else:
+                    load_dataframe(heartbeats, self.runs_table, self.engine)
+        self._latest = {}
+
+
+def run_pipeline(
+    products: list,
+    sinks: list,
+    exchange_rate: float = None,
+    stores: list = None,
+    limits: dict = None,
+    accent_insensitive: bool = False,
+    journal=None,
+    product_index=None,
+) -> int:
+    """
+    Scrape the products and write them to the sinks as they are scraped.
+
+    Parameters
+    ----------
+    products : list
+        a list of strings that will be search on all the supermarkets
+
+    sinks : list
+        The sinks where every batch is written.
+
+    exchange_rate : float
+        (optional) The exchange rate ($/Bs), by default the cached BCV rate.
+
+    stores : list
+        (optional) Names of the stores to scrape, by default all the registry.
+
+    limits : dict
+        (optional) Limits of the stores, see scrape_batches.
+
+    accent_insensitive : bool
+        True to ignore accents when dropping unrelated products.
+
+    journal : checkpoint.RunJournal
+        (optional) The journal of the run. The pages completed by a previous run
+        are read from it instead of scraped again, see checkpoint.RunJournal.
+
+    product_index : identity.ProductIndex
+        (optional) The index that gives every product a product_id column, saved
+        at the end of the run. By default the products have no product_id.
+
+    Returns
+    -------
+    int :
+        The number of products written.
+    """
+    if exchange_rate == None:
+        exchange_rate = get_exchange_rate(fallback=True)["exchange_rate"]
+    registry = load_stores(names=stores)
+    reset_breakers()  # Every run gives the stores a new chance
+    METRICS.reset()
+    prune_caches()
+
+    scraped = scrape_batches(products, registry, limits, journal)
+    batches = clean_stage(scraped, registry)
+    batches = filter_stage(batches, accent_insensitive)
+    batches = convert_stage(batches, exchange_rate)
+    if product_index is not None:
+        batches = identify_stage(batches, product_index)
+
+    rows = 0
+    try:
+        for batch in batches:
+            for sink in sinks:
+                sink.write(batch)
+            rows += batch.shape[0]
+    finally:
+        scraped.close()  # Stop the searches if a sink failed
+        if product_index is not None:
+            product_index.save()  # The ids of the rows already written are kept
+
+    for sink in sinks:
+        sink.flush()
+    print(f"{rows} products written")
+    open_hosts = [host for host, state in breaker_states().items() if state != "closed"]
+    if open_hosts:
+        print(f"Stores skipped by their circuit breaker: {open_hosts}")
+    return rows
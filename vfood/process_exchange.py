@@ -1,4 +1,7 @@
 #Updates the exchange Rate Table in the DataBase
+from dotenv import load_dotenv
+
+load_dotenv() #Before importing update_db, the modules read the VFOOD_* settings when imported
 from update_db import update_exchange
 
 if __name__ == "__main__":
@@ -1,5 +1,18 @@
 #Updates the food prices Table in the DataBase
+import argparse
+import logging
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv() #Before importing update_db, the modules read the VFOOD_* settings when imported
 from update_db import update_foods
 
 if __name__ == "__main__":
-    update_foods()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Scrape the list of foods and update the food table")
+    parser.add_argument("--resume",action="store_true",help="skip the pages already scraped by today's run")
+    parser.add_argument("--delta",action="store_true",help="load only the products whose price changed")
+    args = parser.parse_args()
+    #VFOOD_LOG_LEVEL=DEBUG logs every product of every page
+    logging.basicConfig(level=os.getenv("VFOOD_LOG_LEVEL","INFO"),format="%(name)s: %(message)s")
+    update_foods(resume=args.resume,delta=args.delta)
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Record and replay of the store pages.
+
+The pages of the stores (and of the BCV) are saved as fixtures and served by a
+local HTTP stub, so the scrapers can be run and measured without hitting the live
+web pages. While a ReplayServer is running, the fetch layer sends every request
+to it (see fetch.REPLAY_URL) with the original url as the path.
+
+In record mode the stub fetches from the live web page every url it does not
+have and saves the answer as a fixture:
+
+    python vfood/replay.py record huevo arroz --stores Gama Plazas
+
+In replay mode the urls without a fixture answer 404:
+
+    with ReplayServer():
+        raw_data = data.scrape_raw_data(["huevo", "arroz"])
+
+The fixtures are saved in VFOOD_FIXTURES_DIR (by default fixtures in the working
+directory): an index.json with the url, file and content type of every page, and
+the pages in pages/. See benchmark.py replay for the benchmarks that use them.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+import requests
+
+import fetch
+from cache import write_atomic
+
+FIXTURES_DIR = os.getenv("VFOOD_FIXTURES_DIR", os.path.join(os.getcwd(), "fixtures"))
+
+
+class FixtureStore:
+    """The recorded pages of a fixtures directory.
+
+    Parameters
+    ----------
+    path : str
+        (optional) The fixtures directory, by default FIXTURES_DIR.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or FIXTURES_DIR
+        self.index = {"products": [], "stores": None, "pages": {}}
+        self._lock = threading.Lock()
+        try:
+            with open(os.path.join(self.path, "index.json"), "r", encoding="utf-8") as index_file:
+                self.index.update(json.load(index_file))
+        except (OSError, ValueError):
+            pass
+
+    def __len__(self) -> int:
+        return len(self.index["pages"])
+
+    def get(self, url: str) -> tuple:
+        """The body and content type of the page of a url, None if it was not recorded."""
+        page = self.index["pages"].get(url)
+        if page is None:
+            return None
+        with open(os.path.join(self.path, "pages", page["file"]), "rb") as page_file:
+            return page_file.read(), page["content_type"]
+
+    def put(self, url: str, body: bytes, content_type: str):
+        """Save the page of a url."""
+        file_name = hashlib.sha1(url.encode("utf-8")).hexdigest() + ".html"
+        os.makedirs(os.path.join(self.path, "pages"), exist_ok=True)
+        write_atomic(os.path.join(self.path, "pages", file_name), body)
+        with self._lock:
+            self.index["pages"][url] = {"file": file_name, "content_type": content_type}
+
+    def save(self, products: list = None, stores: list = None):
+        """Save the index, with the products and stores of the recording."""
+        with self._lock:
+            if products is not None:
+                self.index["products"] = sorted(set(self.index["products"]) | set(products))
+            if stores is not None:
+                self.index["stores"] = stores
+            content = json.dumps(self.index, indent=2, sort_keys=True).encode("utf-8")
+        os.makedirs(self.path, exist_ok=True)
+        write_atomic(os.path.join(self.path, "index.json"), content)
+
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    """Answer a request with the fixture of its url, recording it first in record mode"""
+
+    def do_GET(self):
+        server = self.server
+        url = unquote(self.path[1:])
+        page = server.fixtures.get(url)
+
+        if page is None and server.record:
+            try:
+                response = requests.get(
+                    url, headers=fetch.HEADERS, timeout=(fetch.CONNECT_TIMEOUT, fetch.READ_TIMEOUT)
+                )
+            except requests.exceptions.RequestException:
+                self.send_error(502, f"{url} could not be fetched")
+                return
+            if response.status_code != 200:
+                self.send_error(response.status_code)
+                return
+            content_type = response.headers.get("Content-Type", "text/html")
+            server.fixtures.put(url, response.content, content_type)
+            page = response.content, content_type
+
+        if page is None:
+            server.misses.append(url)
+            self.send_error(404, f"{url} was not recorded")
+            return
+
+        body, content_type = page
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # The requests are not printed
+
+
+class ReplayServer:
+    """Local HTTP stub that serves the recorded pages to the fetch layer.
+
+    Use it as a context manager: while it runs, fetch.fetch_html requests every
+    url from it.
+
+    Parameters
+    ----------
+    path : str
+        (optional) The fixtures directory, by default FIXTURES_DIR.
+
+    record : bool
+        True to fetch and save the urls that were not recorded, False to answer
+        them with 404.
+    """
+
+    def __init__(self, path: str = None, record: bool = False):
+        self.fixtures = FixtureStore(path)
+        self.record = record
+        self._server = None
+        self._thread = None
+        self._previous_url = None
+
+    @property
+    def misses(self) -> list:
+        """The urls requested that were not recorded"""
+        return self._server.misses if self._server is not None else []
+
+    @property
+    def url(self) -> str:
+        """Url of the running server"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Start serving in a background thread and send the fetch layer to it."""
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _ReplayHandler)
+        self._server.daemon_threads = True
+        self._server.fixtures = self.fixtures
+        self._server.record = self.record
+        self._server.misses = []
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="vfood-replay", daemon=True
+        )
+        self._thread.start()
+        self._previous_url = fetch.REPLAY_URL
+        fetch.REPLAY_URL = self.url
+
+    def stop(self):
+        """Stop the server and send the fetch layer back to the live web pages."""
+        fetch.REPLAY_URL = self._previous_url
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def record_fixtures(products: list, stores: list = None, path: str = None) -> int:
+    """
+    Scrape the products from the live stores (and the BCV rate), saving every page
+    as a fixture.
+
+    Parameters
+    ----------
+    products : list
+        A list of product to search for.
+
+    stores : list
+        (optional) Names of the stores to scrape, by default all the registry.
+
+    path : str
+        (optional) The fixtures directory, by default FIXTURES_DIR.
+
+    Returns
+    -------
+    int :
+        The number of pages recorded.
+    """
+    from data import bcv_exchange_rate, scrape_raw_data
+
+    previous_cache = fetch.HTTP_CACHE_ENABLED
+    fetch.HTTP_CACHE_ENABLED = False  # Every page must reach the stub
+    try:
+        with ReplayServer(path, record=True) as server:
+            bcv_exchange_rate()
+            scrape_raw_data(products, stores=stores)
+            server.fixtures.save(products, stores)
+    finally:
+        fetch.HTTP_CACHE_ENABLED = previous_cache
+    return len(server.fixtures)
+
+
+def main():
+    """Record the fixtures, or serve them, from the command line."""
+    parser = argparse.ArgumentParser(description="Record and replay the store pages")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_cmd = subparsers.add_parser("record", help="save the pages of a scrape")
+    record_cmd.add_argument("products", nargs="+", help="products to search for")
+    record_cmd.add_argument("--stores", nargs="+", help="stores to scrape")
+    record_cmd.add_argument("--fixtures", help="fixtures directory")
+
+    serve_cmd = subparsers.add_parser("serve", help="serve the recorded pages")
+    serve_cmd.add_argument("--fixtures", help="fixtures directory")
+
+    args = parser.parse_args()
+
+    if args.command == "record":
+        pages = record_fixtures(args.products, args.stores, args.fixtures)
+        print(f"{pages} pages recorded in {args.fixtures or FIXTURES_DIR}")
+    elif args.command == "serve":
+        with ReplayServer(args.fixtures) as server:
+            print(f"Serving {len(server.fixtures)} pages at {server.url}, set VFOOD_REPLAY_URL={server.url}")
+            try:
+                server._thread.join()
+            except KeyboardInterrupt:
+                pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Retries and circuit breakers for the fetch layer.
+
+A failed request is retried a bounded number of times, waiting an exponential
+backoff with full jitter between attempts (so the retries of many workers do not
+hit the store at the same time). Errors of the client (4xx, except 429) are not
+retried.
+
+Every host (one per store) has a circuit breaker: after failure_threshold failed
+fetches in a row the breaker opens, and the requests to that host fail at once
+with CircuitOpenError instead of waiting on a store that is down. After
+reset_timeout seconds one request is let through to probe the host, and the
+breaker closes again if it succeeds. The other stores are not affected.
+"""
+
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+from requests.exceptions import ConnectionError as RequestConnectionError
+from requests.exceptions import HTTPError, RequestException, Timeout
+
+# Retries and backoff in seconds, can be set in the .env
+RETRIES = int(os.getenv("VFOOD_RETRIES", 3))
+BACKOFF_BASE = float(os.getenv("VFOOD_BACKOFF_BASE", 0.5))
+BACKOFF_MAX = float(os.getenv("VFOOD_BACKOFF_MAX", 30))
+
+# Failed fetches in a row that open the breaker of a host, and seconds it stays open
+FAILURE_THRESHOLD = int(os.getenv("VFOOD_BREAKER_FAILURES", 3))
+RESET_TIMEOUT = float(os.getenv("VFOOD_BREAKER_RESET", 300))
+
+
+class CircuitOpenError(RequestException):
+    """The circuit breaker of the host is open, the request was not sent."""
+
+
+def backoff_delay(attempt: int, base: float = None, cap: float = None) -> float:
+    """Seconds to wait before a retry, exponential backoff with full jitter.
+
+    Parameters
+    ----------
+    attempt : int
+        The number of the failed attempt, starting at 0.
+
+    base : float
+        (optional) Seconds of the first backoff, by default BACKOFF_BASE.
+
+    cap : float
+        (optional) Maximum seconds of a backoff, by default BACKOFF_MAX.
+
+    Returns
+    -------
+    float :
+        A random delay between 0 and min(cap, base * 2 ** attempt).
+    """
+    base = BACKOFF_BASE if base is None else base
+    cap = BACKOFF_MAX if cap is None else cap
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def is_retryable(error: Exception) -> bool:
+    """True if the request that raised error may succeed if sent again"""
+    if isinstance(error, HTTPError):
+        status = error.response.status_code if error.response is not None else None
+        return status is None or status == 429 or status >= 500
+    return isinstance(error, (Timeout, RequestConnectionError))
+
+
+def retry_after(error: Exception) -> float:
+    """Seconds asked by the Retry-After header of a 429/503 response, None if there is no one"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return min(BACKOFF_MAX, float(response.headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """Stop sending requests to a host that fails repeatedly.
+
+    Parameters
+    ----------
+    failure_threshold : int
+        Failed calls (after their retries) in a row that open the breaker.
+
+    reset_timeout : float
+        Seconds the breaker stays open before letting one call probe the host.
+    """
+
+    def __init__(
+        self, failure_threshold: int = FAILURE_THRESHOLD, reset_timeout: float = RESET_TIMEOUT
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None  # time.monotonic() when it opened, None if closed
+        self._probing = False
+        self._probe_thread = None  # Thread of the call probing the host
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """closed, open, or half-open"""
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        """True if a call can be sent, only one call at a time when half-open."""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._probing:
+                self._probing = True
+                self._probe_thread = threading.get_ident()
+                return True
+            return False
+
+    def release_probe(self):
+        """End the probe of this thread when it had no result (e.g. a parser error),
+        so the next call can probe the host."""
+        with self._lock:
+            if self._probing and self._probe_thread == threading.get_ident():
+                self._probing = False
+
+    def record_success(self):
+        """Close the breaker."""
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        """Count a failed call, opening the breaker at failure_threshold failures."""
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(url: str) -> CircuitBreaker:
+    """Get the circuit breaker of the host of a url, created the first time."""
+    host = urlsplit(url).netloc
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker()
+        return _breakers[host]
+
+
+def breaker_states() -> dict:
+    """Get the state of the breaker of every host requested."""
+    with _breakers_lock:
+        return {host: breaker.state for host, breaker in _breakers.items()}
+
+
+def reset_breakers():
+    """Forget the breakers of all the hosts, e.g. at the start of a run."""
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def call_with_retry(call, url: str, retries: int = None, sleep=time.sleep):
+    """Call a function that requests a url, with retries and the breaker of its host.
+
+    Parameters
+    ----------
+    call : callable
+        Function without arguments that sends the request and returns its result.
+
+    url : str
+        Url requested, to pick the breaker of its host.
+
+    retries : int
+        (optional) Retries after the first attempt, by default RETRIES.
+
+    sleep : callable
+        Function used to wait between attempts.
+
+    Returns
+    -------
+    The result of call.
+
+    Raises
+    ------
+    CircuitOpenError
+        If the breaker of the host is open.
+    requests.exceptions.RequestException
+        The error of the last attempt, or the first error that can not be retried.
+    """
+    if retries is None:
+        retries = RETRIES
+    breaker = get_breaker(url)
+    if not breaker.allow():
+        raise CircuitOpenError(f"The circuit breaker of {urlsplit(url).netloc} is open")
+
+    try:
+        for attempt in range(retries + 1):
+            try:
+                result = call()
+            except RequestException as e:
+                if not is_retryable(e):
+                    breaker.record_success()  # The host answered
+                    raise
+                if attempt == retries:
+                    breaker.record_failure()
+                    raise
+                delay = retry_after(e)
+                if delay is None:
+                    delay = backoff_delay(attempt)
+                print(f"Retrying {url} in {delay:.1f}s ({e.__class__.__name__})")
+                sleep(delay)
+            else:
+                breaker.record_success()
+                return result
+    finally:
+        # Other errors (or KeyboardInterrupt) must not leave the breaker probing forever
+        breaker.release_probe()
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""
+Scheduler that runs the vfood jobs from one long running process.
+
+The jobs (the daily food prices and the exchange rates) are declared with cron
+expressions in ref_table/schedule.toml. Every run is a new python vfood <command>
+process, so the runs of different jobs never share the global state of a run (the
+circuit breakers, the metrics and the caches that the foods job resets when it
+starts).
+
+A job never overlaps with itself: when its next run comes while the last one is
+still running, that run is skipped. Every run is delayed a random jitter, so the
+stores are not hit at the same second every day.
+
+    python vfood schedule
+"""
+
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    import tomli as tomllib
+
+SCHEDULE_PATH = os.getenv(
+    "VFOOD_SCHEDULE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ref_table", "schedule.toml"),
+)
+
+COMMANDS = ("foods", "exchange")
+
+VFOOD_DIR = os.path.dirname(os.path.abspath(__file__))  # Run as python vfood <command>
+
+# Minimum and maximum of each field of a cron expression
+CRON_FIELDS = [
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day", 1, 31),
+    ("month", 1, 12),
+    ("weekday", 0, 6),
+]
+
+
+def parse_cron_field(text: str, low: int, high: int) -> set:
+    """
+    Get the values of a field of a cron expression.
+
+    Parameters
+    ----------
+    text : str
+        The field, e.g. "*", "9,15", "1-5" or "*/10".
+
+    low, high : int
+        The minimum and maximum values of the field.
+
+    Returns
+    -------
+    set :
+        The values the field matches.
+
+    Raises
+    ------
+    ValueError
+        If the field is not valid or has values out of range.
+    """
+    values = set()
+    for part in text.split(","):
+        values_range, _, step = part.partition("/")
+        if values_range == "*":
+            start, end = low, high
+        elif "-" in values_range:
+            start, end = (int(value) for value in values_range.split("-", 1))
+        else:
+            start = end = int(values_range)
+            if step:
+                end = high
+        if start < low or end > high or start > end:
+            raise ValueError(f"{part} is out of the range {low}-{high}")
+        values.update(range(start, end + 1, int(step) if step else 1))
+    return values
+
+
+class CronSchedule:
+    """When a job runs, from a cron expression.
+
+    Parameters
+    ----------
+    expression : str
+        "minute hour day month weekday", e.g. "0 9,15 * * *". Weekday 0 is Sunday.
+    """
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != len(CRON_FIELDS):
+            raise ValueError(f"{expression} must have {len(CRON_FIELDS)} fields")
+        self.expression = expression
+        for text, (name, low, high) in zip(fields, CRON_FIELDS):
+            setattr(self, name, parse_cron_field(text, low, high))
+        # As cron, when day and weekday are both restricted either one matches
+        self._any_day = fields[2] == "*" or fields[4] == "*"
+
+    def matches(self, moment: datetime) -> bool:
+        """True if the job runs at that minute."""
+        day = moment.day in self.day
+        weekday = (moment.isoweekday() % 7) in self.weekday
+        return (
+            moment.minute in self.minute
+            and moment.hour in self.hour
+            and moment.month in self.month
+            and (day and weekday if self._any_day else day or weekday)
+        )
+
+    def next_after(self, moment: datetime) -> datetime:
+        """
+        Get the next time the job runs.
+
+        Parameters
+        ----------
+        moment : datetime
+            The time after which the next run is looked for.
+
+        Returns
+        -------
+        datetime :
+            The first minute after moment that matches the expression.
+        """
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)  # e.g. the 29th of February
+        while candidate < limit:
+            if candidate.month not in self.month:
+                candidate = (candidate.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+                continue
+            if not self.matches(candidate.replace(hour=min(self.hour), minute=min(self.minute))):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if candidate.hour not in self.hour:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+                continue
+            if candidate.minute in self.minute:
+                return candidate
+            candidate += timedelta(minutes=1)
+        raise ValueError(f"{self.expression} never matches")
+
+
+def load_jobs(path: str = None) -> list:
+    """
+    Load the jobs of the schedule.
+
+    Parameters
+    ----------
+    path : str
+        (optional) Path to the .toml file with the jobs, by default SCHEDULE_PATH.
+
+    Returns
+    -------
+    list :
+        A dict for every job, with its name, command, schedule (CronSchedule),
+        jitter and args.
+
+    Raises
+    ------
+    ValueError
+        If a job has an unknown command or a wrong cron expression.
+    """
+    with open(path or SCHEDULE_PATH, "rb") as schedule_file:
+        schedule = tomllib.load(schedule_file)
+
+    jobs = []
+    for job in schedule.get("job", []):
+        if job.get("command") not in COMMANDS:
+            raise ValueError(f"The command of the job {job.get('name')} must be one of {COMMANDS}")
+        jobs.append(
+            {
+                "name": job.get("name", job["command"]),
+                "command": job["command"],
+                "schedule": CronSchedule(job["cron"]),
+                "jitter": float(job.get("jitter", 0)),
+                "args": job.get("args", {}),
+            }
+        )
+    return jobs
+
+
+def command_line(command: str, args: dict) -> list:
+    """
+    Get the command line of a job, e.g. python vfood foods --delta.
+
+    Parameters
+    ----------
+    command : str
+        The command of the job, see COMMANDS.
+
+    args : dict
+        The args of the job: true booleans are flags, lists are given as several
+        values, e.g. {"delta": True, "stores": ["Gama", "Plazas"]}.
+
+    Returns
+    -------
+    list :
+        The arguments of the process.
+    """
+    argv = [sys.executable, VFOOD_DIR, command]
+    for name, value in args.items():
+        option = "--" + name.replace("_", "-")
+        if value is True:
+            argv.append(option)
+        elif isinstance(value, (list, tuple)):
+            argv += [option, *(str(item) for item in value)]
+        elif value is not False and value is not None:
+            argv += [option, str(value)]
+    return argv
+
+
+def run_command(command: str, args: dict):
+    """Run the job of a command (see COMMANDS) in its own process.
+
+    Raises
+    ------
+    subprocess.CalledProcessError
+        If the job fails.
+    """
+    subprocess.run(command_line(command, args), check=True)
+
+
+class Scheduler:
+    """Run the jobs at their times, each one in its own thread (that waits for its process).
+
+    Parameters
+    ----------
+    jobs : list
+        The jobs, see load_jobs.
+
+    runner : callable
+        Function that runs the command of a job with its args, by default
+        run_command.
+    """
+
+    def __init__(self, jobs: list, runner=run_command):
+        self.jobs = jobs
+        self.runner = runner
+        self._stop = threading.Event()
+        self._running = {}  # Job name: thread of its current run
+        self._lock = threading.Lock()
+
+    def _next_runs(self, now: datetime) -> dict:
+        """The next run of every job, with its jitter"""
+        return {
+            job["name"]: job["schedule"].next_after(now)
+            + timedelta(seconds=random.uniform(0, job["jitter"]))
+            for job in self.jobs
+        }
+
+    def run_job(self, job: dict) -> bool:
+        """
+        Start a run of a job in a thread, unless its last run is still running.
+
+        Returns
+        -------
+        bool :
+            True if the run was started.
+        """
+        with self._lock:
+            running = self._running.get(job["name"])
+            if running is not None and running.is_alive():
+                print(f"{datetime.now():%Y-%m-%d %H:%M} {job['name']} is still running, skipping this run")
+                return False
+            thread = threading.Thread(
+                target=self._run, args=(job,), name=f"vfood-{job['name']}", daemon=True
+            )
+            self._running[job["name"]] = thread
+            thread.start()
+            return True
+
+    def _run(self, job: dict):
+        print(f"{datetime.now():%Y-%m-%d %H:%M} Starting {job['name']}")
+        start = time.perf_counter()
+        try:
+            self.runner(job["command"], job["args"])
+        except Exception:
+            print(f"{job['name']} failed:")
+            traceback.print_exc()
+        print(f"{datetime.now():%Y-%m-%d %H:%M} {job['name']} finished in {time.perf_counter() - start:.0f}s")
+
+    def run_forever(self):
+        """Run the jobs until stop is called, then wait for the running ones."""
+        next_runs = self._next_runs(datetime.now())
+        for job in self.jobs:
+            print(f"{job['name']} ({job['schedule'].expression}) next run at {next_runs[job['name']]:%Y-%m-%d %H:%M:%S}")
+
+        while not self._stop.is_set():
+            now = datetime.now()
+            for job in self.jobs:
+                if next_runs[job["name"]] <= now:
+                    self.run_job(job)
+                    next_runs[job["name"]] = job["schedule"].next_after(now) + timedelta(
+                        seconds=random.uniform(0, job["jitter"])
+                    )
+            wait = (min(next_runs.values()) - datetime.now()).total_seconds()
+            self._stop.wait(min(max(wait, 0), 60))  # Wake up to notice clock changes
+
+        with self._lock:
+            running = [thread for thread in self._running.values() if thread.is_alive()]
+        for thread in running:
+            thread.join()
+
+    def stop(self):
+        """Stop scheduling runs, the running jobs finish."""
+        self._stop.set()
+
+
+def serve(path: str = None):
+    """
+    Run the jobs of the schedule until the process gets SIGINT or SIGTERM.
+
+    Parameters
+    ----------
+    path : str
+        (optional) Path to the .toml file with the jobs, by default SCHEDULE_PATH.
+    """
+    import signal
+
+    scheduler = Scheduler(load_jobs(path))
+
+    def stop(signum, frame):
+        print("Stopping the scheduler after the running jobs")
+        scheduler.stop()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    scheduler.run_forever()
@@ -9,214 +9,140 @@ This module is for scarping the DataFrom  the Websites of the SupperMarkets
 """
 
 # Web Scraping libraries
-from urllib.request import urlopen
-from bs4 import BeautifulSoup
-from urllib.error import HTTPError  # For error handling
-from urllib.error import URLError  # For error handling
+from parsers import select_attrs, select_rows, select_texts
 
 # Data manipulation libraries
 import pandas as pd
 
+import logging
 
-def collect_data_global(
-    url: str,
-    list_type: str,
-    list_class: str,
-    name_type: str,
-    name_class: str,
-    price_type: str,
-    price_class: str,
-) -> pd.DataFrame:
-    """
-    Collect product information on the website
+logger = logging.getLogger(__name__)  # The products of every page are logged at DEBUG level
 
-    Parameters
-    ----------
-    url : str
-        Url link of the website.
 
-    list_type : str
-        The html tag, of the parent element that list all the product information.
-
-    list_class : str
-        The name of the class that lists all the products.
+def clean_prices(prices: pd.Series, rules: dict, currency: str) -> pd.Series:
+    """
+    Clean the price texts of a store with its price cleaning rules.
 
-    name_type : str
-        Html tag name that has the name of the product.
+    Every rule is applied to the whole column at once with the pandas .str
+    methods, instead of calling a Python function for every price.
 
-    name_class : str
-        Html class name that has the name of the product.
+    Parameters
+    ----------
+    prices : pd.Series
+        The raw price texts of the pages.
 
-    price_type : str
-        Html tag name that has the price of the product.
+    rules : dict
+        The [store.price] rules of the store registry (after, remove, thousands,
+        decimal, token, and no_spaces).
 
-    price_class : str
-        Html class name that has the price of the product.
+    currency : str
+        The currency of the store, added at the beginning of the prices.
 
     Returns
-    ----------
-    df_data : pd.DataFrame
-        A DataFrame with the columns: product_name, product_price, and product_availability. If the search page result was no information, a empty Data Frame will be return.
-
+    -------
+    pd.Series :
+        The prices with the format "currency amount", e.g. "Bs. 1234.56".
     """
-
-    print("Trying url  : " + url)
-
-    # Create a empty Data Frame with the main columns
-    df_data = pd.DataFrame(
-        columns=["product_name", "product_price", "product_availability"]
-    )
-    # Check for HTTP and URL errors
-    try:
-        html = urlopen(url)  # Get the hmtl code
-    except HTTPError as e:
-        print(e)
-        return df_data
-    except URLError as e:
-        print("The server could not be found!")
-        return df_data
-    except Exception as e:
-        print(f"Something unexpected happen trying opening {url}")
-        print("The Exception raised was:")
-        print(e)
-        print(" None will be return")
-        return df_data
-    else:
-        print("Html Loaded successfully from " + url)
-        bs = BeautifulSoup(html.read(), "html.parser")
-
-        products_list = bs.find_all(
-            list_type, class_=list_class
-        )  # List of all the products in the url
-        products_information = []  # Products information list
-        for x, product_box in enumerate(products_list):
-            print(f"Product {x} of this page")
-            raw_text = product_box.find(name_type, class_=name_class)
-            raw_price = product_box.find(price_type, class_=price_class)
-            # If the price and text is found, ge the raw text
-            if raw_text != None and raw_price != None:
-                product_name = raw_text.get_text()  # Gets  the product Name
-
-                product_price = raw_price.get_text()  # Gets the product price tag text
-
-                availability = (
-                    True  # For pages where availability does not have a marker
-                )
-
-                products_information.append(
-                    [product_name, product_price, availability]
-                )  # Adds info to the products list
-
-        print(f"All available data from {url} collected")
-
-        # If information was collected make it presentable, else pass a empty DataFrame.
-        if len(products_information) > 0:
-            print(f"{len(products_information)} products collected from {url} ")
-            df_data = pd.DataFrame(
-                products_information,
-                columns=["product_name", "product_price", "product_availability"],
-            )  # Convert data to DataFrame format
-            return df_data
-        else:
-            print(f"0 Products where safe from {url}")
-            return df_data
-
-
-def gama_get_products(bs) -> list:
+    prices = prices.astype("string")
+    if rules.get("after"):
+        # Keep the text after the marker, only where the marker is present
+        prices = prices.str.split(rules["after"], regex=False).str[1].fillna(prices)
+    for text in rules.get("remove", []):
+        prices = prices.str.replace(text, "", regex=False)
+    if rules.get("thousands"):
+        prices = prices.str.replace(rules["thousands"], "", regex=False)
+    if rules.get("decimal"):
+        prices = prices.str.replace(rules["decimal"], ".", regex=False)
+    prices = prices.str.strip()
+    if "token" in rules:
+        # Keep the token, only where the price has white spaces
+        prices = prices.str.split(" ", regex=False).str[rules["token"]].fillna(prices)
+    if rules.get("no_spaces"):
+        prices = prices.str.replace(r"\s", "", regex=True)
+
+    return (currency + " " + prices).astype(object)  # Use the corresponding currency
+
+
+def get_store_products(doc, store: dict) -> list:
     """
-    Get all the product listed in the Gama supermarket page result
+    Get all the products listed in a page result of a store.
 
     Parameters
     ----------
-    bs : BeautifulSoup
-        Gama supermarket website result page
+    doc : BeautifulSoup or HTMLParser
+        The page result, parsed with parsers.parse_html.
+
+    store : dict
+        The configuration of the store, from stores.load_stores.
 
     Returns
     -------
-    list : list
-        A list with columns for the product name, its price, and availability at the moment of the search, for all the product in the page pass
+    list :
+        A list with the product name, the raw price text, and availability of every product in the
+        page. The names and prices are cleaned for the whole search with clean_prices.
     """
-    currency = "$"  # The currency use in the Web Page
+    fields = {"name": store["product_name"], "price": store["product_price"]}
+    if store["product_availability"]:
+        fields["availability"] = store["product_availability"]
 
-    products_list = bs.find_all(
-        "li", class_="product__list--item"
-    )  # This class is the one that will let us search if element list
     products_information = []  # List to save all the products information
-    for product_box in products_list:
-        product_name = product_box.find(
-            "a", class_="product__list--name"
-        ).get_text()  # Gets  the product Name
-
-        product_price = product_box.find(
-            "div", class_="from-price-value"
-        ).get_text()  # Gets the product price tag text
-        product_price = (
-            product_price.replace("Total Ref. ", "").replace(".", "").replace(",", ".")
-        )  # Clean price Tag text
-        product_price = currency + " " + product_price  # Use the correponing currency
-
-        # Try to find if the button used is the one that shows availability and update the variable
-        availability_button = product_box.find(
-            "button",
-            class_="btn btn-primary btn-block glyphicon glyphicon-shopping-cart js-enable-btn ec-add-cart-btn",
-        )
-        if availability_button != None:
-            availability = True
-        else:
-            availability = False
+    for x, product_box in enumerate(select_rows(doc, store["item"], fields)):
+        logger.debug("Product %d of this page", x)
+        # If the price and text is found, keep the product
+        if product_box["name"] == None or product_box["price"] == None:
+            continue
 
-        products_information.append(
-            [product_name, product_price, availability]
-        )  # Safe product information in main list
+        # Stores without an availability marker only list available products
+        availability = product_box.get("availability", "") != None
 
-        # print(product_name + " : " +product_price +" Availability: " + str(availability))
+        products_information.append(
+            [product_box["name"], product_box["price"], availability]
+        )
 
+    print(f"{len(products_information)} products collected from the page")
     return products_information
 
 
-def central_m_get_product(url) -> pd.DataFrame:
+def get_page_links(doc, store: dict, url: str) -> list:
     """
-    Get all the products listed in the Central Madeirense supermarket page result
+    Get the links of the other result pages of a search, following the
+    pagination strategy of the store.
 
     Parameters
     ----------
+    doc : BeautifulSoup or HTMLParser
+        The first page result, parsed with parsers.parse_html.
+
+    store : dict
+        The configuration of the store, from stores.load_stores.
+
     url : str
-        The url of central Madeirense supermarket page result
+        The url of the first page result.
 
     Returns
     -------
-    page_data
-        A Pandas DataFrame with the following columns product_name,	product_price, product_availability, date, store, and	search_term
-
+    list :
+        The url of every result page after the first one.
     """
+    link_list = []
+    if store["pagination"] == "links":
+        # Follow every link of the pagination that was not already open
+        for page_ref in select_attrs(doc, store["pagination_selector"], "href"):
+            page_url = store.get("pagination_base", "") + page_ref
+            if page_url != url and page_url not in link_list:
+                link_list.append(page_url)
+
+    elif store["pagination"] == "numbered":
+        # The link before "next" has the number of result pages
+        page_numbers = select_texts(doc, store["pagination_selector"])
+        if len(page_numbers) > 1:
+            num_pages = int(page_numbers[-2])
+            first_link = select_attrs(doc, store["pagination_selector"], "href")[0]
+            for num in range(2, num_pages + 1):
+                link_list.append(
+                    first_link.replace(
+                        store["page_pattern"], store["page_format"].format(page=num)
+                    )
+                )
 
-    page_data = collect_data_global(
-        url, "div", "product-inner", "div", "description", "span", "price"
-    )  # Get raw data
-
-    # If the DataFrame is not empty, clean the price and name of the product
-    if not page_data.empty:
-        print("Cleaning Data from Central Madeirense")
-        page_data["product_name"] = page_data[
-            "product_name"
-        ].str.strip()  # Cleans the name
-
-        def price_clean(price_text):
-            """Function to clean price text of Central Madeirense supermarket web page"""
-            price_text = (
-                price_text.replace("\xa0", "")
-                .replace(".", "")
-                .replace(",", ".")
-                .replace("#", "")
-                .strip()
-            )
-            if " " in price_text:
-                price_text = price_text.split(" ")[1]
-            price_text = "$ " + price_text
-            return price_text
-
-        page_data["product_price"] = page_data["product_price"].apply(
-            price_clean
-        )  # Cleans the price
-
-    return page_data
+    return link_list
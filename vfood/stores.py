@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Registry of the supermarkets to scrape.
+
+Each store is declared in ref_table/stores.toml (search url, CSS selectors,
+pagination strategy, currency, price cleaning rules and rate limits), so a store
+can be added, changed or left out of a run without touching the code.
+"""
+
+import os
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    import tomli as tomllib
+
+
+STORES_PATH = os.getenv(
+    "VFOOD_STORES",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ref_table", "stores.toml"),
+)
+
+PAGINATIONS = ("none", "links", "numbered")
+REQUIRED_KEYS = ("name", "search_url", "item", "product_name", "product_price", "currency")
+
+# Values used when the store does not declare them
+STORE_DEFAULTS = {
+    "space": "+",
+    "product_availability": None,
+    "parse_only": None,
+    "pagination": "none",
+    "max_workers": 1,
+    "min_interval": 3.0,
+    "price": {},
+}
+
+
+def load_stores(path: str = None, names: list = None) -> dict:
+    """Load the store registry.
+
+    Parameters
+    ----------
+    path : str
+        (optional) Path to the .toml file with the stores, by default STORES_PATH.
+
+    names : list
+        (optional) Names of the stores to keep, by default all of them.
+
+    Returns
+    -------
+    dict :
+        The name of the store as key and its configuration as value, in the order
+        of the file.
+
+    Raises
+    ------
+    ValueError
+        If a store misses a required key, has an unknown pagination strategy, or
+        one of names is not in the registry.
+    """
+    with open(path or STORES_PATH, "rb") as stores_file:
+        registry = tomllib.load(stores_file)
+
+    stores = {}
+    for store in registry.get("store", []):
+        missing = [key for key in REQUIRED_KEYS if key not in store]
+        if len(missing) > 0:
+            raise ValueError(f"Store {store.get('name')} misses the keys {missing}")
+        if store.get("pagination", "none") not in PAGINATIONS:
+            raise ValueError(
+                f"The pagination of {store['name']} must be one of {PAGINATIONS}"
+            )
+        stores[store["name"]] = {**STORE_DEFAULTS, **store}
+
+    if names is not None:
+        unknown = [name for name in names if name not in stores]
+        if len(unknown) > 0:
+            raise ValueError(f"The stores {unknown} are not in the registry")
+        stores = {name: stores[name] for name in stores if name in names}
+
+    return stores
+
+
+def store_limits(stores: dict) -> dict:
+    """Get the concurrency cap and rate limit of every store.
+
+    Parameters
+    ----------
+    stores : dict
+        The stores, as returned by load_stores.
+
+    Returns
+    -------
+    dict :
+        The name of the store as key and a dict with max_workers and min_interval
+        as value.
+    """
+    return {
+        name: {"max_workers": store["max_workers"], "min_interval": store["min_interval"]}
+        for name, store in stores.items()
+    }
@@ -1,17 +1,22 @@
 # python packages
-from sqlalchemy import create_engine
 import pandas as pd
 import os
+import math
 from dotenv import load_dotenv
 # local modules
-import data 
+#The scraping modules (update_foods) and tweepy (update_exchange) are imported by the job that uses them
 import message
-from exchange_tw import exchange_from_tw_user
+from loader import db_url, get_engine, load_dataframe, upsert_dataframe
 
+# Natural key of the rows of the food table
+FOOD_KEY = ["name","store_name","date_scrapt","search_term"]
 
-def update_a_db(data:pd.DataFrame,user:str,password:str,host:str,port:str,db_name:str,table_name:str):
+
+def update_a_db(data:pd.DataFrame,user:str,password:str,host:str,port:str,db_name:str,table_name:str,keys:list=None):
     """Update a Postgresql table with the input data and the given credentials.
 
+    The rows are streamed with COPY FROM STDIN, see loader.load_dataframe.
+
     Parameters
     ----------
     data : pd.DataFrame
@@ -27,10 +32,17 @@ def update_a_db(data:pd.DataFrame,user:str,password:str,host:str,port:str,db_nam
         The name of the Data Base where the table you want to update is.
     table_name : str
         The name of the Table that you want to update. 
+    keys : list
+        (optional) The columns of the natural key of the table. If given, the rows are upserted
+        (see loader.upsert_dataframe) instead of appended, so loading the same rows twice does not
+        duplicate them.
     """
 
-    engine = create_engine(f'postgresql://{user}:{password}@{host}:{port}/{db_name}')
-    data.to_sql(table_name,con=engine,if_exists='append',index=False)
+    engine = get_engine(db_url(user,password,host,port,db_name)) #Pooled engine, reused by the process
+    if keys is None:
+        load_dataframe(data,table_name,engine) #Bulk load with COPY
+    else:
+        upsert_dataframe(data,table_name,engine,keys) #Stage and merge on the natural key
 
 def prepare_food_data(scrapt_food_data:pd.DataFrame)->pd.DataFrame:
     """Prepare the food price data to fit with the database table schema.
@@ -45,10 +57,12 @@ def prepare_food_data(scrapt_food_data:pd.DataFrame)->pd.DataFrame:
     pd.DataFrame
 	    Data ready to be appended to the database table
     """
+    import data
     
     scrapt_food_data = scrapt_food_data.rename(columns={'product_name':"name","product_price":"price_label","product_availability":"availability"\
                             ,"date":"date_scrapt","store":"store_name","product_price_dollar":"price_dollar"})
-    scrapt_food_data['date_scrapt'] = pd.to_datetime(scrapt_food_data['date_scrapt'])
+    scrapt_food_data['date_scrapt'] = data.parse_dates(scrapt_food_data['date_scrapt'])
+    scrapt_food_data['price_dollar'] = scrapt_food_data['price_dollar'].astype('float64').round(2) #The compact frames keep it as float32
     #print("Shape of table " +str(scrapt_food_data.shape))
     #print(scrapt_food_data.head())
     return scrapt_food_data
@@ -128,8 +142,24 @@ def log_food(food_list:str,file:str):
     with open(file,'a') as log_file:
         log_file.write(food_list+"\n")
 
-def update_exchange():
-    """Updates de Table for the Exchange Rate"""
+def update_exchange(sources:list=None)->dict:
+    """Updates de Table for the Exchange Rate
+
+    The sources are fetched at the same time (see exchange.fetch_rates) and every rate is loaded to the table
+    as soon as it arrives, so a slow Twitter API does not delay the BCV row.
+
+    Parameters
+    ----------
+    sources : list
+        (optional) The sources of the rates (see exchange.ExchangeSource), by default the BCV and the
+        monitordolarvla tweets.
+
+    Returns
+    -------
+    dict :
+        The rates aggregated in one record, see exchange.aggregate_rates.
+    """
+    from exchange import aggregate_rates, default_sources, fetch_rates
 
     #Get DataBase credentials from a .env
     load_dotenv()
@@ -142,27 +172,57 @@ def update_exchange():
     db_name = "price_scrapt"
     table_name = "exchange"
 
-    #Get raw data from the bcv and preparing it for the Database
-    rate_bcv_r =data.bcv_exchange_rate()
-    rate_bcv = prepare_bcv_data(rate_bcv_r)
-    print(rate_bcv)
-
-    #Get raw data from the Twitter and preparing it for the Database
-    rate_tw_r = exchange_from_tw_user("monitordolarvla")
-    rate_tw = prepare_tw_data(rate_tw_r)
-    print(rate_tw)
-
-    # Update food Table in the DataBase
-    update_a_db(pd.concat([rate_bcv,rate_tw]),USER,PASSWORD,HOST,PORT,db_name,table_name)
+    #Prepare every rate for the Database and load it as soon as its source answers
+    loaded = []
+    def load_rate(rate:dict):
+        if math.isnan(rate['exchange_rate']):
+            print(f"No exchange rate from {rate['source']}, it is not loaded")
+            return
+        rate_row = dict(rate) #prepare_bcv_data puts the values in lists, as create_message_exchange expects
+        rate_data = prepare_bcv_data(rate_row)
+        print(rate_data)
+        update_a_db(rate_data,USER,PASSWORD,HOST,PORT,db_name,table_name)
+        loaded.append(rate_row)
+
+    rates = fetch_rates(sources or default_sources(),on_result=load_rate)
+    summary = aggregate_rates(rates)
+    print(summary)
 
     #Send a message informing the end of the Scraping
-    exchange_rate_msm =message.create_message_exchange([rate_bcv_r,rate_tw_r])
+    if len(loaded)==0:
+        print("No exchange rate could be fetched")
+        return summary
+    exchange_rate_msm =message.create_message_exchange(loaded)
+    if summary['sources']>1:
+        exchange_rate_msm += f"\n\t•Median *{summary['median']:.2f}* Bs/$, spread *{summary['spread']:.2f}* Bs/$ ({summary['spread_pct']:.1f}%) between {summary['sources']} sources"
 
     print(exchange_rate_msm)
     message.telegram_message(exchange_rate_msm,)
+    return summary
 
-def update_foods():
-    """Scrape the list of foods and update the table in the DataBase."""
+def update_foods(resume:bool=False,delta:bool=False,stores:list=None):
+    """Scrape the list of foods and update the table in the DataBase.
+
+    Every page scraped is recorded in the journal of the day (see checkpoint.RunJournal).
+
+    Parameters
+    ----------
+    resume : bool
+        True to resume the run of the day that died partway: the pages already scraped are
+        read from the journal and only the missing ones are scraped.
+
+    delta : bool
+        True to load only the new, changed and vanished products to the food_delta table (plus a
+        heartbeat per store in food_runs) instead of the full snapshot to the food table. See delta.py.
+
+    stores : list
+        (optional) Names of the stores to scrape, by default all the stores of the registry.
+    """
+    import data
+    from checkpoint import RunJournal
+    from identity import ProductIndex
+    from metrics import METRICS
+    from pipeline import ArchiveSink, CSVSink, DBSink, DeltaSink, run_pipeline
 
     cwd = os.getcwd()
     
@@ -170,12 +230,8 @@ def update_foods():
     food_list_path = os.path.join(cwd,'ref_table','foods.csv')
     food_list = get_list_foods(food_list_path)
 
-    #Scrap the list of foods
-    scrap_data = data.scrape_prep_data(food_list)
-    scrap_data.to_csv("test_data.csv")
-
-    #Prepare the scrap data for the DataBase Table
-    scrap_data = prepare_food_data(scrap_data)
+    #Get the exchange rate once, every step of the run uses the same rate
+    bcv_rate = data.get_exchange_rate(fallback=True)
 
     #Get DataBase credentials from a .env
     load_dotenv()
@@ -188,16 +244,32 @@ def update_foods():
     db_name = "price_scrapt"
     table_name = "food"
 
-    # Update food Table in the DataBase
-    update_a_db(scrap_data,USER,PASSWORD,HOST,PORT,db_name,table_name)
+    #Scrap the list of foods, writing every page to the csv, the Parquet archive, and the food Table
+    #in chunks (rerunning the same day does not duplicate rows)
+    engine = get_engine(db_url(USER,PASSWORD,HOST,PORT,db_name))
+    journal = RunJournal(resume=resume)
+    if resume:
+        print(f"Resuming the run, {len(journal)} pages already scraped")
+    if delta:
+        db_sink = DeltaSink(engine,transform=prepare_food_data) #Only the changes since the last run
+    else:
+        db_sink = DBSink(engine,table_name,FOOD_KEY,transform=prepare_food_data)
+    with CSVSink("test_data.csv") as csv_sink, ArchiveSink() as archive_sink, db_sink:
+        #Every product gets a product_id, the same for the names of the same product in every store (see identity.py)
+        run_pipeline(food_list,[csv_sink,archive_sink,db_sink],bcv_rate['exchange_rate'],stores=stores,journal=journal,
+                     product_index=ProductIndex())
+
+    #Save the timings and counters of the run (JSON report and Prometheus textfile, see metrics.py)
+    report_path,prometheus_path = METRICS.save()
+    print(f"Run metrics saved to {report_path} and {prometheus_path}")
 
     #Log the foods that where scrap
     log_file = os.path.join(cwd,'batch.log')
     log_food(str(food_list),log_file)
 
     #Send a message informing the end of the Scrape
-    exchange_rate = data.bcv_exchange_rate()['exchange_rate']
-    source = data.bcv_exchange_rate()['source']
+    exchange_rate = bcv_rate['exchange_rate']
+    source = bcv_rate['source']
     exchange_rate_msm = f"The exchange rate is *{exchange_rate}* Bs./$ according  to the *{source}*"
     message_txt = message.create_message_food   (food_list,exchange_rate_msm)
     print(message_txt)